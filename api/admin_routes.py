@@ -13,6 +13,9 @@ try:
         get_conversion_rate, get_top_products, get_funnel_analysis,
         get_dashboard_summary
     )
+    from . import metrics
+    from .circuit_breaker import health_report
+    from .gemini_pool import utilisation_report
 except ImportError:
     from database import get_session, get_user_stats
     from models import User, Analytics, ProductView
@@ -20,6 +23,9 @@ except ImportError:
         get_conversion_rate, get_top_products, get_funnel_analysis,
         get_dashboard_summary
     )
+    import metrics
+    from circuit_breaker import health_report
+    from gemini_pool import utilisation_report
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -221,19 +227,39 @@ def get_events():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Get in-process runtime metrics (queues, latencies, counters) and Gemini key quota use"""
+    if not verify_admin_key(request):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({
+            'success': True,
+            'data': metrics.snapshot(),
+            'gemini_keys': utilisation_report()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @admin_bp.route('/health', methods=['GET'])
 def health():
-    """Health check"""
+    """Health check (database, circuit breaker and load-shedding state of dependencies)"""
     try:
         session = get_session()
         user_count = session.query(User).count()
         session.close()
         
+        dependencies = health_report()
+        degraded = any(dep.get('breaker', {}).get('state') != 'closed' for dep in dependencies.values())
+        
         return jsonify({
-            'status': 'healthy',
+            'status': 'degraded' if degraded else 'healthy',
             'timestamp': datetime.utcnow().isoformat(),
             'database_connected': True,
-            'total_users': user_count
+            'total_users': user_count,
+            'dependencies': dependencies
         })
     except Exception as e:
         print(f"Health check error: {e}", file=sys.stderr)
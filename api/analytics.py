@@ -6,10 +6,10 @@ import sys
 from datetime import datetime, timedelta
 
 try:
-    from .database import get_session, track_analytics, track_product_view
+    from .database import get_session, execute_write, track_analytics, track_product_view
     from .models import Analytics, User, ProductView, Conversation
 except ImportError:
-    from database import get_session, track_analytics, track_product_view
+    from database import get_session, execute_write, track_analytics, track_product_view
     from models import Analytics, User, ProductView, Conversation
 
 # Analytics event types
@@ -54,16 +54,14 @@ def log_user_message(user_id: int, product: str = None, emotion: str = None):
         )
         
         # Update user total messages
-        session = get_session()
-        try:
+        def update_user(session):
             user = session.query(User).filter(User.user_id == user_id).first()
             if user:
                 user.total_messages += 1
                 if product:
                     user.last_viewed_product = product
-                session.commit()
-        finally:
-            session.close()
+        
+        execute_write(update_user)
             
     except Exception as e:
         print(f"Analytics error (log_user_message): {e}", file=sys.stderr)
@@ -147,15 +145,13 @@ def log_purchase(user_id: int, product: str, price: float):
         )
         
         # Update user purchase stats
-        session = get_session()
-        try:
+        def update_user(session):
             user = session.query(User).filter(User.user_id == user_id).first()
             if user:
                 user.total_purchases += 1
                 user.total_spent += price
-                session.commit()
-        finally:
-            session.close()
+        
+        execute_write(update_user)
             
     except Exception as e:
         print(f"Analytics error (log_purchase): {e}", file=sys.stderr)
@@ -0,0 +1,237 @@
+"""
+Broadcast Module
+Resumable bulk messaging (promotions, abandoned-cart nudges) to the users table
+
+Usage:
+    python api/broadcast.py create "New arrivals are in! 🎉" --audience all
+    python api/broadcast.py run 1
+    python api/broadcast.py status 1
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    from . import metrics
+    from .database import get_session
+    from .models import BroadcastJob, CartItem, User
+    from .telegram_handler import send_message, BULK
+except ImportError:
+    import metrics
+    from database import get_session
+    from models import BroadcastJob, CartItem, User
+    from telegram_handler import send_message, BULK
+
+# Recipients fetched (and checkpointed) per page
+BROADCAST_PAGE_SIZE = int(os.getenv('BROADCAST_PAGE_SIZE', '500'))
+
+# Sends kept in flight; the outbound scheduler enforces Telegram's rate limits
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '32'))
+
+AUDIENCES = ('all', 'abandoned_cart')
+
+
+def create_broadcast(text: str, audience: str = 'all', name: str = None) -> int:
+    """
+    Create a broadcast job
+
+    Args:
+        text: Message text (Markdown)
+        audience: 'all' active users or 'abandoned_cart' (users with items in their cart)
+        name: Optional label
+
+    Returns:
+        job_id of the new job
+    """
+    if audience not in AUDIENCES:
+        raise ValueError(f"Unknown audience '{audience}' (expected one of {', '.join(AUDIENCES)})")
+
+    session = get_session()
+    try:
+        job = BroadcastJob(name=name, text=text, audience=audience, last_user_id=0)
+        session.add(job)
+        session.commit()
+        return job.job_id
+    finally:
+        session.close()
+
+
+def get_broadcast_status(job_id: int) -> dict:
+    """
+    Get progress of a broadcast job
+
+    Args:
+        job_id: Broadcast job ID
+
+    Returns:
+        Dictionary with status and counters, or None if the job doesn't exist
+    """
+    session = get_session()
+    try:
+        job = session.query(BroadcastJob).filter(BroadcastJob.job_id == job_id).first()
+        if not job:
+            return None
+        return {
+            'job_id': job.job_id,
+            'name': job.name,
+            'audience': job.audience,
+            'status': job.status,
+            'last_user_id': job.last_user_id,
+            'sent': job.sent_count,
+            'failed': job.failed_count,
+            'blocked': job.blocked_count,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'completed_at': job.completed_at.isoformat() if job.completed_at else None
+        }
+    finally:
+        session.close()
+
+
+def _next_recipients(session, audience: str, after_user_id: int, limit: int) -> list:
+    """Keyset page of recipient user_ids greater than after_user_id"""
+    query = session.query(User.user_id)\
+        .filter(User.user_id > after_user_id, User.is_active == True)
+
+    if audience == 'abandoned_cart':
+        has_cart = session.query(CartItem.cart_item_id)\
+            .filter(CartItem.user_id == User.user_id)\
+            .exists()
+        query = query.filter(has_cart)
+
+    rows = query.order_by(User.user_id).limit(limit).all()
+    return [row.user_id for row in rows]
+
+
+def _send_one(user_id: int, text: str) -> str:
+    """Send the broadcast to one user and classify the outcome"""
+    result = send_message(user_id, text, priority=BULK)
+    if result and result.get('ok'):
+        return 'sent'
+    if result and result.get('error_code') == 403:
+        return 'blocked'
+    return 'failed'
+
+
+def run_broadcast(job_id: int, page_size: int = BROADCAST_PAGE_SIZE, concurrency: int = BROADCAST_CONCURRENCY,
+                  max_pages: int = None) -> dict:
+    """
+    Run (or resume) a broadcast job from its checkpoint
+
+    Recipients are read in user_id order one page at a time; after each page
+    the checkpoint and counters are committed, so a crashed run resumes with
+    the first unfinished page (users of that page may receive the message twice).
+    Users who blocked the bot are marked inactive.
+
+    Args:
+        job_id: Broadcast job ID
+        page_size: Recipients per page
+        concurrency: Sends kept in flight
+        max_pages: Stop after this many pages (job stays resumable)
+
+    Returns:
+        Summary with counters and throughput
+    """
+    session = get_session()
+    try:
+        job = session.query(BroadcastJob).filter(BroadcastJob.job_id == job_id).first()
+        if not job:
+            raise ValueError(f"Broadcast job {job_id} not found")
+        if job.status == 'completed':
+            print(f"⚠️ Broadcast {job_id} already completed", file=sys.stderr)
+            return get_broadcast_status(job_id)
+
+        job.status = 'running'
+        session.commit()
+        print(f"📣 Broadcast {job_id} ({job.audience}) starting after user {job.last_user_id}", file=sys.stderr)
+
+        started = time.perf_counter()
+        processed = 0
+        pages = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='broadcast') as executor:
+            while True:
+                recipients = _next_recipients(session, job.audience, job.last_user_id or 0, page_size)
+                if not recipients:
+                    job.status = 'completed'
+                    job.completed_at = datetime.utcnow()
+                    session.commit()
+                    break
+
+                text = job.text
+                outcomes = list(executor.map(lambda user_id: _send_one(user_id, text), recipients))
+
+                blocked = [user_id for user_id, outcome in zip(recipients, outcomes) if outcome == 'blocked']
+                if blocked:
+                    session.query(User)\
+                        .filter(User.user_id.in_(blocked))\
+                        .update({'is_active': False}, synchronize_session=False)
+
+                # Checkpoint the page together with its counters
+                job.last_user_id = recipients[-1]
+                job.sent_count += outcomes.count('sent')
+                job.failed_count += outcomes.count('failed')
+                job.blocked_count += len(blocked)
+                session.commit()
+
+                processed += len(recipients)
+                pages += 1
+                metrics.incr('broadcast.sent', outcomes.count('sent'))
+                metrics.incr('broadcast.failed', outcomes.count('failed'))
+                metrics.incr('broadcast.blocked', len(blocked))
+
+                elapsed = time.perf_counter() - started
+                print(f"📊 Broadcast {job_id}: {processed} processed, {job.sent_count} sent, "
+                      f"{job.failed_count} failed, {job.blocked_count} blocked, "
+                      f"{processed / elapsed:.1f} msg/s", file=sys.stderr)
+
+                if max_pages and pages >= max_pages:
+                    break
+
+        elapsed = time.perf_counter() - started
+        summary = get_broadcast_status(job_id)
+        summary['processed_this_run'] = processed
+        summary['elapsed_s'] = round(elapsed, 3)
+        summary['messages_per_s'] = round(processed / elapsed, 1) if elapsed else 0.0
+        return summary
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Broadcast {job_id} error: {e}", file=sys.stderr)
+        raise
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description='Bulk broadcast to bot users')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = subparsers.add_parser('create', help='Create a broadcast job')
+    create_parser.add_argument('text', help='Message text (Markdown)')
+    create_parser.add_argument('--audience', choices=AUDIENCES, default='all')
+    create_parser.add_argument('--name', default=None)
+
+    run_parser = subparsers.add_parser('run', help='Run or resume a broadcast job')
+    run_parser.add_argument('job_id', type=int)
+    run_parser.add_argument('--page-size', type=int, default=BROADCAST_PAGE_SIZE)
+    run_parser.add_argument('--concurrency', type=int, default=BROADCAST_CONCURRENCY)
+
+    status_parser = subparsers.add_parser('status', help='Show broadcast progress')
+    status_parser.add_argument('job_id', type=int)
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.command == 'create':
+        job_id = create_broadcast(args.text, audience=args.audience, name=args.name)
+        print(f"✅ Created broadcast job {job_id}")
+    elif args.command == 'run':
+        print(f"✅ {run_broadcast(args.job_id, page_size=args.page_size, concurrency=args.concurrency)}")
+    elif args.command == 'status':
+        print(get_broadcast_status(args.job_id))
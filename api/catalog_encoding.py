@@ -0,0 +1,149 @@
+"""
+Catalog Encoding Module
+Compiles the Python catalog (prices and specs) into a compact one-line-per-SKU
+table for prompts, cached by a hash of the catalog
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    from . import metrics
+    from .product_data import PRODUCT_PRICES, PRODUCT_SPECS
+    from .prompt_loader import PRODUCTS_LIST, estimate_tokens
+except ImportError:
+    import metrics
+    from product_data import PRODUCT_PRICES, PRODUCT_SPECS
+    from prompt_loader import PRODUCTS_LIST, estimate_tokens
+
+# 'text' = hand-written prompts/products.txt, 'compiled' = table built from product_data
+PROMPT_CATALOG_FORMAT = os.getenv('PROMPT_CATALOG_FORMAT', 'text').lower()
+
+# Output of the build step (python compile_catalog.py); rebuilt in memory when stale
+COMPILED_CATALOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'prompts', 'products_compiled.txt')
+
+_HEADER = "Products (name|price|specs):"
+_HASH_LINE = "# catalog sha256:"
+
+# Rewrites that drop tokens without dropping facts, applied in order
+_COMPACTIONS = [
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\b(?:a|an|the|all your|your)\s+", re.IGNORECASE), ""),
+    (re.compile(r"(\d+)-hour\b"), r"\1h"),
+    (re.compile(r"(\d+)-day\b"), r"\1d"),
+    (re.compile(r"(\d+)-inch\b"), r'\1"'),
+    (re.compile(r",?\s+and\s+"), ", "),
+    (re.compile(r"\s+with\s+"), "; "),
+    (re.compile(r"[.!]+$"), ""),
+]
+
+# Compiled tables by catalog hash (only the current catalog's is kept)
+_compiled = {}
+
+
+def compact_spec(spec: str) -> str:
+    """Shorten a spec sentence to comma-separated facts ("Tracks steps, sleep, heart rate; OLED display")"""
+    spec = spec.strip()
+    for pattern, replacement in _COMPACTIONS:
+        spec = pattern.sub(replacement, spec)
+    return spec.replace('|', '/').strip(' ;,')
+
+
+def encode_catalog(prices: dict, specs: dict, names=None) -> str:
+    """
+    Encode products as a header line plus one "name|$price|specs" row each
+
+    Args:
+        prices: Product name -> price
+        specs: Product name -> spec sentence
+        names: Products to include, in order (defaults to the whole catalog)
+
+    Returns:
+        Table text
+    """
+    rows = [_HEADER]
+    for name in (prices if names is None else names):
+        rows.append(f"{name}|${prices[name]}|{compact_spec(specs.get(name, ''))}")
+    return "\n".join(rows)
+
+
+def catalog_hash(prices: dict, specs: dict) -> str:
+    """Stable hash of the catalog contents (changes when any name, price or spec does)"""
+    payload = json.dumps([[name, prices[name], specs.get(name, '')] for name in prices],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _read_compiled(digest, path=None):
+    """Table from the build step's file if it was compiled from this exact catalog"""
+    try:
+        with open(path or COMPILED_CATALOG_PATH, 'r', encoding='utf-8') as f:
+            first, _, table = f.read().partition("\n")
+    except OSError:
+        return None
+    return table.strip() if first.strip() == f"{_HASH_LINE}{digest}" else None
+
+
+def get_compiled_catalog() -> str:
+    """
+    Get the compact catalog table for the current product data
+
+    Uses the build step's output when its hash matches the catalog, otherwise
+    compiles in memory (the file is not written at runtime - serverless file
+    systems are read-only). Either way the result is cached by catalog hash.
+    """
+    digest = catalog_hash(PRODUCT_PRICES, PRODUCT_SPECS)
+    table = _compiled.get(digest)
+    if table is None:
+        table = _read_compiled(digest)
+        if table is None:
+            table = encode_catalog(PRODUCT_PRICES, PRODUCT_SPECS)
+            print("Compiled catalog is stale or missing - compiled in memory "
+                  "(run python compile_catalog.py)", file=sys.stderr)
+        _compiled.clear()
+        _compiled[digest] = table
+        metrics.set_gauge('prompt.catalog_tokens', estimate_tokens(table))
+    return table
+
+
+def token_report() -> dict:
+    """
+    Catalog tokens per call: hand-written products.txt versus the compiled table
+
+    Returns:
+        Dict with the product count, catalog hash, both token counts and the saving
+    """
+    compiled = encode_catalog(PRODUCT_PRICES, PRODUCT_SPECS)
+    before, after = estimate_tokens(PRODUCTS_LIST), estimate_tokens(compiled)
+    return {
+        'products': len(PRODUCT_PRICES),
+        'hash': catalog_hash(PRODUCT_PRICES, PRODUCT_SPECS),
+        'text_tokens': before,
+        'compiled_tokens': after,
+        'saved_tokens': before - after,
+        'saved_percent': round(100 * (before - after) / before, 1) if before else 0.0
+    }
+
+
+def compile_catalog(path: str = None) -> dict:
+    """
+    Build step: write the compiled table, stamped with the catalog hash
+
+    Args:
+        path: Output file (defaults to COMPILED_CATALOG_PATH)
+
+    Returns:
+        token_report() for the written catalog
+    """
+    report = token_report()
+    with open(path or COMPILED_CATALOG_PATH, 'w', encoding='utf-8') as f:
+        f.write(f"{_HASH_LINE}{report['hash']}\n{encode_catalog(PRODUCT_PRICES, PRODUCT_SPECS)}\n")
+    _compiled.clear()
+    return report
+
+
+def is_current(path: str = None) -> bool:
+    """True if the compiled file was built from the current catalog"""
+    return _read_compiled(catalog_hash(PRODUCT_PRICES, PRODUCT_SPECS), path) is not None
@@ -0,0 +1,220 @@
+"""
+Circuit Breaker Module
+Stops calling a failing or slow dependency (Gemini) for a while and sheds
+calls beyond an adaptive in-flight limit, so updates fall back immediately
+"""
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Breakers and limiters by name, for the health endpoint
+_breakers = {}
+_limiters = {}
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker over a sliding window of recent calls
+
+    Opens when the error rate or the slow-call rate over the last `window`
+    calls passes its threshold. After `open_seconds` one probe call is let
+    through (half-open): success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_ms: float = 4000, slow_rate: float = 0.5, open_seconds: float = 30):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_rate_threshold = slow_rate
+        self.open_seconds = open_seconds
+        self._calls = deque(maxlen=window)  # (failed, slow) per call
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._transitions = deque(maxlen=10)
+        _breakers[name] = self
+        metrics.register_gauge(f'{name}.breaker_state', lambda: _STATE_VALUES[self.state])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _transition(self, state: str, reason: str):
+        """Change state (caller holds the lock)"""
+        if state == self._state:
+            return
+        previous, self._state = self._state, state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._calls.clear()
+        self._transitions.append({'from': previous, 'to': state, 'reason': reason,
+                                  'at': datetime.utcnow().isoformat()})
+        metrics.incr(f'{self.name}.breaker_{state}')
+        print(f"{'✅' if state == CLOSED else '⚠️'} {self.name} circuit {previous} -> {state} ({reason})", file=sys.stderr)
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go out now
+
+        Returns:
+            True if the call may proceed (its outcome must then be passed to record())
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, 'cool-down elapsed')
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        metrics.incr(f'{self.name}.breaker_rejected')
+        return False
+
+    def record(self, success: bool, latency_ms: float):
+        """
+        Record the outcome of an allowed call
+
+        Args:
+            success: False for errors/timeouts
+            latency_ms: Call duration in milliseconds
+        """
+        slow = latency_ms >= self.slow_call_ms
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if success and not slow:
+                    self._transition(CLOSED, 'probe succeeded')
+                else:
+                    self._transition(OPEN, 'probe failed' if not success else 'probe slow')
+                return
+
+            self._calls.append((not success, slow))
+            if self._state != CLOSED or len(self._calls) < self.min_calls:
+                return
+            error_rate, slow_rate = self._rates()
+            if error_rate >= self.error_rate_threshold:
+                self._transition(OPEN, f"error rate {error_rate:.0%}")
+            elif slow_rate >= self.slow_rate_threshold:
+                self._transition(OPEN, f"slow-call rate {slow_rate:.0%}")
+
+    def cancel(self):
+        """
+        Give back an allowed call without a verdict (its outcome says nothing
+        about the dependency's health, e.g. the caller's own quota ran out)
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _rates(self):
+        calls = len(self._calls) or 1
+        return (sum(1 for failed, _ in self._calls if failed) / calls,
+                sum(1 for _, slow in self._calls if slow) / calls)
+
+    def status(self) -> dict:
+        """State, window rates and recent transitions for the health endpoint"""
+        with self._lock:
+            error_rate, slow_rate = self._rates()
+            return {
+                'state': self._state,
+                'window_calls': len(self._calls),
+                'error_rate': round(error_rate, 3),
+                'slow_rate': round(slow_rate, 3),
+                'open_for_seconds': round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                if self._state == OPEN else 0,
+                'transitions': list(self._transitions)
+            }
+
+
+class AdaptiveLimiter:
+    """
+    In-flight call limit that adapts to latency (AIMD)
+
+    Each fast call raises the limit by 1/limit, up to max_limit; each call
+    slower than target_ms cuts it by 10%, down to min_limit. Calls beyond the
+    limit are shed.
+    """
+
+    def __init__(self, name: str, max_limit: int = 32, min_limit: int = 2, target_ms: float = 4000):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.target_ms = target_ms
+        self._limit = float(max_limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        _limiters[name] = self
+        metrics.register_gauge(f'{name}.in_flight', lambda: self._in_flight)
+        metrics.register_gauge(f'{name}.concurrency_limit', lambda: int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        """Take an in-flight slot; False (and counted as shed) if the limit is reached"""
+        with self._lock:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+        metrics.incr(f'{self.name}.shed')
+        return False
+
+    def release(self, latency_ms: float = None):
+        """
+        Give a slot back
+
+        Args:
+            latency_ms: Call duration used to adapt the limit (None = don't adapt)
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if latency_ms is None:
+                return
+            if latency_ms > self.target_ms:
+                self._limit = max(self.min_limit, self._limit * 0.9)
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {'in_flight': self._in_flight, 'limit': int(self._limit), 'max_limit': self.max_limit,
+                    'shed': metrics.get_counter(f'{self.name}.shed')}
+
+
+def health_report() -> dict:
+    """
+    Breaker and limiter state for every registered dependency
+
+    Returns:
+        Dict keyed by dependency name
+    """
+    report = {}
+    for name, breaker in list(_breakers.items()):
+        report[name] = {'breaker': breaker.status(),
+                        'rejected': metrics.get_counter(f'{name}.breaker_rejected')}
+    for name, limiter in list(_limiters.items()):
+        report.setdefault(name, {})['load'] = limiter.status()
+    return report
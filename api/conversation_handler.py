@@ -11,6 +11,7 @@ try:
         get_product_responses, get_product_price
     )
     from .emotion_detector import detect_emotion, get_empathetic_response
+    from .message_analysis import analyze_message, register_keywords
     from .sales_psychology import enhance_product_response, get_buying_intent_message
     from .user_memory import (
         get_last_product, set_last_product, has_context,
@@ -22,12 +23,41 @@ except ImportError:
         get_product_responses, get_product_price
     )
     from emotion_detector import detect_emotion, get_empathetic_response
+    from message_analysis import analyze_message, register_keywords
     from sales_psychology import enhance_product_response, get_buying_intent_message
     from user_memory import (
         get_last_product, set_last_product, has_context,
         user_conversations  # Export for backward compatibility
     )
 
+# Trigger keywords, checked against the message's shared keyword scan
+GREETING_WORDS = ['hi', 'hello', 'hey', 'greetings', 'good morning', 'good afternoon', 'good evening']
+START_WORDS = ['hi', 'hello', 'hey', 'start']
+CHEAPEST_WORDS = ['cheapest', 'cheap', 'affordable', 'least expensive', 'lowest price']
+CATALOG_WORDS = [
+    'all products', 'show all', 'full catalog', 'everything', 'complete list', 'what else',
+    'other products', 'more products'
+]
+PRICE_WORDS = ['price', 'cost', 'how much', 'expensive']
+BUY_WORDS = ['buy', 'purchase', 'order', 'get it', 'take it']
+SPEC_WORDS = ['spec', 'feature', 'detail', 'info', 'tell me more', 'what can it do']
+COMPARE_WORDS = ['compare', 'vs', 'versus', 'difference', 'better']
+YES_WORDS = ['yes', 'yeah', 'sure', 'ok', 'okay', 'interested', 'sounds good']
+NO_WORDS = ['no', 'nah', 'not interested', 'maybe later']
+THANKS_WORDS = ['thank', 'thanks', 'appreciate', 'thx', 'ty']
+GOODBYE_WORDS = ['bye', 'goodbye', 'see you', 'later', 'exit', 'quit']
+HELP_WORDS = ['help', 'what can you do', 'commands', 'options']
+TOPIC_WORDS = ['bundle']   # checked with has()
+INTEREST_WORDS = [
+    'tell me more', 'interested', 'cool', 'nice', 'awesome', 'good', 'great', 'love it', 'like it',
+    'perfect', 'exactly', 'that works', 'sounds good'
+]
+
+register_keywords(
+    GREETING_WORDS, START_WORDS, CHEAPEST_WORDS, CATALOG_WORDS, PRICE_WORDS, BUY_WORDS, SPEC_WORDS,
+    COMPARE_WORDS, YES_WORDS, NO_WORDS, THANKS_WORDS, GOODBYE_WORDS, HELP_WORDS, INTEREST_WORDS, TOPIC_WORDS
+)
+
 
 def get_product_response(product_name):
     """Get a natural, random response for the specified product with sales psychology"""
@@ -43,33 +73,33 @@ def get_product_response(product_name):
 
 
 def continue_conversation(product_name, user_input):
-    """Continue conversation about the current product based on user intent"""
-    user_input_lower = user_input.lower()
+    """Continue conversation about the current product based on user intent (text or MessageAnalysis)"""
+    analysis = analyze_message(user_input)
     
     # Check for greetings FIRST - this resets context
-    if any(word in user_input_lower for word in ['hi', 'hello', 'hey', 'greetings', 'good morning', 'good afternoon', 'good evening']):
+    if analysis.has_any(GREETING_WORDS):
         return None  # Defer to responses.py for fresh greeting
     
     # Check for emotional states
-    emotion = detect_emotion(user_input)
+    emotion = detect_emotion(analysis)
     if emotion:
         price = get_product_price(product_name)
         return get_empathetic_response(emotion, product_name, price)
     
     # Bundle request - defer to responses.py
-    if 'bundle' in user_input_lower:
+    if analysis.has('bundle'):
         return None
     
     # Cheapest request - defer to responses.py
-    if any(word in user_input_lower for word in ['cheapest', 'cheap', 'affordable', 'least expensive', 'lowest price']):
+    if analysis.has_any(CHEAPEST_WORDS):
         return None
     
     # All products request - defer to responses.py
-    if any(word in user_input_lower for word in ['all products', 'show all', 'full catalog', 'everything', 'complete list', 'what else', 'other products', 'more products']):
+    if analysis.has_any(CATALOG_WORDS):
         return None
     
     # Price inquiry
-    if any(word in user_input_lower for word in ['price', 'cost', 'how much', 'expensive']):
+    if analysis.has_any(PRICE_WORDS):
         price = get_product_price(product_name) or 0
         
         # Add sales psychology based on price tier
@@ -79,12 +109,12 @@ def continue_conversation(product_name, user_input):
         return f"💰 The {product_name} costs ${price}.\n\n{psychology}\n\n✅ Free shipping on orders over $100\n✅ 30-day money-back guarantee\n✅ 1-year warranty\n\nReady to order? Contact @Store_help_bot!"
     
     # Buying intent
-    elif any(word in user_input_lower for word in ['buy', 'purchase', 'order', 'get it', 'take it']):
+    elif analysis.has_any(BUY_WORDS):
         price = get_product_price(product_name) or 0
         return get_buying_intent_message(product_name, price)
     
     # Specs/features request
-    elif any(word in user_input_lower for word in ['spec', 'feature', 'detail', 'info', 'tell me more', 'what can it do']):
+    elif analysis.has_any(SPEC_WORDS):
         specs = PRODUCT_SPECS.get(product_name, "Great product with amazing features!")
         price = get_product_price(product_name) or 0
         
@@ -97,27 +127,27 @@ def continue_conversation(product_name, user_input):
         return response + "\n\nWant to know more or ready to buy? 🛒"
     
     # Comparison request
-    elif any(word in user_input_lower for word in ['compare', 'vs', 'versus', 'difference', 'better']):
+    elif analysis.has_any(COMPARE_WORDS):
         return None  # Defer to responses.py for comparison handling
     
     # Positive response
-    elif any(word in user_input_lower for word in ['yes', 'yeah', 'sure', 'ok', 'okay', 'interested', 'sounds good']):
+    elif analysis.has_any(YES_WORDS):
         return f"Awesome! The {product_name} is a solid choice! 🎉\n\nWant to know the price, specs, or ready to buy? Just let me know!"
     
     # Negative response
-    elif any(word in user_input_lower for word in ['no', 'nah', 'not interested', 'maybe later']):
+    elif analysis.has_any(NO_WORDS):
         return "No worries! 😊 Is there anything else you'd like to know, or would you prefer to check out other products?"
     
     # Thank you
-    elif any(word in user_input_lower for word in ['thank', 'thanks', 'appreciate', 'thx', 'ty']):
+    elif analysis.has_any(THANKS_WORDS):
         return "You're very welcome! 😊 That's what I'm here for. Happy to help anytime! 🛒✨"
     
     # Goodbye
-    elif any(word in user_input_lower for word in ['bye', 'goodbye', 'see you', 'later', 'exit', 'quit']):
+    elif analysis.has_any(GOODBYE_WORDS):
         return "Goodbye! 👋 It was great chatting with you. I'm Alex, and I'm here whenever you need help finding the perfect tech! Have an awesome day! 😊"
     
     # Help request
-    elif any(word in user_input_lower for word in ['help', 'what can you do', 'commands', 'options']):
+    elif analysis.has_any(HELP_WORDS):
         return """Hey! I'm Alex, your tech consultant with 7 years of experience helping people find perfect products! 🎯
 
 **Here's how I can help you:**
@@ -138,16 +168,14 @@ What are you looking for today? I'm all ears! 😊"""
     
     # If the message seems like a general statement, NOT a specific product question
     # Don't keep repeating product info - defer to general handler
-    elif len(user_input.split()) <= 2:  # Short messages like "hello", "ok", "nice", etc.
+    elif len(analysis.text.split()) <= 2:  # Short messages like "hello", "ok", "nice", etc.
         # Don't repeat product info for short vague messages
         return None
     
     # Default: Only repeat product info if it seems like they're still interested
     else:
         # Check if the message has product-related keywords
-        product_keywords = ['tell me more', 'interested', 'cool', 'nice', 'awesome', 'good', 'great', 
-                           'love it', 'like it', 'perfect', 'exactly', 'that works', 'sounds good']
-        if any(keyword in user_input_lower for keyword in product_keywords):
+        if analysis.has_any(INTEREST_WORDS):
             return get_product_response(product_name)
         else:
             # Vague message - don't repeat product info, let fallback handle it
@@ -165,23 +193,23 @@ def handle_user_input(user_id, user_input):
     Returns:
         Response text or None (to defer to responses.py)
     """
-    user_input_lower = user_input.lower()
+    analysis = analyze_message(user_input)
     
     # Check for greetings - clear context for fresh start
-    if any(word in user_input_lower for word in ['hi', 'hello', 'hey', 'start']) and len(user_input.split()) <= 2:
+    if analysis.has_any(START_WORDS) and len(analysis.text.split()) <= 2:
         # Clear context if they're just saying hi (not "hi, tell me about...")
         from .user_memory import clear_user_state
         clear_user_state(user_id)
         return None  # Let responses.py handle the greeting
     
     # Check for goodbye first
-    if any(word in user_input_lower for word in ['bye', 'goodbye', 'see you', 'later', 'exit', 'quit']):
+    if analysis.has_any(GOODBYE_WORDS):
         from .user_memory import clear_user_state
         clear_user_state(user_id)
         return "Goodbye! 👋 It was great chatting with you. I'm Alex, and I'm here whenever you need help finding the perfect tech! Have an awesome day! 😊"
     
     # Check for help
-    if any(word in user_input_lower for word in ['help', 'what can you do', 'commands', 'options']):
+    if analysis.has_any(HELP_WORDS):
         return """Hey! I'm Alex, your tech consultant with 7 years of experience helping people find perfect products! 🎯
 
 **Here's how I can help you:**
@@ -201,11 +229,11 @@ def handle_user_input(user_id, user_input):
 What are you looking for today? I'm all ears! 😊"""
     
     # Check for thank you
-    if any(word in user_input_lower for word in ['thank', 'thanks', 'appreciate', 'thx', 'ty']):
+    if analysis.has_any(THANKS_WORDS):
         return "You're very welcome! 😊 That's what I'm here for. Happy to help anytime! 🛒✨"
     
     # Detect product mention
-    detected_product = detect_product(user_input)
+    detected_product = detect_product(analysis)
     
     if detected_product:
         # Store this product in memory
@@ -215,7 +243,7 @@ What are you looking for today? I'm all ears! 😊"""
     # If no product detected, check if user has context
     if has_context(user_id):
         last_product = get_last_product(user_id)
-        response = continue_conversation(last_product, user_input)
+        response = continue_conversation(last_product, analysis)
         if response:
             return response
         # If continue_conversation returned None, clear context and defer to responses.py
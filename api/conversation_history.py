@@ -0,0 +1,126 @@
+"""
+Conversation History Module
+Builds the "Recent Conversation" block of the Gemini prompt within a token budget
+"""
+import os
+import sys
+
+try:
+    from . import metrics
+    from .database_memory import get_user_memory
+    from .product_data import detect_product
+    from .prompt_loader import estimate_tokens, truncate_to_tokens
+except ImportError:
+    import metrics
+    from database_memory import get_user_memory
+    from product_data import detect_product
+    from prompt_loader import estimate_tokens, truncate_to_tokens
+
+# History budget configuration (override via environment)
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '600'))
+HISTORY_TURN_TOKENS = int(os.getenv('HISTORY_TURN_TOKENS', '150'))
+
+# Don't bother squeezing in a turn when less than this is left
+_MIN_TURN_TOKENS = 20
+
+# Tokens held back for the summary of dropped turns
+_SUMMARY_RESERVE_TOKENS = 30
+
+
+def _format_turn(msg):
+    speaker = 'User' if msg.get('role') == 'user' else 'Alex'
+    return f"{speaker}: {msg.get('content', '')}"
+
+
+def summarize_turns(messages):
+    """
+    One-line summary of turns that didn't fit the budget
+
+    Args:
+        messages: Dropped messages, oldest first
+
+    Returns:
+        Summary line naming the products discussed, or "" if there is nothing to say
+    """
+    products = []
+    for msg in messages:
+        product = detect_product(msg.get('content', ''))
+        if product and product not in products:
+            products.append(product)
+    if products:
+        return f"(Earlier: {len(messages)} messages about {', '.join(products)})"
+    return f"(Earlier: {len(messages)} messages)" if messages else ""
+
+
+def select_turns(messages, budget=HISTORY_TOKEN_BUDGET, turn_tokens=HISTORY_TURN_TOKENS):
+    """
+    Pick the newest turns that fit the token budget
+
+    The most recent turn is kept whole if it fits. Older turns are cut to
+    turn_tokens, and turns that don't fit at all are summarized in one line.
+
+    Args:
+        messages: Conversation messages, oldest first
+        budget: Token budget for the whole history block
+        turn_tokens: Per-turn cap for all but the most recent turn
+
+    Returns:
+        Tuple (lines oldest first, estimated tokens used)
+    """
+    lines = []
+    used = 0
+    for i, msg in enumerate(reversed(messages)):
+        line = _format_turn(msg)
+        if i > 0:
+            line = truncate_to_tokens(line, turn_tokens)
+        cost = estimate_tokens(line)
+        remaining = budget - used
+        if cost > remaining:
+            if remaining < _MIN_TURN_TOKENS + _SUMMARY_RESERVE_TOKENS:
+                break
+            line = truncate_to_tokens(line, remaining - _SUMMARY_RESERVE_TOKENS)
+            cost = estimate_tokens(line)
+        lines.append((line, cost))
+        used += cost
+
+    # Older turns that didn't fit are replaced by a one-line summary
+    summary = summarize_turns(messages[:len(messages) - len(lines)])
+    while summary and lines and used + estimate_tokens(summary) > budget:
+        used -= lines.pop()[1]
+        summary = summarize_turns(messages[:len(messages) - len(lines)])
+
+    lines = [line for line, _ in reversed(lines)]
+    if summary and used + estimate_tokens(summary) <= budget:
+        lines.insert(0, summary)
+        used += estimate_tokens(summary)
+    return lines, used
+
+
+def build_history(user_id, budget=None):
+    """
+    Build the "Recent Conversation" prompt block for a user
+
+    Turns come from the user's in-memory ring buffer (loaded from the database
+    on first use) and fill the budget newest first.
+
+    Args:
+        user_id: Telegram user ID
+        budget: Token budget (defaults to HISTORY_TOKEN_BUDGET)
+
+    Returns:
+        History block ending in a blank line, or "" when there is no history
+    """
+    if not user_id:
+        return ""
+    try:
+        messages = get_user_memory(user_id).get_messages()
+    except Exception as e:
+        print(f"Could not load conversation history: {e}", file=sys.stderr)
+        return ""
+    if not messages:
+        return ""
+
+    lines, used = select_turns(messages, budget or HISTORY_TOKEN_BUDGET)
+    metrics.observe('gemini.history_tokens', used)
+    metrics.observe('gemini.history_turns', len(lines))
+    return "**Recent Conversation:**\n" + "\n".join(lines) + "\n\n"
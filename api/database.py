@@ -4,13 +4,19 @@ Handles database initialization, session management, and utilities
 """
 import os
 import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 
 try:
+    from . import metrics
     from .models import Base, User, Conversation, Analytics, ConversationSession, ProductView, ChatMessageHistory
 except ImportError:
+    import metrics
     from models import Base, User, Conversation, Analytics, ConversationSession, ProductView, ChatMessageHistory
 
 # Database configuration
@@ -26,11 +32,14 @@ if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
 # Create engine with proper settings
 if 'sqlite' in DATABASE_URL:
     # For SQLite (local development)
+    # A single shared connection is only needed for in-memory databases; file
+    # databases get a connection per thread so queue/poll workers can run concurrently
+    sqlite_pool = {'poolclass': StaticPool} if ':memory:' in DATABASE_URL else {}
     engine = create_engine(
         DATABASE_URL,
-        connect_args={'check_same_thread': False},
-        poolclass=StaticPool,
-        echo=False
+        connect_args={'check_same_thread': False, 'timeout': 30},
+        echo=False,
+        **sqlite_pool
     )
 else:
     # For PostgreSQL (production)
@@ -44,6 +53,9 @@ else:
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Per-thread unit of work state (see unit_of_work)
+_batch_state = threading.local()
+
 
 def init_db():
     """Initialize database tables"""
@@ -60,6 +72,178 @@ def get_session() -> Session:
     return SessionLocal()
 
 
+def _active_batch():
+    """Get the unit of work open on this thread, or None"""
+    return getattr(_batch_state, 'batch', None)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Collect the database writes made on this thread and commit them together
+    
+    Inside the block, writer functions (get_or_create_user, track_analytics,
+    track_product_view, save_conversation, save_chat_message, execute_write)
+    queue their changes instead of opening a session each. On exit the queued
+    writes run in order in one session with a single commit. Nothing is held
+    open while the block runs, so slow work (e.g. the Gemini call) never sits
+    inside a transaction. Nested blocks join the outer unit.
+    
+    If the block raises, its queued writes are discarded and nothing is
+    committed, so an update is never half-applied. A failed commit is rolled
+    back and re-raised, so the update fails (and Telegram redelivers it)
+    instead of losing its writes silently.
+    """
+    if _active_batch() is not None:
+        yield _active_batch()
+        return
+    
+    batch = {'ops': [], 'users': {}, 'failed': []}
+    _batch_state.batch = batch
+    try:
+        yield batch
+    except BaseException:
+        if batch['ops']:
+            metrics.incr('db.unit_of_work_discarded')
+        raise
+    finally:
+        _batch_state.batch = None
+    _flush_writes(batch['ops'])
+
+
+@contextmanager
+def savepoint(label=None):
+    """
+    Give one step of a unit of work (e.g. one update of a chat) its own savepoint
+    
+    If the block raises, only the writes it queued are discarded. At commit its
+    writes run inside a database savepoint, so if one of them fails, only this
+    step is rolled back: its label goes into the batch's 'failed' list and the
+    rest of the unit still commits. Outside a unit of work the block just runs.
+    
+    Args:
+        label: Reported in batch['failed'] when the step's writes fail at commit
+    """
+    batch = _active_batch()
+    if batch is None:
+        yield
+        return
+    
+    mark, users = len(batch['ops']), dict(batch['users'])
+    try:
+        yield
+    except BaseException:
+        del batch['ops'][mark:]
+        batch['users'].clear()
+        batch['users'].update(users)
+        raise
+    ops = batch['ops'][mark:]
+    if ops:
+        batch['ops'][mark:] = [lambda session: _apply_savepoint(session, ops, label, batch)]
+
+
+def _apply_savepoint(session: Session, ops: list, label, batch: dict):
+    """Run one step's queued writes in a savepoint, rolling back just that step on failure"""
+    try:
+        with session.begin_nested():
+            for op in ops:
+                op(session)
+                session.flush()
+    except Exception as e:
+        batch['failed'].append(label)
+        metrics.incr('db.savepoint_failed')
+        print(f"❌ Writes for {label} rolled back ({len(ops)} writes): {e}", file=sys.stderr)
+
+
+def _flush_writes(ops: list):
+    """Apply queued writes in order and commit them in one transaction"""
+    if not ops:
+        return
+    session = SessionLocal(expire_on_commit=False)
+    try:
+        with metrics.timer('db.unit_of_work_commit_ms'):
+            for op in ops:
+                op(session)
+                # Make each write visible to the next one's queries (no commit yet)
+                session.flush()
+            session.commit()
+        metrics.incr('db.unit_of_work_commits')
+        metrics.observe('db.unit_of_work_writes', len(ops))
+    except Exception as e:
+        session.rollback()
+        metrics.incr('db.unit_of_work_failed')
+        print(f"❌ Unit of work commit failed ({len(ops)} writes): {e}", file=sys.stderr)
+        raise
+    finally:
+        session.close()
+
+
+def execute_write(op):
+    """
+    Run a write against a session, deferring it to the active unit of work
+    
+    Args:
+        op: Callable taking a Session; it must not commit
+    """
+    batch = _active_batch()
+    if batch is not None:
+        batch['ops'].append(op)
+        return
+    
+    session = get_session()
+    try:
+        op(session)
+        session.commit()
+    finally:
+        session.close()
+
+
+def ensure_users(profiles: list):
+    """
+    Get or create several users with a single query and commit
+    
+    Inside a unit_of_work, the users are remembered so later get_or_create_user
+    calls for them skip the database.
+    
+    Args:
+        profiles: List of dicts with 'user_id' and optional 'username', 'first_name'
+    
+    Returns:
+        Dictionary mapping user_id to User
+    """
+    if not profiles:
+        return {}
+    
+    by_id = {p['user_id']: p for p in profiles}
+    session = SessionLocal(expire_on_commit=False)
+    try:
+        now = datetime.utcnow()
+        users = {
+            u.user_id: u
+            for u in session.query(User).filter(User.user_id.in_(list(by_id))).all()
+        }
+        for user_id, profile in by_id.items():
+            user = users.get(user_id)
+            if user is None:
+                user = User(
+                    user_id=user_id,
+                    username=profile.get('username'),
+                    first_name=profile.get('first_name')
+                )
+                session.add(user)
+                users[user_id] = user
+            else:
+                user.last_active = now
+        session.commit()
+        
+        batch = _active_batch()
+        if batch is not None:
+            batch['users'].update(users)
+        return users
+    finally:
+        session.close()
+
+
 def get_or_create_user(user_id: int, username: str = None, first_name: str = None) -> User:
     """
     Get existing user or create new one
@@ -72,6 +256,10 @@ def get_or_create_user(user_id: int, username: str = None, first_name: str = Non
     Returns:
         User object
     """
+    batch = _active_batch()
+    if batch is not None:
+        return _get_or_create_user_deferred(batch, user_id, username, first_name)
+    
     session = get_session()
     try:
         user = session.query(User).filter(User.user_id == user_id).first()
@@ -87,7 +275,7 @@ def get_or_create_user(user_id: int, username: str = None, first_name: str = Non
             print(f"✅ New user created: {user_id}", file=sys.stderr)
         else:
             # Update last active
-            user.last_active = __import__('datetime').datetime.utcnow()
+            user.last_active = datetime.utcnow()
             session.commit()
         
         return user
@@ -95,6 +283,45 @@ def get_or_create_user(user_id: int, username: str = None, first_name: str = Non
         session.close()
 
 
+def _get_or_create_user_deferred(batch: dict, user_id: int, username: str = None, first_name: str = None) -> User:
+    """get_or_create_user inside a unit of work: one read now, the write on commit"""
+    if user_id in batch['users']:
+        return batch['users'][user_id]
+    
+    session = SessionLocal(expire_on_commit=False)
+    try:
+        user = session.query(User).filter(User.user_id == user_id).first()
+    finally:
+        session.close()
+    
+    if not user:
+        user = User(
+            user_id=user_id,
+            username=username,
+            first_name=first_name
+        )
+        batch['ops'].append(lambda s: _insert_user(s, user))
+        print(f"✅ New user created: {user_id}", file=sys.stderr)
+    else:
+        now = datetime.utcnow()
+        batch['ops'].append(
+            lambda s: s.query(User).filter(User.user_id == user_id).update({'last_active': now})
+        )
+    
+    batch['users'][user_id] = user
+    return user
+
+
+def _insert_user(session: Session, user: User):
+    """Add a new user in a savepoint; if another lane inserted it first, touch that row instead"""
+    try:
+        with session.begin_nested():
+            session.add(user)
+    except IntegrityError:
+        metrics.incr('db.user_insert_conflicts')
+        session.query(User).filter(User.user_id == user.user_id).update({'last_active': datetime.utcnow()})
+
+
 def save_conversation(
     user_id: int,
     user_message: str,
@@ -117,21 +344,16 @@ def save_conversation(
     Returns:
         Conversation object
     """
-    session = get_session()
-    try:
-        conversation = Conversation(
-            user_id=user_id,
-            user_message=user_message,
-            bot_response=bot_response,
-            current_product=current_product,
-            emotion_detected=emotion_detected,
-            intent=intent
-        )
-        session.add(conversation)
-        session.commit()
-        return conversation
-    finally:
-        session.close()
+    conversation = Conversation(
+        user_id=user_id,
+        user_message=user_message,
+        bot_response=bot_response,
+        current_product=current_product,
+        emotion_detected=emotion_detected,
+        intent=intent
+    )
+    execute_write(lambda session: session.add(conversation))
+    return conversation
 
 
 def get_conversation_history(user_id: int, limit: int = 10) -> list:
@@ -177,20 +399,15 @@ def track_analytics(
         is_conversion: Whether this is a conversion event
         conversion_value: Value of conversion if applicable
     """
-    session = get_session()
-    try:
-        analytics = Analytics(
-            user_id=user_id,
-            event_type=event_type,
-            event_data=event_data or {},
-            product_viewed=product_viewed,
-            is_conversion=is_conversion,
-            conversion_value=conversion_value
-        )
-        session.add(analytics)
-        session.commit()
-    finally:
-        session.close()
+    analytics = Analytics(
+        user_id=user_id,
+        event_type=event_type,
+        event_data=event_data or {},
+        product_viewed=product_viewed,
+        is_conversion=is_conversion,
+        conversion_value=conversion_value
+    )
+    execute_write(lambda session: session.add(analytics))
 
 
 def track_product_view(user_id: int, product_name: str, view_type: str = 'general'):
@@ -202,17 +419,19 @@ def track_product_view(user_id: int, product_name: str, view_type: str = 'genera
         product_name: Product name
         view_type: Type of view (general, price, specs, purchase)
     """
-    session = get_session()
-    try:
+    def write(session):
         product_view = session.query(ProductView)\
             .filter(ProductView.user_id == user_id, ProductView.product_name == product_name)\
             .first()
         
-        from datetime import datetime
         if not product_view:
             product_view = ProductView(
                 user_id=user_id,
-                product_name=product_name
+                product_name=product_name,
+                views_count=1,
+                price_inquiries=0,
+                spec_inquiries=0,
+                purchase_attempts=0
             )
             session.add(product_view)
         else:
@@ -226,10 +445,8 @@ def track_product_view(user_id: int, product_name: str, view_type: str = 'genera
             product_view.spec_inquiries += 1
         elif view_type == 'purchase':
             product_view.purchase_attempts += 1
-        
-        session.commit()
-    finally:
-        session.close()
+    
+    execute_write(write)
 
 
 def get_user_stats(user_id: int) -> dict:
@@ -296,7 +513,8 @@ def get_user_stats(user_id: int) -> dict:
         session.close()
 
 
-def save_chat_message(user_id: int, role: str, content: str, session_id: int = None, response_time_ms: int = None):
+def save_chat_message(user_id: int, role: str, content: str, session_id: int = None, response_time_ms: int = None,
+                      tokens_used: int = None):
     """
     Save individual chat message for LangChain history
     
@@ -306,20 +524,17 @@ def save_chat_message(user_id: int, role: str, content: str, session_id: int = N
         content: Message content
         session_id: Conversation session ID
         response_time_ms: Response time in milliseconds
+        tokens_used: Gemini tokens (prompt + output) spent on the message
     """
-    session = get_session()
-    try:
-        message = ChatMessageHistory(
-            user_id=user_id,
-            session_id=session_id,
-            role=role,
-            content=content,
-            response_time_ms=response_time_ms
-        )
-        session.add(message)
-        session.commit()
-    finally:
-        session.close()
+    message = ChatMessageHistory(
+        user_id=user_id,
+        session_id=session_id,
+        role=role,
+        content=content,
+        tokens_used=tokens_used,
+        response_time_ms=response_time_ms
+    )
+    execute_write(lambda session: session.add(message))
 
 
 def get_chat_history(user_id: int, limit: int = 20) -> list:
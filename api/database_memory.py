@@ -2,7 +2,10 @@
 LangChain Persistent Memory Module
 Integrates database persistence with LangChain for conversation memory
 """
+import os
 import sys
+import threading
+from collections import deque
 from datetime import datetime
 from typing import List
 try:
@@ -23,6 +26,9 @@ except ImportError:
     )
     from models import ConversationSession, ChatMessageHistory
 
+# Turns kept in each user's in-memory ring buffer (older turns are read from the database)
+HISTORY_BUFFER_SIZE = int(os.getenv('HISTORY_BUFFER_SIZE', '20'))
+
 
 class PersistentChatHistory:
     """
@@ -46,7 +52,7 @@ class PersistentChatHistory:
         finally:
             session.close()
     
-    def add_message(self, role: str, content: str, response_time_ms: int = None):
+    def add_message(self, role: str, content: str, response_time_ms: int = None, tokens_used: int = None):
         """
         Add message to history
         
@@ -54,6 +60,7 @@ class PersistentChatHistory:
             role: 'user' or 'assistant'
             content: Message content
             response_time_ms: Response time in milliseconds
+            tokens_used: Gemini tokens spent on the message
         """
         try:
             save_chat_message(
@@ -61,7 +68,8 @@ class PersistentChatHistory:
                 role=role,
                 content=content,
                 session_id=self.session_id,
-                response_time_ms=response_time_ms
+                response_time_ms=response_time_ms,
+                tokens_used=tokens_used
             )
         except Exception as e:
             print(f"Error adding message: {e}", file=sys.stderr)
@@ -110,28 +118,22 @@ class PersistentConversationMemory:
     LangChain-compatible conversation memory that persists to database
     """
     
-    def __init__(self, user_id: int, buffer_size: int = 10):
+    def __init__(self, user_id: int, buffer_size: int = HISTORY_BUFFER_SIZE):
         self.user_id = user_id
         self.buffer_size = buffer_size
         self.chat_history = PersistentChatHistory(user_id)
-        self._messages = []
+        self._messages = deque(maxlen=buffer_size)  # ring buffer of recent turns
+        self._loaded = False
     
     def add_user_message(self, message: str):
         """Add user message to memory"""
         self.chat_history.add_message('user', message)
         self._messages.append({'role': 'user', 'content': message})
-        self._trim_buffer()
     
-    def add_ai_message(self, message: str):
-        """Add AI message to memory"""
-        self.chat_history.add_message('assistant', message)
+    def add_ai_message(self, message: str, tokens_used: int = None):
+        """Add AI message to memory (tokens_used: Gemini tokens spent on it, if any)"""
+        self.chat_history.add_message('assistant', message, tokens_used=tokens_used)
         self._messages.append({'role': 'assistant', 'content': message})
-        self._trim_buffer()
-    
-    def _trim_buffer(self):
-        """Keep only recent messages in memory"""
-        if len(self._messages) > self.buffer_size:
-            self._messages = self._messages[-self.buffer_size:]
     
     def get_context(self) -> str:
         """
@@ -141,42 +143,57 @@ class PersistentConversationMemory:
             Formatted conversation context
         """
         context = "Previous conversation:\n"
-        for msg in self._messages[-5:]:  # Last 5 messages
+        for msg in list(self._messages)[-5:]:  # Last 5 messages
             role = "User" if msg['role'] == 'user' else "Assistant"
             context += f"{role}: {msg['content']}\n"
         return context
     
-    def get_messages(self) -> List[dict]:
-        """Get all messages"""
-        return self._messages
+    def get_messages(self, limit: int = None) -> List[dict]:
+        """
+        Get recent messages, oldest first
+        
+        Args:
+            limit: Maximum number of messages (None = everything in the buffer)
+        
+        Returns:
+            List of {'role', 'content'} dicts
+        """
+        if not self._loaded:
+            self.load_from_db(limit=self.buffer_size)
+        messages = list(self._messages)
+        return messages[-limit:] if limit else messages
     
-    def load_from_db(self, limit: int = 10):
-        """Load message history from database"""
+    def load_from_db(self, limit: int = None):
+        """Load message history from database into the ring buffer"""
+        session = get_session()
         try:
-            session = __import__('database').get_session()
             messages = session.query(ChatMessageHistory)\
                 .filter(ChatMessageHistory.user_id == self.user_id)\
-                .order_by(ChatMessageHistory.created_at.desc())\
-                .limit(limit)\
+                .order_by(ChatMessageHistory.created_at.desc(), ChatMessageHistory.message_id.desc())\
+                .limit(limit or self.buffer_size)\
                 .all()
             
-            session.close()
-            
-            self._messages = [
-                {
-                    'role': msg.role,
-                    'content': msg.content,
-                    'timestamp': msg.created_at.isoformat()
-                }
-                for msg in reversed(messages)
-            ]
+            self._messages = deque(
+                (
+                    {
+                        'role': msg.role,
+                        'content': msg.content,
+                        'timestamp': msg.created_at.isoformat() if msg.created_at else None
+                    }
+                    for msg in reversed(messages)
+                ),
+                maxlen=self.buffer_size
+            )
+            self._loaded = True
         except Exception as e:
             print(f"Error loading from database: {e}", file=sys.stderr)
+        finally:
+            session.close()
     
     def clear(self):
         """Clear all messages"""
         self.chat_history.clear_history()
-        self._messages = []
+        self._messages.clear()
 
 
 class ConversationContextManager:
@@ -230,6 +247,9 @@ class ConversationContextManager:
 # Global memory manager per user
 _memory_cache = {}
 
+# Guards check-then-create on the per-user caches when updates run on worker threads
+_memory_cache_lock = threading.Lock()
+
 
 def get_user_memory(user_id: int) -> PersistentConversationMemory:
     """
@@ -241,11 +261,17 @@ def get_user_memory(user_id: int) -> PersistentConversationMemory:
     Returns:
         PersistentConversationMemory instance
     """
-    if user_id not in _memory_cache:
-        _memory_cache[user_id] = PersistentConversationMemory(user_id)
-        _memory_cache[user_id].load_from_db(limit=10)
+    with _memory_cache_lock:
+        memory = _memory_cache.get(user_id)
+    if memory is not None:
+        return memory
     
-    return _memory_cache[user_id]
+    # Read the history without the lock so other users' lanes don't wait on it;
+    # if another thread got there first, its memory wins
+    memory = PersistentConversationMemory(user_id)
+    memory.load_from_db()
+    with _memory_cache_lock:
+        return _memory_cache.setdefault(user_id, memory)
 
 
 def get_user_context_manager(user_id: int) -> ConversationContextManager:
@@ -258,19 +284,20 @@ def get_user_context_manager(user_id: int) -> ConversationContextManager:
     Returns:
         ConversationContextManager instance
     """
-    if not hasattr(get_user_memory, '_context_cache'):
-        get_user_memory._context_cache = {}
-    
-    if user_id not in get_user_memory._context_cache:
-        get_user_memory._context_cache[user_id] = ConversationContextManager(user_id)
-    
-    return get_user_memory._context_cache[user_id]
+    with _memory_cache_lock:
+        if not hasattr(get_user_memory, '_context_cache'):
+            get_user_memory._context_cache = {}
+        
+        if user_id not in get_user_memory._context_cache:
+            get_user_memory._context_cache[user_id] = ConversationContextManager(user_id)
+        
+        return get_user_memory._context_cache[user_id]
 
 
 def clear_user_memory(user_id: int):
     """Clear user's memory cache"""
-    if user_id in _memory_cache:
-        del _memory_cache[user_id]
-    
-    if hasattr(get_user_memory, '_context_cache') and user_id in get_user_memory._context_cache:
-        del get_user_memory._context_cache[user_id]
+    with _memory_cache_lock:
+        _memory_cache.pop(user_id, None)
+        
+        if hasattr(get_user_memory, '_context_cache'):
+            get_user_memory._context_cache.pop(user_id, None)
@@ -3,6 +3,13 @@ Emotion Detection Module
 Detects emotional states in user messages and provides empathetic responses
 """
 
+try:
+    from .keyword_automaton import WHOLE_WORD
+    from .message_analysis import analyze_message, register_keywords
+except ImportError:
+    from keyword_automaton import WHOLE_WORD
+    from message_analysis import analyze_message, register_keywords
+
 # Emotion keyword lists
 FRUSTRATION_KEYWORDS = [
     'frustrated', 'frustrating', 'annoyed', 'annoying', 'ridiculous', 'stupid',
@@ -26,24 +33,27 @@ BUDGET_CONCERN_KEYWORDS = [
     'too much', 'cheaper alternative', 'budget'
 ]
 
+register_keywords(FRUSTRATION_KEYWORDS, URGENCY_KEYWORDS, HESITATION_KEYWORDS, BUDGET_CONCERN_KEYWORDS)
+
 
 def detect_emotion(user_input):
     """
     Detect emotional state from user input
+    Keywords count as whole words only ("now" in "know" or "mad" in "made" is no emotion)
     Returns: emotion type ('frustration', 'urgency', 'hesitation', 'budget_concern') or None
     """
-    user_input_lower = user_input.lower()
+    analysis = analyze_message(user_input)
     
-    if any(keyword in user_input_lower for keyword in FRUSTRATION_KEYWORDS):
+    if analysis.has_any(FRUSTRATION_KEYWORDS, WHOLE_WORD):
         return 'frustration'
     
-    if any(keyword in user_input_lower for keyword in URGENCY_KEYWORDS):
+    if analysis.has_any(URGENCY_KEYWORDS, WHOLE_WORD):
         return 'urgency'
     
-    if any(phrase in user_input_lower for phrase in HESITATION_KEYWORDS):
+    if analysis.has_any(HESITATION_KEYWORDS, WHOLE_WORD):
         return 'hesitation'
     
-    if any(phrase in user_input_lower for phrase in BUDGET_CONCERN_KEYWORDS):
+    if analysis.has_any(BUDGET_CONCERN_KEYWORDS, WHOLE_WORD):
         return 'budget_concern'
     
     return None
@@ -0,0 +1,175 @@
+"""
+Gemini Client Module
+Runs Gemini calls as coroutines on one background event loop that shares a
+keep-alive (HTTP/2 when h2 is installed) connection pool, instead of one
+blocked thread and one fresh TLS connection per call
+"""
+import asyncio
+import atexit
+import itertools
+import os
+import sys
+import threading
+from concurrent.futures import Future
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+try:
+    import httpx
+except ImportError:  # optional: without httpx, Gemini calls run on worker threads
+    httpx = None
+
+try:
+    import h2  # noqa: F401 - enables httpx HTTP/2
+    _H2_INSTALLED = True
+except ImportError:
+    _H2_INSTALLED = False
+
+# Async client configuration (override via environment)
+GEMINI_ASYNC_CLIENT = os.getenv('GEMINI_ASYNC_CLIENT', 'true').lower() in ('1', 'true', 'yes')
+GEMINI_HTTP2 = os.getenv('GEMINI_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+GEMINI_KEEPALIVE_SECONDS = float(os.getenv('GEMINI_KEEPALIVE_SECONDS', '60'))
+
+# httpcore scans its whole pool for every queued request, which turns quadratic
+# past a few dozen connections, so larger pools are split into shards this big
+_SHARD_CONNECTIONS = 16
+
+
+def is_available() -> bool:
+    """True if httpx is installed and the async client is enabled"""
+    return httpx is not None and GEMINI_ASYNC_CLIENT
+
+
+class AsyncGeminiClient:
+    """
+    Event loop thread plus pooled httpx.AsyncClient connections
+
+    Callers on any thread hand in a coroutine with submit() and get a
+    concurrent.futures.Future back. At most max_concurrency requests are on
+    the wire at once, spread round-robin over pool shards; the rest wait on
+    their shard's semaphore inside the loop. Cancelling the future (or
+    passing its deadline) cancels the request.
+    """
+
+    def __init__(self, max_concurrency: int = 16, keepalive_seconds: float = GEMINI_KEEPALIVE_SECONDS,
+                 http2: bool = GEMINI_HTTP2):
+        """
+        Args:
+            max_concurrency: Requests on the wire at once (also the connection pool size)
+            keepalive_seconds: How long idle connections are kept open
+            http2: Use HTTP/2 if the h2 package is installed
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.keepalive_seconds = keepalive_seconds
+        self.http2 = http2 and _H2_INSTALLED
+        self._loop = None
+        self._shards = []  # (httpx.AsyncClient, asyncio.Semaphore)
+        self._next_shard = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        metrics.register_gauge('gemini.client.in_flight', lambda: self._in_flight)
+        metrics.register_gauge('gemini.client.waiting', lambda: self._waiting)
+
+    def start(self):
+        """Start the event loop thread (idempotent)"""
+        with self._lock:
+            if self._thread:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name='gemini-loop', daemon=True)
+            self._thread.start()
+            ready.wait()
+        atexit.register(self.close)
+        print(f"✅ Gemini async client started ({'HTTP/2' if self.http2 else 'HTTP/1.1 keep-alive'}, "
+              f"{self.max_concurrency} concurrent)", file=sys.stderr)
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        remaining = self.max_concurrency
+        while remaining > 0:
+            size = min(remaining, _SHARD_CONNECTIONS)
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                                    keepalive_expiry=self.keepalive_seconds)
+            )
+            self._shards.append((client, asyncio.Semaphore(size)))
+            remaining -= size
+        ready.set()
+        self._loop.run_forever()
+
+    def submit(self, coro, timeout: float = None) -> Future:
+        """
+        Run a coroutine on the client's event loop
+
+        Args:
+            coro: Coroutine to run (typically one that awaits post())
+            timeout: Cancel it after this many seconds (None = no deadline)
+
+        Returns:
+            Future with the coroutine's result; cancel() cancels the coroutine
+        """
+        self.start()
+        if timeout:
+            coro = asyncio.wait_for(coro, timeout)
+        return asyncio.run_coroutine_threadsafe(self._track(coro), self._loop)
+
+    async def _track(self, coro):
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            metrics.incr('gemini.client.cancelled')
+            raise
+
+    async def post(self, url: str, json: dict, timeout: float):
+        """
+        POST on the shared connection pool (call from a coroutine run by submit())
+
+        Returns:
+            httpx.Response with the body read
+        """
+        client, semaphore = self._shards[next(self._next_shard) % len(self._shards)]
+        self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            return await client.post(url, json=json, timeout=timeout)
+        finally:
+            self._in_flight -= 1
+            semaphore.release()
+
+    def close(self):
+        """Cancel pending calls, close the connection pool and stop the loop"""
+        with self._lock:
+            loop, self._thread = self._loop, None
+        if loop is None or not loop.is_running():
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for client, _ in self._shards:
+                await client.aclose()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"⚠️ Gemini async client shutdown: {e}", file=sys.stderr)
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop = None
+        self._shards = []
+
+    def status(self) -> dict:
+        return {'in_flight': self._in_flight, 'waiting': self._waiting, 'max_concurrency': self.max_concurrency,
+                'pool_shards': len(self._shards), 'http2': self.http2}
@@ -1,112 +1,689 @@
 """
 Google Gemini API integration for intelligent bot responses
 """
+import asyncio
+import json
 import os
 import requests
 import sys
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from requests.adapters import HTTPAdapter
 
 # Try relative import first, fall back to direct import
 try:
+    from . import catalog_encoding, gemini_client, metrics, product_retrieval, structured_output
+    from .circuit_breaker import CircuitBreaker, AdaptiveLimiter
+    from .gemini_pool import GeminiKeyPool, QuotaExhausted, choose_model, retry_after_seconds
+    from .generation_profiles import choose_profile, generation_config, record_output_tokens
+    from .intent_router import route_message
+    from .prompt_cache import get_prefix_handle, invalidate_prefix_handle
+    from .response_cache import get_cached_response, cache_response
     from .responses import get_fallback_response
-    from .prompt_loader import SYSTEM_PROMPT, PRODUCTS_LIST, SALES_STYLE
+    from .prompt_loader import get_static_prefix, estimate_tokens
+    from .conversation_history import build_history
 except ImportError:
+    import catalog_encoding
+    import gemini_client
+    import metrics
+    import product_retrieval
+    import structured_output
+    from circuit_breaker import CircuitBreaker, AdaptiveLimiter
+    from gemini_pool import GeminiKeyPool, QuotaExhausted, choose_model, retry_after_seconds
+    from generation_profiles import choose_profile, generation_config, record_output_tokens
+    from intent_router import route_message
+    from prompt_cache import get_prefix_handle, invalidate_prefix_handle
+    from response_cache import get_cached_response, cache_response
     from responses import get_fallback_response
-    from prompt_loader import SYSTEM_PROMPT, PRODUCTS_LIST, SALES_STYLE
+    from prompt_loader import get_static_prefix, estimate_tokens
+    from conversation_history import build_history
 
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', '')
 
-def get_response(message, user_id=None):
+# Several keys (comma-separated) are rotated by quota headroom; GOOGLE_API_KEY is used when unset
+GOOGLE_API_KEYS = [key.strip() for key in os.getenv('GOOGLE_API_KEYS', '').split(',') if key.strip()]
+
+# Gemini endpoint and model (override GEMINI_API_BASE to point at a local stub)
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta').rstrip('/')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+
+# Latency SLO: if Gemini hasn't answered within GEMINI_SLO_SECONDS the keyword
+# fallback is sent instead (0 = wait for Gemini up to the request timeout). Off by
+# default: replies with thinking often take longer than a few seconds, and a hedge
+# trades that Gemini answer for the keyword one
+GEMINI_SLO_SECONDS = float(os.getenv('GEMINI_SLO_SECONDS', '0'))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '25'))
+
+GEMINI_WORKERS = int(os.getenv('GEMINI_WORKERS', '16'))
+
+# What the breaker counts as a slow call and the latency the in-flight limit adapts to.
+# Separate from the SLO: replies with thinking routinely take longer than a tight hedge
+# deadline, and that is normal latency, not a reason to open the breaker or shed load.
+GEMINI_BREAKER_SLOW_SECONDS = float(os.getenv('GEMINI_BREAKER_SLOW_SECONDS', str(GEMINI_TIMEOUT_SECONDS / 2)))
+GEMINI_LIMITER_TARGET_SECONDS = float(os.getenv('GEMINI_LIMITER_TARGET_SECONDS', str(GEMINI_TIMEOUT_SECONDS / 2)))
+
+# generateContent calls run as coroutines on one event loop sharing a keep-alive
+# connection pool, so the caller can stop waiting at the SLO deadline. Without
+# httpx they run on worker threads instead.
+_async_client = gemini_client.AsyncGeminiClient(max_concurrency=GEMINI_WORKERS) if gemini_client.is_available() else None
+_gemini_pool = ThreadPoolExecutor(max_workers=GEMINI_WORKERS, thread_name_prefix='gemini')
+
+# Keep-alive session for streamed and thread-pool calls
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=GEMINI_WORKERS))
+_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=GEMINI_WORKERS))
+
+# Per-key, per-model request/token quotas in a sliding window
+_key_pool = GeminiKeyPool('gemini')
+
+# Circuit breaker: stop calling Gemini for a while when it keeps failing or is slow
+_gemini_breaker = CircuitBreaker(
+    'gemini',
+    window=int(os.getenv('GEMINI_BREAKER_WINDOW', '20')),
+    error_rate=float(os.getenv('GEMINI_BREAKER_ERROR_RATE', '0.5')),
+    slow_call_ms=GEMINI_BREAKER_SLOW_SECONDS * 1000,
+    slow_rate=float(os.getenv('GEMINI_BREAKER_SLOW_RATE', '0.5')),
+    open_seconds=float(os.getenv('GEMINI_BREAKER_OPEN_SECONDS', '30'))
+)
+
+# Load shedding: calls beyond the (latency-adaptive) in-flight limit get the fallback right away
+_gemini_limiter = AdaptiveLimiter(
+    'gemini',
+    max_limit=int(os.getenv('GEMINI_MAX_INFLIGHT', '32')),
+    target_ms=GEMINI_LIMITER_TARGET_SECONDS * 1000
+)
+
+
+def api_keys():
+    """Gemini API keys available for calls"""
+    if GOOGLE_API_KEYS:
+        return GOOGLE_API_KEYS
+    return [GOOGLE_API_KEY] if GOOGLE_API_KEY else []
+
+
+def gemini_url(method, model=None, api_key=None, **params):
+    """Build the Gemini API URL for a model method (generateContent, streamGenerateContent)"""
+    query = '&'.join(f"{key}={value}" for key, value in params.items())
+    url = f"{GEMINI_API_BASE}/models/{model or GEMINI_MODEL}:{method}?key={api_key or GOOGLE_API_KEY}"
+    return f"{url}&{query}" if query else url
+
+
+def build_conversation_prompt(message, user_id=None):
+    """
+    Build the per-call part of the prompt: relevant products (with product
+    retrieval on), recent history and the message.
+    
+    Args:
+        message: User's message text
+        user_id: User ID for conversation memory
+    """
+    products = ""
+    if product_retrieval.PRODUCT_RETRIEVAL:
+        products = product_retrieval.build_product_context(message, user_id)
+    conversation_history = build_history(user_id)
+    
+    return f"""{products}{conversation_history}User: {message}
+
+Alex:"""
+
+
+def build_prompt(message, user_id=None):
+    """
+    Build the full prompt: system prompt, sales style, catalog, recent history and the message.
+    
+    Args:
+        message: User's message text
+        user_id: User ID for conversation memory
+    """
+    return f"{_static_prefix()}\n\n{build_conversation_prompt(message, user_id)}"
+
+
+def _static_prefix():
+    """
+    Static prompt prefix: without the catalog when retrieval supplies products per
+    call, with the compiled catalog table instead of products.txt when configured
+    """
+    if product_retrieval.PRODUCT_RETRIEVAL:
+        return get_static_prefix(include_catalog=False)
+    if catalog_encoding.PROMPT_CATALOG_FORMAT == 'compiled':
+        return f"{get_static_prefix(include_catalog=False)}\n\n{catalog_encoding.get_compiled_catalog()}"
+    return get_static_prefix()
+
+
+def build_request_body(prompt, cached_content=None, profile='default', structured=False):
+    """
+    Build the generateContent request body for a prompt
+    
+    Args:
+        prompt: Prompt text (only the per-call part when cached_content is given)
+        cached_content: Name of a cachedContents entry holding the static prefix
+        profile: Generation profile (token cap, thinking budget, temperature)
+        structured: Ask for JSON with the reply, product and intent (response schema)
+    """
+    body = {
+        'contents': [{
+            'role': 'user',
+            'parts': [{
+                'text': prompt
+            }]
+        }],
+        'generationConfig': generation_config(profile)
+    }
+    if structured:
+        body['generationConfig']['responseMimeType'] = 'application/json'
+        body['generationConfig']['responseSchema'] = structured_output.response_schema()
+    if cached_content:
+        body['cachedContent'] = cached_content
+    return body
+
+
+# Everything a generate request is built from
+_Prepared = namedtuple('_Prepared', 'prefix conversation model estimate profile structured')
+
+
+def _prepare(message, user_id, profile='default', structured=False):
+    """
+    Build the prompt parts and pick the model tier for a call.
+    
+    Returns:
+        _Prepared (prompt parts, model, estimated prompt tokens, generation settings)
+    """
+    prefix = _static_prefix()
+    conversation = build_conversation_prompt(message, user_id)
+    model = choose_model(message, GEMINI_MODEL)
+    return _Prepared(prefix, conversation, model, estimate_tokens(prefix) + estimate_tokens(conversation),
+                     profile, structured)
+
+
+def _post_generate(method, message, user_id, profile='default', structured=False, **kwargs):
+    """
+    POST a generate request on the API key with the most quota headroom.
+    
+    Short small-talk turns go to the lite model tier when one is configured.
+    A key answering 429 is rested for its retry delay and the next key is tried.
+    
+    Args:
+        method: generateContent or streamGenerateContent
+        message: User's message text
+        user_id: User ID for conversation memory
+        profile: Generation profile for the call
+        structured: Request the JSON response schema (generateContent only)
+        **kwargs: Extra arguments for requests.post (stream, timeout)
+    
+    Returns:
+        Tuple (response, lease) - report the usage back through the lease
+    
+    Raises:
+        QuotaExhausted: No key has quota left for the model
+    """
+    prepared = _prepare(message, user_id, profile, structured)
+    keys = api_keys()
+    for _ in range(len(keys)):
+        lease = _key_pool.acquire(keys, prepared.model, prepared.estimate)
+        response = _send_generate(method, lease, prepared, **kwargs)
+        if response.status_code != 429:
+            return response, lease
+        lease.rate_limited(retry_after_seconds(response))
+        response.close()
+    return response, lease
+
+
+def _send_generate(method, lease, prepared, **kwargs):
+    """
+    Send one generate request, referencing the cached prompt prefix when possible.
+    
+    If Gemini rejects the cache handle (expired or deleted), the handle is dropped
+    and the request is retried once with the full prompt inline. Other errors
+    (e.g. an invalid generationConfig) are returned as they are.
+    """
+    params = {'alt': 'sse'} if method == 'streamGenerateContent' else {}
+    url = gemini_url(method, model=lease.model, api_key=lease.key, **params)
+    
+    handle = get_prefix_handle(GEMINI_API_BASE, lease.key, lease.model, prepared.prefix)
+    if handle:
+        response = _session.post(url, headers={'Content-Type': 'application/json'},
+                                 json=_request_body(prepared, handle), **kwargs)
+        if not _cache_rejected(response):
+            metrics.incr('gemini.prompt_cache.requests')
+            metrics.observe('gemini.prompt_tokens_sent', estimate_tokens(prepared.conversation))
+            return response
+        print(f"⚠️ Cached prompt prefix rejected ({response.status_code}) - sending inline", file=sys.stderr)
+        response.close()
+        invalidate_prefix_handle(lease.key, lease.model)
+    
+    body = _request_body(prepared)
+    metrics.observe('gemini.prompt_tokens_sent', estimate_tokens(body['contents'][0]['parts'][0]['text']))
+    return _session.post(url, headers={'Content-Type': 'application/json'}, json=body, **kwargs)
+
+
+def _cache_rejected(response) -> bool:
+    """Whether an error response is about the cachedContent reference rather than the request itself"""
+    return response.status_code in (400, 403, 404) and 'cachedcontent' in response.text.lower()
+
+
+def _request_body(prepared, handle=None):
+    """Request body for prepared parts: the conversation alone with a cache handle, else the full prompt"""
+    prompt = prepared.conversation if handle else f"{prepared.prefix}\n\n{prepared.conversation}"
+    return build_request_body(prompt, handle, prepared.profile, prepared.structured)
+
+
+async def _apost_generate(prepared, timeout):
+    """Async counterpart of _post_generate for generateContent on the shared client"""
+    keys = api_keys()
+    for _ in range(len(keys)):
+        lease = _key_pool.acquire(keys, prepared.model, prepared.estimate)
+        response = await _asend_generate(lease, prepared, timeout)
+        if response.status_code != 429:
+            return response, lease
+        lease.rate_limited(retry_after_seconds(response))
+    return response, lease
+
+
+async def _asend_generate(lease, prepared, timeout):
+    """Async counterpart of _send_generate (creating the prefix cache stays off the event loop)"""
+    url = gemini_url('generateContent', model=lease.model, api_key=lease.key)
+    
+    handle = await asyncio.get_running_loop().run_in_executor(
+        None, get_prefix_handle, GEMINI_API_BASE, lease.key, lease.model, prepared.prefix)
+    if handle:
+        response = await _async_client.post(url, _request_body(prepared, handle), timeout)
+        if not _cache_rejected(response):
+            metrics.incr('gemini.prompt_cache.requests')
+            metrics.observe('gemini.prompt_tokens_sent', estimate_tokens(prepared.conversation))
+            return response
+        print(f"⚠️ Cached prompt prefix rejected ({response.status_code}) - sending inline", file=sys.stderr)
+        invalidate_prefix_handle(lease.key, lease.model)
+    
+    body = _request_body(prepared)
+    metrics.observe('gemini.prompt_tokens_sent', estimate_tokens(body['contents'][0]['parts'][0]['text']))
+    return await _async_client.post(url, body, timeout)
+
+
+def _record_usage(result, lease=None, meta=None):
+    """
+    Record token counts from a response's usageMetadata.
+    
+    The total is charged to the key's quota and reported as meta['tokens_used'];
+    output tokens are recorded per generation profile.
+    """
+    usage = result.get('usageMetadata') or {}
+    if usage.get('promptTokenCount'):
+        metrics.incr('gemini.prompt_tokens', usage['promptTokenCount'])
+    if usage.get('cachedContentTokenCount'):
+        metrics.incr('gemini.cached_tokens', usage['cachedContentTokenCount'])
+    if meta is not None:
+        record_output_tokens(meta.get('profile', 'default'), usage)
+        if usage.get('totalTokenCount'):
+            meta['tokens_used'] = usage['totalTokenCount']
+    if lease and usage.get('totalTokenCount'):
+        lease.record_tokens(usage['totalTokenCount'])
+
+
+def get_response(message, user_id=None, meta=None):
     """
     Get chatbot response using Google Gemini API with fallback.
     
+    Deterministic intents are answered locally by the intent router. The keyword
+    fallback is also used when Gemini misses the GEMINI_SLO_SECONDS deadline;
+    the call keeps running and its reply goes to the response cache.
+    
     Args:
         message: User's message text
         user_id: User ID for conversation memory
+        meta: Optional dict filled with 'profile' and 'tokens_used' (None unless Gemini answered
+              within the deadline); with GEMINI_STRUCTURED_OUTPUT also 'product' and 'intent' then
     """
+    meta = _new_meta(meta)
+    
+    # Prices, specs, catalog, cart and bundle questions are answered from the catalog
+    routed = route_message(message, user_id)
+    if routed:
+        return routed
     
     # If Google API key is not available, fall back to keyword responses
-    if not GOOGLE_API_KEY:
+    if not api_keys():
         print("WARNING: No Google API key - using fallback responses", file=sys.stderr)
         return get_fallback_response(message, user_id)
     
+    # Context-free questions (FAQs, product prices) can reuse an earlier answer
+    cached = get_cached_response(message)
+    if cached:
+        return cached
+    
+    if not _admit():
+        return get_fallback_response(message, user_id)
+    
+    meta['profile'] = choose_profile(message)
+    started = time.perf_counter()
+    # The call fills its own dict; it is copied into the caller's only if the reply
+    # makes the deadline, so a late call can't attach its product or tokens to the fallback
+    call_meta = {'profile': meta['profile']}
+    future = _submit_generate(message, user_id, call_meta)
     try:
-        # Get conversation history if user_id provided
-        conversation_history = ""
-        if user_id:
-            try:
-                from .database_memory import get_user_memory
-                user_memory = get_user_memory(user_id)
-                messages = user_memory.get_messages(limit=10)  # Last 10 messages
-                
-                # Format conversation history
-                if messages:
-                    conversation_history = "\n\n**Recent Conversation:**\n"
-                    for msg in messages[-6:]:  # Last 6 messages (3 exchanges)
-                        role = msg.get('role', 'user')
-                        content = msg.get('content', '')
-                        if role == 'user':
-                            conversation_history += f"User: {content}\n"
-                        else:
-                            conversation_history += f"Alex: {content}\n"
-            except Exception as e:
-                print(f"Could not load conversation history: {e}", file=sys.stderr)
-        
-        # Build the full prompt from loaded files
-        full_prompt = f"""{SYSTEM_PROMPT}
+        reply = future.result(timeout=GEMINI_SLO_SECONDS if GEMINI_SLO_SECONDS > 0 else None)
+        meta.update(call_meta)
+    except (FutureTimeout, asyncio.TimeoutError):
+        # On Python < 3.11 the async client's GEMINI_TIMEOUT_SECONDS deadline raises
+        # asyncio.TimeoutError, a different class from the SLO wait's FutureTimeout
+        if future.done() and future.exception() is not None:
+            print(f"Google Gemini timed out after {GEMINI_TIMEOUT_SECONDS}s", file=sys.stderr)
+            metrics.incr('gemini.timeouts')
+        else:
+            # Hedge: answer now from the keyword engine, let Gemini finish in the background.
+            # _generate caches its reply, so a late answer still serves the next asker.
+            print(f"⚠️ Gemini missed the {GEMINI_SLO_SECONDS}s SLO - sending fallback", file=sys.stderr)
+            metrics.incr('gemini.slo_hedges')
+            future.add_done_callback(_record_late_result)
+        reply = None
+    
+    if reply:
+        metrics.incr('gemini.slo_met')
+    else:
+        reply = get_fallback_response(message, user_id)
+    metrics.observe('gemini.reply_ms', (time.perf_counter() - started) * 1000)
+    return reply
 
-{SALES_STYLE}
 
-{PRODUCTS_LIST}{conversation_history}
+def _new_meta(meta):
+    """Reset the caller's call-details dict (or make a private one)"""
+    if meta is None:
+        meta = {}
+    meta.update(profile=None, tokens_used=None)
+    meta.pop('product', None)
+    meta.pop('intent', None)
+    return meta
 
-User: {message}
 
-Alex:"""
+def _record_late_result(future):
+    """Count Gemini replies that arrived after the fallback was sent"""
+    if not future.cancelled() and future.exception() is None and future.result():
+        metrics.incr('gemini.late_results')
 
-        # Google Gemini API endpoint - using Gemini 2.5 Flash
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}'
-        
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'contents': [{
-                'parts': [{
-                    'text': full_prompt
-                }]
-            }],
-            'generationConfig': {
-                'temperature': 0.7,
-                'maxOutputTokens': 1024,  # Increased for Gemini 2.5 thinking tokens
-                'topP': 0.8,
-                'topK': 40
-            }
-        }
-        
-        response = requests.post(url, 
-                                headers=headers, 
-                                json=data,
-                                timeout=25)
+
+def _admit():
+    """
+    Admission control for a Gemini call: in-flight limit first, then the breaker.
+    
+    Returns:
+        True if the call may start; it must then finish through _release()
+    """
+    if not _gemini_limiter.try_acquire():
+        return False
+    if not _gemini_breaker.allow():
+        _gemini_limiter.release()
+        return False
+    return True
+
+
+def _release(success, started, latency_ms=None):
+    """
+    Report an admitted call's outcome to the limiter and breaker
+    
+    Args:
+        success: True if Gemini answered, False if it failed (timeout, 5xx, transport
+                 error), None if the outcome says nothing about Gemini's health (our
+                 quota ran out, a 429 or a bad request) - the slot is given back unjudged
+        started: perf_counter() value when the call started
+        latency_ms: Latency to judge the call by (default: time since started)
+    """
+    if success is None:
+        _gemini_limiter.release()
+        _gemini_breaker.cancel()
+        return
+    if latency_ms is None:
+        latency_ms = (time.perf_counter() - started) * 1000
+    _gemini_limiter.release(latency_ms)
+    _gemini_breaker.record(success, latency_ms)
+
+
+def _outcome(response, reply):
+    """Breaker verdict for a call that got a response: only a 5xx is Gemini's failure"""
+    if reply is not None:
+        return True
+    return False if response.status_code >= 500 else None
+
+
+def _submit_generate(message, user_id=None, meta=None):
+    """
+    Start an admitted generateContent call without waiting for it.
+    
+    The prompt (which reads the user's history from the database) is built on
+    the caller's thread; the HTTP call then runs on the async client's event
+    loop, or on a worker thread when httpx is not installed.
+    
+    Returns:
+        Future resolving to the reply text (None if Gemini failed); cancelling it cancels the call
+    """
+    meta = {} if meta is None else meta
+    if _async_client is None:
+        return _gemini_pool.submit(_generate, message, user_id, meta)
+    
+    try:
+        prepared = _prepare(message, user_id, meta.get('profile') or 'default',
+                            structured_output.GEMINI_STRUCTURED_OUTPUT)
+    except Exception as e:
+        print(f"Could not build Gemini prompt: {str(e)}", file=sys.stderr)
+        _release(None, time.perf_counter())
+        failed = Future()
+        failed.set_result(None)
+        return failed
+    return _async_client.submit(_agenerate(message, prepared, meta), timeout=GEMINI_TIMEOUT_SECONDS)
+
+
+def _generate(message, user_id=None, meta=None):
+    """
+    Call generateContent once (the call must have been admitted by _admit()).
+    
+    Args:
+        message: User's message text
+        user_id: User ID for conversation memory
+        meta: Call-details dict (profile in, tokens_used out)
+    
+    Returns:
+        Reply text (also stored in the response cache), or None if Gemini failed
+    """
+    started = time.perf_counter()
+    outcome = False
+    try:
+        reply, outcome = _call_generate(message, user_id, {} if meta is None else meta)
+        return reply
+    finally:
+        _release(outcome, started)
+
+
+def _call_generate(message, user_id, meta):
+    """
+    Send generateContent and extract the reply text
+    
+    Returns:
+        Tuple (reply or None on any failure, breaker verdict for _release())
+    """
+    try:
+        started = time.perf_counter()
+        structured = structured_output.GEMINI_STRUCTURED_OUTPUT
+        response, lease = _post_generate('generateContent', message, user_id, meta.get('profile') or 'default',
+                                         structured, timeout=GEMINI_TIMEOUT_SECONDS)
+        reply = _read_reply(message, response, lease, (time.perf_counter() - started) * 1000, meta, structured)
+        return reply, _outcome(response, reply)
+    except QuotaExhausted as e:
+        print(f"Google Gemini not called: {str(e)}", file=sys.stderr)
+    except requests.Timeout:
+        print(f"Google Gemini timed out after {GEMINI_TIMEOUT_SECONDS}s", file=sys.stderr)
+        metrics.incr('gemini.timeouts')
+        return None, False
+    except requests.RequestException as e:
+        print(f"Google Gemini connection error: {str(e)}", file=sys.stderr)
+        return None, False
+    except Exception as e:
+        print(f"Google Gemini exception: {str(e)}", file=sys.stderr)
+    return None, None
+
+
+async def _agenerate(message, prepared, meta):
+    """Async counterpart of _generate (the call must have been admitted by _admit())"""
+    started = time.perf_counter()
+    outcome = False    # also when the call is cancelled at GEMINI_TIMEOUT_SECONDS
+    try:
+        reply, outcome = await _acall_generate(message, prepared, meta)
+        return reply
+    finally:
+        _release(outcome, started)
+
+
+async def _acall_generate(message, prepared, meta):
+    """Async counterpart of _call_generate"""
+    try:
+        started = time.perf_counter()
+        response, lease = await _apost_generate(prepared, GEMINI_TIMEOUT_SECONDS)
+        reply = _read_reply(message, response, lease, (time.perf_counter() - started) * 1000, meta,
+                            prepared.structured)
+        return reply, _outcome(response, reply)
+    except QuotaExhausted as e:
+        print(f"Google Gemini not called: {str(e)}", file=sys.stderr)
+    except (asyncio.TimeoutError, gemini_client.httpx.TimeoutException):
+        print(f"Google Gemini timed out after {GEMINI_TIMEOUT_SECONDS}s", file=sys.stderr)
+        metrics.incr('gemini.timeouts')
+        return None, False
+    except gemini_client.httpx.TransportError as e:
+        print(f"Google Gemini connection error: {str(e)}", file=sys.stderr)
+        return None, False
+    except Exception as e:
+        print(f"Google Gemini exception: {str(e)}", file=sys.stderr)
+    return None, None
+
+
+def _read_reply(message, response, lease, latency_ms, meta, structured=False):
+    """
+    Extract the reply text from a generateContent response and cache it (None if there is none).
+    
+    Structured replies are parsed (and repaired if malformed); their product and
+    intent go into meta.
+    """
+    metrics.observe('gemini.total_ms', latency_ms)
+    if response.status_code != 200:
+        print(f"Google Gemini API error: {response.status_code} - {response.text}", file=sys.stderr)
+        return None
+    
+    result = response.json()
+    _record_usage(result, lease, meta)
+    if 'candidates' in result and len(result['candidates']) > 0:
+        content = result['candidates'][0].get('content', {})
+        parts = content.get('parts', [])
+        if parts and len(parts) > 0:
+            reply = parts[0].get('text', '').strip()
+            if structured:
+                parsed = structured_output.parse_structured_reply(reply)
+                if parsed is None:
+                    print(f"Unreadable structured Gemini response: {reply[:200]}", file=sys.stderr)
+                    return None
+                reply = parsed['reply']
+                meta.update(product=parsed['product'], intent=parsed['intent'])
+            print(f"Google Gemini response successful", file=sys.stderr)
+            cache_response(message, reply, latency_ms)
+            return reply
+        else:
+            print(f"No parts in Gemini response", file=sys.stderr)
+    else:
+        print(f"No candidates in Gemini response", file=sys.stderr)
+    return None
+
+
+def _chunk_text(chunk):
+    """Extract the answer text from one streamed GenerateContentResponse (thought parts skipped)"""
+    candidates = chunk.get('candidates') or []
+    if not candidates:
+        return ''
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts if not part.get('thought'))
+
+
+def get_response_stream(message, user_id=None, on_text=None, meta=None):
+    """
+    Get chatbot response with streamGenerateContent, reporting text as it arrives.
+    
+    Args:
+        message: User's message text
+        user_id: User ID for conversation memory
+        on_text: Optional callback called with the accumulated text after each chunk
+        meta: Optional dict filled with 'profile' and 'tokens_used' (None unless Gemini answered)
+    
+    Returns:
+        Complete reply text (the fallback response if the stream fails)
+    """
+    meta = _new_meta(meta)
+    routed = route_message(message, user_id)
+    if routed:
+        return routed
+    
+    if not api_keys():
+        print("WARNING: No Google API key - using fallback responses", file=sys.stderr)
+        return get_fallback_response(message, user_id)
+    
+    cached = get_cached_response(message)
+    if cached:
+        return cached
+    
+    if not _admit():
+        return get_fallback_response(message, user_id)
+    
+    meta['profile'] = choose_profile(message)
+    started = time.perf_counter()
+    text = ''
+    usage = None
+    outcome = None
+    ttfb_ms = None
+    try:
+        response, lease = _post_generate('streamGenerateContent', message, user_id, meta['profile'],
+                                         stream=True, timeout=GEMINI_TIMEOUT_SECONDS)
         
-        if response.status_code == 200:
-            result = response.json()
-            if 'candidates' in result and len(result['candidates']) > 0:
-                content = result['candidates'][0].get('content', {})
-                parts = content.get('parts', [])
-                if parts and len(parts) > 0:
-                    reply = parts[0].get('text', '').strip()
-                    print(f"Google Gemini response successful", file=sys.stderr)
-                    return reply
-                else:
-                    print(f"No parts in Gemini response", file=sys.stderr)
-                    return get_fallback_response(message, user_id)
-            else:
-                print(f"No candidates in Gemini response", file=sys.stderr)
+        with response:
+            if response.status_code != 200:
+                print(f"Google Gemini stream error: {response.status_code} - {response.text}", file=sys.stderr)
+                outcome = _outcome(response, None)
+                metrics.incr('gemini.stream_fallbacks')
                 return get_fallback_response(message, user_id)
-        else:
-            print(f"Google Gemini API error: {response.status_code} - {response.text}", file=sys.stderr)
-            return get_fallback_response(message, user_id)
             
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = json.loads(line[5:].strip())
+                if chunk.get('usageMetadata'):
+                    usage = chunk  # cumulative - the last one covers the whole reply
+                piece = _chunk_text(chunk)
+                if not piece:
+                    continue
+                if not text:
+                    ttfb_ms = (time.perf_counter() - started) * 1000
+                    metrics.observe('gemini.ttfb_ms', ttfb_ms)
+                text += piece
+                if on_text:
+                    on_text(text)
+        
+        if usage:
+            _record_usage(usage, lease, meta)
+        text = text.strip()
+        if not text:
+            print(f"Empty Gemini stream", file=sys.stderr)
+            metrics.incr('gemini.stream_fallbacks')
+            return get_fallback_response(message, user_id)
+        
+        latency_ms = (time.perf_counter() - started) * 1000
+        metrics.observe('gemini.total_ms', latency_ms)
+        print(f"Google Gemini stream successful", file=sys.stderr)
+        cache_response(message, text, latency_ms)
+        outcome = True
+        return text
+    
+    except requests.RequestException as e:
+        print(f"Google Gemini stream exception: {str(e)}", file=sys.stderr)
+        outcome = False
+        metrics.incr('gemini.stream_fallbacks')
+        return get_fallback_response(message, user_id)
     except Exception as e:
-        print(f"Google Gemini exception: {str(e)}", file=sys.stderr)
+        print(f"Google Gemini stream exception: {str(e)}", file=sys.stderr)
+        metrics.incr('gemini.stream_fallbacks')
         return get_fallback_response(message, user_id)
+    finally:
+        # Streams are judged by time to first text, not by how long the answer is
+        _release(outcome, started, ttfb_ms)
@@ -0,0 +1,237 @@
+"""
+Gemini Key Pool Module
+Spreads Gemini calls across several API keys and model tiers, tracking each
+key's request and token quota in a sliding window
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    from . import metrics
+    from .message_analysis import analyze_message
+except ImportError:
+    import metrics
+    from message_analysis import analyze_message
+
+# Per-key, per-model quotas (set to your project's limits)
+GEMINI_KEY_RPM = int(os.getenv('GEMINI_KEY_RPM', '60'))
+GEMINI_KEY_TPM = int(os.getenv('GEMINI_KEY_TPM', '1000000'))
+
+# Cheaper model for simple turns, e.g. gemini-2.5-flash-lite ('' = always use GEMINI_MODEL)
+GEMINI_LITE_MODEL = os.getenv('GEMINI_LITE_MODEL', '')
+GEMINI_LITE_MAX_WORDS = int(os.getenv('GEMINI_LITE_MAX_WORDS', '6'))
+
+_WINDOW_SECONDS = 60.0
+
+# Cool-down after a 429 that doesn't say how long to wait
+_DEFAULT_RETRY_SECONDS = 60.0
+
+# Words that mark a turn as needing the full model even when short
+_COMPLEX_WORDS = {'compare', 'vs', 'versus', 'difference', 'recommend', 'which', 'better', 'best', 'why', 'should'}
+
+# Pools by name, for the health endpoint
+_pools = {}
+
+
+class QuotaExhausted(Exception):
+    """Every key is out of quota (or cooling down after a 429) for the model"""
+
+
+def mask_key(key: str) -> str:
+    """Short, log-safe label for an API key"""
+    return f"…{key[-4:]}" if len(key) > 4 else '…'
+
+
+def choose_model(message: str, default_model: str) -> str:
+    """
+    Pick the model tier for a turn
+
+    Args:
+        message: User's message text
+        default_model: Full model (GEMINI_MODEL)
+
+    Returns:
+        GEMINI_LITE_MODEL for short small-talk turns, default_model otherwise
+    """
+    if not GEMINI_LITE_MODEL:
+        return default_model
+    analysis = analyze_message(message)
+    if len(analysis.tokens) <= GEMINI_LITE_MAX_WORDS and analysis.words.isdisjoint(_COMPLEX_WORDS):
+        return GEMINI_LITE_MODEL
+    return default_model
+
+
+class KeySlot:
+    """Quota window of one (API key, model) pair"""
+
+    def __init__(self, key: str, model: str, rpm: int, tpm: int):
+        self.key = key
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.label = f"{model}/{mask_key(key)}"
+        self._calls = deque()  # [timestamp, tokens, in_window]
+        self._tokens = 0
+        self.cooling_until = 0.0
+
+    def _prune(self, now):
+        while self._calls and now - self._calls[0][0] >= _WINDOW_SECONDS:
+            entry = self._calls.popleft()
+            entry[2] = False
+            self._tokens -= entry[1]
+
+    def headroom(self, now, tokens=0) -> float:
+        """Share of the tighter of the two quotas still free after this call (negative = over)"""
+        if now < self.cooling_until:
+            return -1.0
+        self._prune(now)
+        return min(1 - (len(self._calls) + 1) / self.rpm, 1 - (self._tokens + tokens) / self.tpm)
+
+    def reserve(self, now, tokens):
+        entry = [now, tokens, True]
+        self._calls.append(entry)
+        self._tokens += tokens
+        return entry
+
+    def settle(self, entry, tokens):
+        """Replace a reservation's estimate with the actual token count"""
+        if entry[2]:
+            self._tokens += tokens - entry[1]
+        entry[1] = tokens
+
+    def utilisation(self, now) -> dict:
+        self._prune(now)
+        return {
+            'requests': len(self._calls),
+            'rpm_limit': self.rpm,
+            'tokens': self._tokens,
+            'tpm_limit': self.tpm,
+            'utilisation': round(max(len(self._calls) / self.rpm, self._tokens / self.tpm), 3),
+            'cooling_down_seconds': round(max(0.0, self.cooling_until - now), 1)
+        }
+
+
+class Lease:
+    """A reserved call on one key slot"""
+
+    def __init__(self, pool, slot, entry):
+        self.pool = pool
+        self.slot = slot
+        self._entry = entry
+
+    @property
+    def key(self) -> str:
+        return self.slot.key
+
+    @property
+    def model(self) -> str:
+        return self.slot.model
+
+    def record_tokens(self, tokens: int):
+        """Correct the reservation with the token count Gemini reported"""
+        with self.pool._lock:
+            self.slot.settle(self._entry, tokens)
+
+    def rate_limited(self, retry_after: float = None):
+        """The key got a 429: stop using it for retry_after seconds"""
+        with self.pool._lock:
+            self.slot.cooling_until = time.monotonic() + (retry_after or _DEFAULT_RETRY_SECONDS)
+        metrics.incr(f'{self.pool.name}.pool.rate_limited')
+        print(f"⚠️ Gemini key {self.slot.label} rate limited for {retry_after or _DEFAULT_RETRY_SECONDS:.0f}s",
+              file=sys.stderr)
+
+
+class GeminiKeyPool:
+    """
+    Sliding-window quota tracking across API keys and models
+
+    Slots are created on first use for each (key, model) pair. Each call goes
+    to the slot with the most headroom.
+    """
+
+    def __init__(self, name: str = 'gemini', rpm: int = GEMINI_KEY_RPM, tpm: int = GEMINI_KEY_TPM):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._slots = {}
+        self._lock = threading.Lock()
+        _pools[name] = self
+
+    def _slot(self, key, model):
+        slot = self._slots.get((key, model))
+        if slot is None:
+            slot = self._slots[(key, model)] = KeySlot(key, model, self.rpm, self.tpm)
+            metrics.register_gauge(f'{self.name}.pool.{slot.label}.utilisation',
+                                   lambda: self._utilisation_of(slot))
+        return slot
+
+    def _utilisation_of(self, slot):
+        with self._lock:
+            return slot.utilisation(time.monotonic())['utilisation']
+
+    def acquire(self, keys, model: str, tokens: int = 0) -> Lease:
+        """
+        Reserve a call on the key with the most headroom
+
+        Args:
+            keys: API keys to choose from
+            model: Model the call is for
+            tokens: Estimated tokens for the call
+
+        Returns:
+            Lease for the chosen key
+
+        Raises:
+            QuotaExhausted: No key has quota left for this model
+        """
+        now = time.monotonic()
+        with self._lock:
+            best, best_headroom = None, 0.0
+            for key in keys:
+                slot = self._slot(key, model)
+                headroom = slot.headroom(now, tokens)
+                if headroom >= 0 and (best is None or headroom > best_headroom):
+                    best, best_headroom = slot, headroom
+            if best is None:
+                metrics.incr(f'{self.name}.pool.exhausted')
+                raise QuotaExhausted(f"No Gemini key has quota left for {model}")
+            entry = best.reserve(now, tokens)
+        metrics.incr(f'{self.name}.pool.{best.label}.requests')
+        return Lease(self, best, entry)
+
+    def status(self) -> dict:
+        """Per-key, per-model utilisation of the current window"""
+        now = time.monotonic()
+        with self._lock:
+            return {slot.label: slot.utilisation(now) for slot in self._slots.values()}
+
+
+def utilisation_report() -> dict:
+    """
+    Utilisation of every key slot, per pool
+
+    Returns:
+        Dict keyed by pool name, then "<model>/<masked key>"
+    """
+    return {name: pool.status() for name, pool in list(_pools.items())}
+
+
+def retry_after_seconds(response) -> float:
+    """Read the wait time from a 429 (Retry-After header or RetryInfo.retryDelay), None if absent"""
+    header = response.headers.get('Retry-After')
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        for detail in response.json().get('error', {}).get('details', []):
+            delay = detail.get('retryDelay')
+            if delay:
+                return float(delay.rstrip('s'))
+    except Exception:
+        pass
+    return None
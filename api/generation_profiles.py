@@ -0,0 +1,116 @@
+"""
+Generation Profiles Module
+Picks the output-token cap, thinking budget and temperature for a Gemini call
+from the kind of message, so short factual turns don't pay for long answers
+"""
+import json
+import os
+import sys
+
+try:
+    from . import metrics
+    from .message_analysis import analyze_message, register_keywords
+except ImportError:
+    import metrics
+    from message_analysis import analyze_message, register_keywords
+
+# Thinking tokens count toward maxOutputTokens on Gemini 2.5, so each cap leaves
+# room for the thinking budget plus the answer. thinking_budget None = model default.
+PROFILES = {
+    'smalltalk': {'max_output_tokens': 160, 'thinking_budget': 0, 'temperature': 0.8},
+    'lookup': {'max_output_tokens': 320, 'thinking_budget': 0, 'temperature': 0.3},
+    'recommendation': {'max_output_tokens': 1024, 'thinking_budget': 512, 'temperature': 0.7},
+    'default': {'max_output_tokens': 768, 'thinking_budget': 256, 'temperature': 0.7},
+}
+
+# Per-profile overrides as JSON, e.g. {"lookup": {"max_output_tokens": 256}}
+_overrides = os.getenv('GEMINI_GENERATION_PROFILES', '')
+if _overrides:
+    try:
+        for _name, _settings in json.loads(_overrides).items():
+            PROFILES.setdefault(_name, dict(PROFILES['default'])).update(_settings)
+    except (ValueError, AttributeError) as e:
+        print(f"⚠️ Ignoring GEMINI_GENERATION_PROFILES: {e}", file=sys.stderr)
+
+# Messages this short made of these words are greetings, thanks and acknowledgements
+_SMALLTALK_MAX_WORDS = 6
+_SMALLTALK_WORDS = {
+    'hi', 'hello', 'hey', 'thanks', 'thank', 'thx', 'ty', 'ok', 'okay', 'cool', 'great', 'nice',
+    'awesome', 'perfect', 'bye', 'goodbye', 'cheers', 'yes', 'yeah', 'no', 'nope', 'sure', 'lol'
+}
+
+# Questions with a factual answer from the catalog or FAQs
+_LOOKUP_PHRASES = [
+    'how much', 'price', 'cost', 'spec', 'feature', 'battery', 'warranty', 'shipping', 'delivery',
+    'return', 'refund', 'in stock', 'available', 'color', 'size', 'waterproof'
+]
+
+# Judgement calls that benefit from thinking
+_ADVICE_WORDS = {
+    'why', 'should', 'better', 'best', 'worth', 'recommend', 'suggest', 'which', 'compare', 'compared',
+    'vs', 'versus', 'difference', 'gift', 'need', 'help', 'think', 'opinion'
+}
+
+register_keywords(_LOOKUP_PHRASES)
+
+
+def choose_profile(message: str) -> str:
+    """
+    Classify a message into a generation profile
+
+    Args:
+        message: User's message text (or its MessageAnalysis)
+
+    Returns:
+        Profile name (smalltalk, lookup, recommendation or default)
+    """
+    analysis = analyze_message(message)
+    words = analysis.words
+    if words & _ADVICE_WORDS:
+        profile = 'recommendation'
+    elif analysis.has_any(_LOOKUP_PHRASES):
+        profile = 'lookup'
+    elif len(analysis.tokens) <= _SMALLTALK_MAX_WORDS and (not words or words & _SMALLTALK_WORDS):
+        profile = 'smalltalk'
+    else:
+        profile = 'default'
+    metrics.incr(f'gemini.profile.{profile}')
+    return profile
+
+
+def generation_config(profile: str) -> dict:
+    """
+    Build the generationConfig for a profile
+
+    Args:
+        profile: Profile name (unknown names use the default profile)
+
+    Returns:
+        generationConfig dict for a generateContent request
+    """
+    settings = PROFILES.get(profile, PROFILES['default'])
+    config = {
+        'temperature': settings['temperature'],
+        'maxOutputTokens': settings['max_output_tokens'],
+        'topP': 0.8,
+        'topK': 40
+    }
+    if settings.get('thinking_budget') is not None:
+        config['thinkingConfig'] = {'thinkingBudget': settings['thinking_budget']}
+    return config
+
+
+def record_output_tokens(profile: str, usage: dict):
+    """
+    Record how many tokens a profile actually generated, for tuning its cap
+
+    Args:
+        profile: Profile the call used
+        usage: usageMetadata of the response
+    """
+    answer = usage.get('candidatesTokenCount') or 0
+    thoughts = usage.get('thoughtsTokenCount') or 0
+    if answer or thoughts:
+        metrics.observe(f'gemini.output_tokens.{profile}', answer + thoughts)
+    if thoughts:
+        metrics.observe(f'gemini.thoughts_tokens.{profile}', thoughts)
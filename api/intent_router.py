@@ -0,0 +1,137 @@
+"""
+Intent Router Module
+Answers deterministic intents (price, specs, cheapest, catalog, cart, bundles)
+straight from the catalog, so only open-ended messages reach Gemini
+"""
+import os
+import time
+
+try:
+    from . import metrics
+    from .message_analysis import analyze_message, register_keywords
+    from .product_data import detect_product, get_product_price, get_product_spec
+    from .responses import get_fallback_response
+except ImportError:
+    import metrics
+    from message_analysis import analyze_message, register_keywords
+    from product_data import detect_product, get_product_price, get_product_spec
+    from responses import get_fallback_response
+
+INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Longer messages are treated as open-ended conversation
+_MAX_WORDS = 12
+
+# Same triggers responses.get_fallback_response answers exactly
+_CATALOG_PHRASES = ['all products', 'show all', 'full catalog', 'everything you have', 'complete list', 'view all']
+_CHEAPEST_WORDS = ['cheapest', 'cheap', 'affordable', 'budget', 'least expensive', 'lowest price']
+_BUNDLE_EXPLAIN_WORDS = ['what is', 'tell me about', 'explain']
+
+_PRICE_WORDS = ['price', 'cost', 'how much', 'how expensive']
+_SPEC_WORDS = ['spec', 'specs', 'specification', 'specifications', 'features', 'details']
+_CART_PHRASES = ['my cart', 'cart total', 'in my cart', 'view cart', 'show cart', 'my basket']
+
+# Words that make a message a judgement call for Gemini, even if it names a product
+_OPEN_ENDED_WORDS = {
+    'why', 'should', 'better', 'best', 'worth', 'recommend', 'suggest', 'which', 'compare', 'compared',
+    'vs', 'versus', 'difference', 'or', 'gift', 'need', 'help', 'think', 'opinion', 'good'
+}
+
+register_keywords(_CATALOG_PHRASES, _CHEAPEST_WORDS, _BUNDLE_EXPLAIN_WORDS, _PRICE_WORDS, _CART_PHRASES, ['bundle'])
+
+
+def classify_intent(message):
+    """
+    Find a deterministic intent in a message
+
+    Args:
+        message: User's message text (or its MessageAnalysis)
+
+    Returns:
+        Tuple (intent, product) - intent is None for open-ended messages
+    """
+    analysis = analyze_message(message)
+    words = analysis.tokens
+    if not words or len(words) > _MAX_WORDS or analysis.words & _OPEN_ENDED_WORDS:
+        return None, None
+
+    if analysis.has_any(_CART_PHRASES):
+        return 'cart', None
+    if analysis.has_any(_CATALOG_PHRASES):
+        return 'catalog', None
+    if analysis.has_any(_CHEAPEST_WORDS):
+        return 'cheapest', None
+    if analysis.has('bundle') and not analysis.has_any(_BUNDLE_EXPLAIN_WORDS):
+        return 'bundle', None
+
+    product = detect_product(analysis)
+    if product is None:
+        return None, None
+    if analysis.has_any(_PRICE_WORDS):
+        return 'price', product
+    if not analysis.words.isdisjoint(_SPEC_WORDS):
+        return 'specs', product
+    return None, None
+
+
+def _product_answer(intent, product):
+    price = get_product_price(product)
+    spec = get_product_spec(product)
+    if intent == 'price':
+        return (f"💰 **{product} - ${price}**\n{spec}\n\n"
+                f"✅ Free shipping on orders over $100\n✅ 30-day money-back guarantee\n\n"
+                f"Want to add it to your cart? 🛍️")
+    return (f"📋 **{product} - Specs**\n{spec}\n\n💰 Price: ${price}\n\n"
+            f"Any questions about it? Happy to help! 😊")
+
+
+def _cart_answer(user_id):
+    if not user_id:
+        return None
+    try:
+        from .cart_manager import get_cart_summary
+    except ImportError:
+        from cart_manager import get_cart_summary
+    return get_cart_summary(user_id)
+
+
+def route_message(message, user_id=None):
+    """
+    Answer a message locally if it has a deterministic intent
+
+    Args:
+        message: User's message text
+        user_id: User ID (for the cart and product memory)
+
+    Returns:
+        Reply text, or None if the message should go to Gemini
+    """
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    started = time.perf_counter()
+    intent, product = classify_intent(message)
+
+    reply = None
+    if intent in ('price', 'specs'):
+        reply = _product_answer(intent, product)
+    elif intent == 'cart':
+        reply = _cart_answer(user_id)
+    elif intent in ('catalog', 'cheapest', 'bundle'):
+        reply = get_fallback_response(message, user_id)
+
+    if reply is None:
+        metrics.incr('router.forwarded')
+        return None
+    metrics.incr('router.handled')
+    metrics.incr(f'router.intent.{intent}')
+    metrics.observe('router.reply_ms', (time.perf_counter() - started) * 1000)
+    return reply
+
+
+def _handled_share():
+    handled = metrics.get_counter('router.handled')
+    total = handled + metrics.get_counter('router.forwarded')
+    return round(handled / total, 3) if total else 0.0
+
+
+metrics.register_gauge('router.handled_share', _handled_share)
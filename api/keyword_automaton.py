@@ -0,0 +1,137 @@
+"""
+Keyword Automaton Module
+Aho-Corasick automaton that finds every occurrence of thousands of keywords in
+one left-to-right pass over a message, noting which ones sit on word boundaries
+"""
+from collections import deque
+
+# Boundary modes for a keyword match
+SUBSTRING = 'substring'   # anywhere ("hi" matches "this")
+WORD_START = 'start'      # starting a word ("earbud" matches "earbuds", "led" doesn't match "cancelled")
+WHOLE_WORD = 'word'       # a whole word or phrase ("mad" doesn't match "made")
+
+# Bit per mode in the flags scan() reports for each keyword
+BOUNDARY_FLAGS = {SUBSTRING: 1, WORD_START: 2, WHOLE_WORD: 4}
+
+
+def boundary_flags(text: str, start: int, end: int) -> int:
+    """Flags for an occurrence of text[start:end]: always SUBSTRING, plus WORD_START and WHOLE_WORD if it qualifies"""
+    if start > 0 and text[start - 1].isalnum():
+        return 1
+    if end < len(text) and text[end].isalnum():
+        return 1 | 2
+    return 1 | 2 | 4
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed keyword set
+
+    Building costs time proportional to the total keyword length; scanning
+    costs time proportional to the text length plus the number of matches,
+    however many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        """
+        Args:
+            keywords: Iterable of keywords or phrases (lower case)
+        """
+        self.keywords = frozenset(keyword for keyword in keywords if keyword)
+        goto = [{}]
+        fail = [0]
+        output = [()]
+        for keyword in sorted(self.keywords):
+            state = 0
+            for char in keyword:
+                following = goto[state].get(char)
+                if following is None:
+                    following = goto[state][char] = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                state = following
+            output[state] = ((keyword, len(keyword)),)
+
+        # Breadth first, so each state's fail target (a shorter suffix) is done before it
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in goto[state].items():
+                queue.append(following)
+                target = fail[state]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                fail[following] = goto[target].get(char, 0)
+                output[following] += output[fail[following]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = {state: matches for state, matches in enumerate(output) if matches}
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def scan(self, text: str) -> dict:
+        """
+        Find every keyword occurring in text (overlapping and nested matches included)
+
+        Args:
+            text: Lower-cased text
+
+        Returns:
+            Dict keyword -> OR of BOUNDARY_FLAGS over all its occurrences
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        found = {}
+        state = 0
+        for end, char in enumerate(text, 1):
+            following = goto[state].get(char)
+            while following is None and state:
+                state = fail[state]
+                following = goto[state].get(char)
+            state = following or 0
+            if state in output:
+                for keyword, length in output[state]:
+                    flags = found.get(keyword, 0)
+                    if flags != 7:
+                        found[keyword] = flags | boundary_flags(text, end - length, end)
+        return found
+
+    def longest(self, text: str, boundary: str = SUBSTRING) -> list:
+        """
+        Leftmost-longest, non-overlapping matches, e.g. "smart home hub" rather
+        than "smart home" and "home hub"
+
+        Args:
+            text: Lower-cased text
+            boundary: Only count matches satisfying this boundary mode
+
+        Returns:
+            List of (start, keyword) in text order
+        """
+        flag = BOUNDARY_FLAGS[boundary]
+        goto, fail, output = self._goto, self._fail, self._output
+        best = {}  # start -> longest keyword starting there
+        state = 0
+        for end, char in enumerate(text, 1):
+            following = goto[state].get(char)
+            while following is None and state:
+                state = fail[state]
+                following = goto[state].get(char)
+            state = following or 0
+            for keyword, length in output.get(state, ()):
+                start = end - length
+                if boundary_flags(text, start, end) & flag and len(best.get(start, '')) < length:
+                    best[start] = keyword
+
+        matches, covered = [], 0
+        for start in sorted(best):
+            if start >= covered:
+                matches.append((start, best[start]))
+                covered = start + len(best[start])
+        return matches
@@ -91,11 +91,54 @@ def get_stats():
         session.close()
 
 
+def warm_images():
+    """
+    Upload every product image once to the cache chat so later sends use file_ids
+    Requires TELEGRAM_TOKEN and TELEGRAM_CACHE_CHAT_ID (a private chat/channel the bot can post to)
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    from media_cache import get_file_id
+    from product_data import PRODUCT_IMAGES
+    from telegram_handler import send_media_group, send_photo
+    
+    cache_chat_id = os.getenv('TELEGRAM_CACHE_CHAT_ID')
+    if not cache_chat_id:
+        print("❌ Set TELEGRAM_CACHE_CHAT_ID to a chat the bot can post to")
+        return False
+    
+    init_db()
+    print(f"🔥 Warming image cache in chat {cache_chat_id}...")
+    uploaded = 0
+    for product_name, urls in PRODUCT_IMAGES.items():
+        missing = [url for url in urls if not get_file_id(url)]
+        if not missing:
+            continue
+        
+        # sendMediaGroup takes 2-10 items
+        for start in range(0, len(missing), 10):
+            chunk = missing[start:start + 10]
+            if len(chunk) == 1:
+                response = send_photo(cache_chat_id, chunk[0])
+            else:
+                response = send_media_group(cache_chat_id, chunk)
+            
+            if response and response.get('ok'):
+                uploaded += len(chunk)
+                print(f"  ✅ {product_name}: {len(chunk)} image(s)")
+            else:
+                print(f"  ❌ {product_name}: {response}")
+    
+    print(f"✅ Uploaded {uploaded} image(s); the rest were already cached")
+    return True
+
+
 if __name__ == '__main__':
     import argparse
     
     parser = argparse.ArgumentParser(description='Database management utilities')
-    parser.add_argument('command', choices=['init', 'check', 'stats', 'reset'],
+    parser.add_argument('command', choices=['init', 'check', 'stats', 'reset', 'warm-images'],
                        help='Command to execute')
     
     args = parser.parse_args()
@@ -108,3 +151,5 @@ if __name__ == '__main__':
         get_stats()
     elif args.command == 'reset':
         reset_database()
+    elif args.command == 'warm-images':
+        warm_images()
@@ -0,0 +1,129 @@
+"""
+Telegram Media Cache Module
+Maps image URLs to Telegram file_ids so product photos are uploaded only once
+"""
+import sys
+import threading
+
+try:
+    from . import metrics
+    from .database import get_session, execute_write
+    from .models import TelegramFile
+except ImportError:
+    import metrics
+    from database import get_session, execute_write
+    from models import TelegramFile
+
+# In-memory view of the telegram_files table (loaded on first use)
+_file_ids = None
+_file_ids_lock = threading.Lock()
+
+
+def _load():
+    """Load cached file_ids from the database once per process"""
+    global _file_ids
+    with _file_ids_lock:
+        if _file_ids is not None:
+            return _file_ids
+        file_ids = {}
+        session = get_session()
+        try:
+            for row in session.query(TelegramFile).all():
+                file_ids[row.url] = row.file_id
+        except Exception as e:
+            print(f"⚠️ Media cache load failed: {e}", file=sys.stderr)
+        finally:
+            session.close()
+        _file_ids = file_ids
+        return _file_ids
+
+
+def is_url(media: str) -> bool:
+    """Check whether a media reference is a URL (as opposed to a file_id)"""
+    return isinstance(media, str) and media.startswith(('http://', 'https://'))
+
+
+def get_file_id(url: str):
+    """
+    Look up the cached file_id for an image URL
+
+    Args:
+        url: Image URL
+
+    Returns:
+        file_id, or None if the image has not been uploaded yet
+    """
+    file_id = _load().get(url)
+    metrics.incr('media_cache.hits' if file_id else 'media_cache.misses')
+    return file_id
+
+
+def resolve(url: str) -> str:
+    """Get the cached file_id for a URL, or the URL itself on a miss"""
+    if not is_url(url):
+        return url
+    return get_file_id(url) or url
+
+
+def remember(url: str, file_id: str):
+    """
+    Store the file_id Telegram assigned to an uploaded URL
+
+    Args:
+        url: Source image URL
+        file_id: file_id of the largest photo size from the send response
+    """
+    if not is_url(url) or not file_id:
+        return
+    file_ids = _load()
+    if file_ids.get(url) == file_id:
+        return
+    with _file_ids_lock:
+        file_ids[url] = file_id
+    try:
+        execute_write(lambda session: session.merge(TelegramFile(url=url, file_id=file_id)))
+    except Exception as e:
+        print(f"⚠️ Media cache save failed: {e}", file=sys.stderr)
+
+
+def forget(url: str):
+    """Drop a cached file_id (e.g. after Telegram rejected it)"""
+    file_ids = _load()
+    with _file_ids_lock:
+        if file_ids.pop(url, None) is None:
+            return
+    metrics.incr('media_cache.invalidated')
+    try:
+        execute_write(lambda session: session.query(TelegramFile).filter(TelegramFile.url == url).delete())
+    except Exception as e:
+        print(f"⚠️ Media cache delete failed: {e}", file=sys.stderr)
+
+
+def photo_file_id(message: dict):
+    """
+    Extract the file_id of the largest photo size from a sent Message
+
+    Args:
+        message: Message object returned by sendPhoto/sendMediaGroup
+
+    Returns:
+        file_id, or None if the message has no photo
+    """
+    sizes = (message or {}).get('photo') or []
+    return sizes[-1].get('file_id') if sizes else None
+
+
+def remember_from_response(urls: list, response: dict):
+    """
+    Record file_ids from a sendPhoto/sendMediaGroup response
+
+    Args:
+        urls: Media references sent, in order
+        response: Parsed Bot API response
+    """
+    if not response or not response.get('ok'):
+        return
+    result = response.get('result')
+    messages = result if isinstance(result, list) else [result]
+    for url, message in zip(urls, messages):
+        remember(url, photo_file_id(message))
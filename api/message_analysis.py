@@ -0,0 +1,181 @@
+"""
+Message Analysis Module
+Normalizes an incoming message once and finds every known keyword in it with a
+single Aho-Corasick scan, so product, emotion, intent and fallback detectors
+share one pass over the text instead of each rescanning it
+"""
+import functools
+import re
+import sys
+import threading
+
+try:
+    from . import metrics
+    from .keyword_automaton import BOUNDARY_FLAGS, SUBSTRING, KeywordAutomaton, boundary_flags
+except ImportError:
+    import metrics
+    from keyword_automaton import BOUNDARY_FLAGS, SUBSTRING, KeywordAutomaton, boundary_flags
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Longest n-gram kept in MessageAnalysis.ngrams
+_MAX_NGRAM = 3
+
+# Every registered keyword (lower case); the automaton is rebuilt only when this grows,
+# i.e. at import and when the catalog gains keywords
+_vocabulary = set()
+_vocabulary_lock = threading.Lock()
+_automaton = KeywordAutomaton(())
+
+# Registered keyword collections: id -> (collection, its length, vocabulary size once it was
+# all in, frozenset of it). A scan by an automaton of at least that size covers the
+# collection, so has_any() and found() intersect the scan's few hits with the frozenset
+# instead of checking every keyword.
+_registered = {}
+
+
+def register_keywords(*keyword_lists):
+    """
+    Add keywords to the scan
+
+    Detectors register their keyword lists at import, and the product catalog
+    re-registers when it changes. Pass the same list (or dict) objects later
+    given to has_any() and found(), so those cost time per hit rather than per
+    keyword. A keyword that was never registered still works - it is answered
+    with a substring search (counted as message_analysis.unregistered).
+
+    Args:
+        *keyword_lists: Lists, sets or dicts of keywords or phrases (lower case)
+    """
+    with _vocabulary_lock:
+        for keywords in keyword_lists:
+            lowered = frozenset(keyword.lower() for keyword in keywords if keyword)
+            _vocabulary.update(lowered)
+            if len(lowered) == len(keywords) and lowered.issuperset(keywords):
+                _registered[id(keywords)] = (keywords, len(keywords), len(_vocabulary), lowered)
+
+
+def _registered_set(keywords, scanned):
+    """The keywords as a frozenset if all were registered before the automaton that scanned `scanned`, else None"""
+    entry = _registered.get(id(keywords))
+    if entry is not None and entry[0] is keywords and entry[1] == len(keywords) and entry[2] <= len(scanned):
+        return entry[3]
+    return None
+
+
+def get_automaton() -> KeywordAutomaton:
+    """The automaton for the current vocabulary (rebuilt after keywords are registered)"""
+    global _automaton
+    if len(_automaton) == len(_vocabulary):
+        return _automaton
+    with _vocabulary_lock:
+        if len(_automaton) != len(_vocabulary):
+            _automaton = KeywordAutomaton(_vocabulary)
+            metrics.set_gauge('message_analysis.keywords', len(_automaton))
+        return _automaton
+
+
+def _occurs(text, keyword, flag):
+    """Search for one keyword outside the automaton, honouring the boundary mode"""
+    start = text.find(keyword)
+    while start >= 0:
+        if boundary_flags(text, start, start + len(keyword)) & flag:
+            return True
+        start = text.find(keyword, start + 1)
+    return False
+
+
+class MessageAnalysis:
+    """
+    One message, normalized and scanned once
+
+    Keyword checks take a boundary mode (keyword_automaton.SUBSTRING, WORD_START
+    or WHOLE_WORD); the default SUBSTRING is the same as keyword in text.lower().
+
+    Attributes:
+        text: The message as received
+        lower: Lower-cased text
+        tokens: Words and numbers, in order
+        words: Set of tokens
+        ngrams: Set of 1- to 3-word phrases (built on first use)
+        hits: Registered keywords that occur in the text (SUBSTRING)
+    """
+
+    __slots__ = ('text', 'lower', 'tokens', 'words', 'hits', '_hits', '_scanned', '_ngrams')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        self.tokens = tuple(_WORD.findall(self.lower))
+        self.words = frozenset(self.tokens)
+        self._ngrams = None
+
+        automaton = get_automaton()
+        found = automaton.scan(self.lower)
+        self._hits = {flag: frozenset(keyword for keyword, flags in found.items() if flags & flag)
+                      for flag in BOUNDARY_FLAGS.values()}
+        self.hits = self._hits[BOUNDARY_FLAGS[SUBSTRING]]
+        self._scanned = automaton.keywords
+
+    @property
+    def ngrams(self) -> frozenset:
+        if self._ngrams is None:
+            tokens = self.tokens
+            self._ngrams = frozenset(' '.join(tokens[i:i + n])
+                                     for n in range(1, _MAX_NGRAM + 1) for i in range(len(tokens) - n + 1))
+        return self._ngrams
+
+    def has(self, keyword: str, boundary: str = SUBSTRING) -> bool:
+        """True if the keyword occurs in the message in the given boundary mode"""
+        flag = BOUNDARY_FLAGS[boundary]
+        if keyword in self._scanned:
+            return keyword in self._hits[flag]
+        metrics.incr('message_analysis.unregistered')
+        return _occurs(self.lower, keyword, flag)
+
+    def has_any(self, keywords, boundary: str = SUBSTRING) -> bool:
+        """True if any of the keywords occurs in the message"""
+        hits = self._hits[BOUNDARY_FLAGS[boundary]]
+        registered = _registered_set(keywords, self._scanned)
+        if registered is not None:
+            return not registered.isdisjoint(hits)
+        if not hits.isdisjoint(keywords):
+            return True
+        return any(self.has(keyword, boundary) for keyword in keywords if keyword not in self._scanned)
+
+    def found(self, keywords, boundary: str = SUBSTRING) -> set:
+        """The keywords that occur in the message"""
+        hits = self._hits[BOUNDARY_FLAGS[boundary]]
+        registered = _registered_set(keywords, self._scanned)
+        if registered is not None:
+            return set(registered & hits)
+        found = set(hits.intersection(keywords))
+        found.update(keyword for keyword in keywords
+                     if keyword not in self._scanned and self.has(keyword, boundary))
+        return found
+
+    def __repr__(self):
+        return f"MessageAnalysis({self.text!r}, hits={sorted(self.hits)})"
+
+
+@functools.lru_cache(maxsize=1024)
+def _analyze(text):
+    return MessageAnalysis(text)
+
+
+def analyze_message(message) -> MessageAnalysis:
+    """
+    Get the analysis of a message, built on first use and shared afterwards
+
+    Every detector handling the same update calls this with the same text and
+    gets the same object back.
+
+    Args:
+        message: Message text (or an existing MessageAnalysis, returned as is)
+
+    Returns:
+        MessageAnalysis
+    """
+    if isinstance(message, MessageAnalysis):
+        return message
+    return _analyze(message or '')
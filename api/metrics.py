@@ -0,0 +1,152 @@
+"""
+Runtime Metrics Module
+In-process counters, gauges and latency samples for sizing and monitoring
+(persistent business analytics live in analytics.py)
+"""
+import sys
+import threading
+import time
+from collections import deque
+
+# Number of recent samples kept per timing metric for percentile estimates
+SAMPLE_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_gauge_callbacks = {}
+_timings = {}
+
+
+def incr(name: str, value: int = 1):
+    """
+    Increment a counter
+
+    Args:
+        name: Metric name (dotted, e.g. 'updates.enqueued')
+        value: Amount to add
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    """
+    Set a gauge to its current value
+
+    Args:
+        name: Metric name
+        value: Current value
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def register_gauge(name: str, callback):
+    """
+    Register a gauge whose value is read lazily when a snapshot is taken
+
+    Args:
+        name: Metric name
+        callback: Zero-argument callable returning the current value
+    """
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+
+def observe(name: str, value_ms: float):
+    """
+    Record a latency sample in milliseconds
+
+    Args:
+        name: Metric name (e.g. 'updates.lag_ms')
+        value_ms: Observed value
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = {'count': 0, 'sum': 0.0, 'max': 0.0, 'samples': deque(maxlen=SAMPLE_WINDOW)}
+            _timings[name] = timing
+        timing['count'] += 1
+        timing['sum'] += value_ms
+        timing['max'] = max(timing['max'], value_ms)
+        timing['samples'].append(value_ms)
+
+
+class timer:
+    """Context manager that records elapsed wall time under a timing metric"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def get_counter(name: str) -> int:
+    """Get current value of a counter (0 if never incremented)"""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def _percentile(sorted_samples: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def snapshot() -> dict:
+    """
+    Get a point-in-time view of all metrics
+
+    Returns:
+        Dictionary with counters, gauges and timing summaries (p50/p95/p99)
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        timings = {
+            name: (t['count'], t['sum'], t['max'], sorted(t['samples']))
+            for name, t in _timings.items()
+        }
+
+    for name, callback in callbacks.items():
+        try:
+            gauges[name] = callback()
+        except Exception as e:
+            gauges[name] = None
+            print(f"Metrics gauge error ({name}): {e}", file=sys.stderr)
+
+    return {
+        'counters': counters,
+        'gauges': gauges,
+        'timings': {
+            name: {
+                'count': count,
+                'avg_ms': round(total / count, 2) if count else 0.0,
+                'max_ms': round(peak, 2),
+                'p50_ms': round(_percentile(samples, 50), 2),
+                'p95_ms': round(_percentile(samples, 95), 2),
+                'p99_ms': round(_percentile(samples, 99), 2)
+            }
+            for name, (count, total, peak, samples) in timings.items()
+        },
+        'generated_at': time.time()
+    }
+
+
+def reset():
+    """Clear all recorded metrics (registered gauge callbacks are kept)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
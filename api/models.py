@@ -239,4 +239,52 @@ class CartItem(Base):
     added_at = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f"<CartItem {self.cart_item_id}>"
\ No newline at end of file
+        return f"<CartItem {self.cart_item_id}>"
+
+
+class ProcessedUpdate(Base):
+    """Telegram update_ids already accepted (shared deduplication window)"""
+    __tablename__ = 'processed_updates'
+    
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<ProcessedUpdate {self.update_id}>"
+
+
+class TelegramFile(Base):
+    """Telegram file_id of an uploaded image, keyed by its source URL"""
+    __tablename__ = 'telegram_files'
+    
+    url = Column(String(1024), primary_key=True)
+    file_id = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<TelegramFile {self.url}>"
+
+
+class BroadcastJob(Base):
+    """Bulk message run with a resumable checkpoint"""
+    __tablename__ = 'broadcast_jobs'
+    
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=True)
+    text = Column(Text, nullable=False)
+    audience = Column(String(50), default='all')  # all, abandoned_cart
+    status = Column(String(50), default='pending')  # pending, running, completed, failed
+    
+    # Checkpoint: users are sent in user_id order, everything <= last_user_id is done
+    last_user_id = Column(BigInteger, default=0)
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    blocked_count = Column(Integer, default=0)
+    
+    # Metadata
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<BroadcastJob {self.job_id}: {self.status}>"
@@ -9,33 +9,67 @@ from .specs import PRODUCT_SPECS
 from .responses import PRODUCT_RESPONSES
 from .images import PRODUCT_IMAGES
 
+try:
+    from ..keyword_automaton import WORD_START
+    from ..message_analysis import analyze_message, register_keywords
+except (ImportError, ValueError):
+    from keyword_automaton import WORD_START
+    from message_analysis import analyze_message, register_keywords
+
+# Bundle/category requests are not about one product
+CATEGORY_WORDS = ['bundle', 'category', 'categories', 'all products', 'catalog', 'list']
+
+# "Cheapest" requests are left to responses.py
+CHEAP_WORDS = ['cheapest', 'cheap', 'affordable', 'budget', 'least expensive', 'lowest price']
+
+# Rank of each of PRODUCT_KEYWORDS, longest first (ties in catalog order), re-ranked
+# only when keywords are added or removed
+_keyword_rank = {'count': None, 'rank': {}}
+
+register_keywords(CATEGORY_WORDS, CHEAP_WORDS)
+
+
+def _keyword_ranks():
+    if _keyword_rank['count'] != len(PRODUCT_KEYWORDS):
+        # New keywords rebuild the shared keyword automaton
+        register_keywords(PRODUCT_KEYWORDS)
+        ordered = sorted(PRODUCT_KEYWORDS.keys(), key=len, reverse=True)
+        _keyword_rank['rank'] = {keyword: rank for rank, keyword in enumerate(ordered)}
+        _keyword_rank['count'] = len(PRODUCT_KEYWORDS)
+    return _keyword_rank['rank']
+
+
+# Put the catalog's keywords into the shared automaton before the first message is scanned
+_keyword_ranks()
+
 
 def detect_product(user_input):
     """
     Detect which product the user is asking about
     
     Args:
-        user_input: User's message text
+        user_input: User's message text (or its MessageAnalysis)
         
     Returns:
         Product name if detected, None otherwise
     """
-    user_input_lower = user_input.lower().strip()
+    rank = _keyword_ranks()   # first, so a catalog change is in the automaton before the scan
+    analysis = analyze_message(user_input)
     
     # Exclude bundle/category requests from product detection
-    if any(word in user_input_lower for word in ['bundle', 'category', 'categories', 'all products', 'catalog', 'list']):
+    if analysis.has_any(CATEGORY_WORDS):
         return None
     
     # Exclude "cheapest" requests - let responses.py handle those
-    if any(word in user_input_lower for word in ['cheapest', 'cheap', 'affordable', 'budget', 'least expensive', 'lowest price']):
+    if analysis.has_any(CHEAP_WORDS):
         return None
     
-    # Check for exact matches first (longer phrases)
-    for keyword in sorted(PRODUCT_KEYWORDS.keys(), key=len, reverse=True):
-        if keyword in user_input_lower:
-            return PRODUCT_KEYWORDS[keyword]
-    
-    return None
+    # The longest keyword mentioned at the start of a word wins (more specific
+    # phrases first; "earbud" matches "earbuds" but "led" doesn't match "cancelled")
+    mentioned = analysis.found(PRODUCT_KEYWORDS, WORD_START)
+    if not mentioned:
+        return None
+    return PRODUCT_KEYWORDS[min(mentioned, key=rank.get)]
 
 
 def get_all_products():
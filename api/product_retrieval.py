@@ -0,0 +1,233 @@
+"""
+Product Retrieval Module
+Picks the catalog products relevant to a message (and the customer's recent
+turns) from a local BM25 index, so prompts carry a few products instead of
+the whole catalog
+"""
+import heapq
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    from . import catalog_encoding, metrics
+    from .database_memory import get_user_memory
+    from .product_data import PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS
+except ImportError:
+    import catalog_encoding
+    import metrics
+    from database_memory import get_user_memory
+    from product_data import PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS
+
+# Retrieval configuration (override via environment)
+PRODUCT_RETRIEVAL = os.getenv('PRODUCT_RETRIEVAL', 'false').lower() in ('1', 'true', 'yes')
+PRODUCT_RETRIEVAL_TOP_K = int(os.getenv('PRODUCT_RETRIEVAL_TOP_K', '5'))
+
+# How many of the customer's earlier turns feed the query, and how much they count
+_HISTORY_TURNS = 3
+_HISTORY_WEIGHT = 0.5
+
+# Term weight of each field: a word in the name says more than one in the spec
+_FIELD_WEIGHTS = (('name', 3.0), ('keywords', 2.0), ('spec', 1.0))
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+_STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'can', 'do', 'for', 'from', 'have', 'i', 'in',
+    'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'this', 'to', 'what', 'with',
+    'you', 'your', 'any', 'about', 'tell', 'want', 'need', 'looking', 'show', 'got', 'get', 'some'
+}
+
+_BUDGET = re.compile(r"(?:under|below|less than|max(?:imum)?|up to|within|cheaper than)\s*\$?\s*(\d+)")
+_CHEAP_WORDS = {'cheap', 'cheapest', 'budget', 'affordable', 'inexpensive'}
+
+
+def tokenize(text: str) -> list:
+    """Lower-case word tokens minus stopwords, with plurals folded ("earbuds" -> "earbud")"""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class ProductIndex:
+    """
+    BM25 inverted index over product names, search keywords and specs
+
+    Postings hold each term's precomputed BM25 weight per product, so a query
+    costs one dict lookup per query term plus a walk over that term's postings.
+    """
+
+    def __init__(self, prices: dict, specs: dict, keywords: dict):
+        """
+        Args:
+            prices: Product name -> price
+            specs: Product name -> spec sentence
+            keywords: Search keyword -> product name
+        """
+        self.names = list(prices)
+        self.prices = [prices[name] for name in self.names]
+        self.specs = [specs.get(name, '') for name in self.names]
+        position = {name: i for i, name in enumerate(self.names)}
+
+        product_keywords = [[] for _ in self.names]
+        for keyword, name in keywords.items():
+            if name in position:
+                product_keywords[position[name]].append(keyword)
+
+        term_weights = []
+        for i, name in enumerate(self.names):
+            fields = {'name': name, 'keywords': ' '.join(product_keywords[i]), 'spec': self.specs[i]}
+            weights = {}
+            for field, weight in _FIELD_WEIGHTS:
+                for token in tokenize(fields[field]):
+                    weights[token] = weights.get(token, 0.0) + weight
+            term_weights.append(weights)
+
+        lengths = [sum(weights.values()) for weights in term_weights]
+        average = (sum(lengths) / len(lengths)) if lengths else 1.0
+        document_frequency = {}
+        for weights in term_weights:
+            for token in weights:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        count = len(self.names)
+        self._postings = {}
+        for i, weights in enumerate(term_weights):
+            norm = _K1 * (1 - _B + _B * lengths[i] / average)
+            for token, tf in weights.items():
+                df = document_frequency[token]
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                self._postings.setdefault(token, []).append((i, idf * tf * (_K1 + 1) / (tf + norm)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query: str, k: int = PRODUCT_RETRIEVAL_TOP_K, history: str = '') -> list:
+        """
+        Rank products for a query
+
+        A budget in the query ("under $100") drops products above it; "cheap"
+        and friends break ties toward lower prices.
+
+        Args:
+            query: The customer's message
+            k: Number of products to return
+            history: Earlier customer turns (weighted at _HISTORY_WEIGHT)
+
+        Returns:
+            Up to k product names, best first (empty when nothing matches)
+        """
+        scores = {}
+        for text, weight in ((query, 1.0), (history, _HISTORY_WEIGHT)):
+            for token in set(tokenize(text)):
+                for i, score in self._postings.get(token, ()):
+                    scores[i] = scores.get(i, 0.0) + weight * score
+
+        lowered = query.lower()
+        budget = _BUDGET.search(lowered)
+        if budget:
+            limit = int(budget.group(1))
+            scores = {i: score for i, score in scores.items() if self.prices[i] <= limit}
+            if not scores:
+                # Only a budget to go on: the best-equipped products that fit it
+                scores = {i: 0.0 for i, price in enumerate(self.prices) if price <= limit}
+                return [self.names[i] for i in heapq.nlargest(k, scores, key=lambda i: self.prices[i])]
+
+        if set(re.findall(r"[a-z]+", lowered)) & _CHEAP_WORDS:
+            if not scores:
+                scores = {i: 0.0 for i in range(len(self.names))}
+            return [self.names[i] for i in heapq.nsmallest(k, scores, key=lambda i: (-scores[i], self.prices[i]))]
+
+        return [self.names[i] for i in heapq.nlargest(k, scores, key=scores.get)]
+
+    def format(self, names: list) -> str:
+        """Catalog lines for products, as the compiled table or in the prompts/products.txt format"""
+        position = {name: i for i, name in enumerate(self.names)}
+        if catalog_encoding.PROMPT_CATALOG_FORMAT == 'compiled':
+            return catalog_encoding.encode_catalog(
+                {name: self.prices[position[name]] for name in names},
+                {name: self.specs[position[name]] for name in names})
+        lines = []
+        for number, name in enumerate(names, 1):
+            i = position[name]
+            lines.append(f"{number}. **{name}** - ${self.prices[i]} - {self.specs[i]}")
+        return "\n".join(lines)
+
+
+_index = {'fingerprint': None, 'index': None}
+_index_lock = threading.Lock()
+
+
+def _catalog_fingerprint():
+    return len(PRODUCT_PRICES), len(PRODUCT_SPECS), len(PRODUCT_KEYWORDS)
+
+
+def get_product_index() -> ProductIndex:
+    """Index over the current catalog, rebuilt when products are added or removed"""
+    fingerprint = _catalog_fingerprint()
+    with _index_lock:
+        if _index['fingerprint'] != fingerprint:
+            started = time.perf_counter()
+            _index['index'] = ProductIndex(PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS)
+            _index['fingerprint'] = fingerprint
+            print(f"Product index built - {len(_index['index'])} products in "
+                  f"{(time.perf_counter() - started) * 1000:.1f}ms", file=sys.stderr)
+        return _index['index']
+
+
+def invalidate_product_index():
+    """Force a rebuild on next use (call after editing product specs or keywords in place)"""
+    with _index_lock:
+        _index['fingerprint'] = None
+
+
+def _recent_user_turns(user_id):
+    if not user_id:
+        return ''
+    try:
+        messages = get_user_memory(user_id).get_messages()
+    except Exception as e:
+        print(f"Could not load conversation history for retrieval: {e}", file=sys.stderr)
+        return ''
+    turns = [msg.get('content', '') for msg in messages if msg.get('role') == 'user']
+    return ' '.join(turns[-_HISTORY_TURNS:])
+
+
+def build_product_context(message: str, user_id=None, k: int = None) -> str:
+    """
+    Build the "Relevant Products" prompt block for a message
+
+    Args:
+        message: User's message text
+        user_id: User ID, whose recent turns also steer the choice
+        k: Number of products (defaults to PRODUCT_RETRIEVAL_TOP_K)
+
+    Returns:
+        Product block ending in a blank line
+    """
+    k = k or PRODUCT_RETRIEVAL_TOP_K
+    started = time.perf_counter()
+    index = get_product_index()
+    names = index.search(message, k, history=_recent_user_turns(user_id))
+    metrics.observe('retrieval.ms', (time.perf_counter() - started) * 1000)
+    metrics.observe('retrieval.products', len(names))
+
+    if names:
+        heading = "**Relevant Products:**"
+    else:
+        metrics.incr('retrieval.no_match')
+        names = index.names[:k]
+        heading = "**Featured Products:**"
+    return (f"{heading}\n{index.format(names)}\n"
+            f"(Showing {len(names)} of {len(index)} products in the store - "
+            f"ask what they need if none of these fit.)\n\n")
@@ -0,0 +1,211 @@
+"""
+Prompt Cache Module
+Registers the static prompt prefix (system prompt, sales style, catalog) with
+Gemini context caching so each call sends only the conversation and message
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import requests
+
+try:
+    from . import metrics
+    from .prompt_loader import estimate_tokens
+except ImportError:
+    import metrics
+    from prompt_loader import estimate_tokens
+
+# Prompt cache configuration (override via environment)
+GEMINI_PROMPT_CACHE = os.getenv('GEMINI_PROMPT_CACHE', 'true').lower() in ('1', 'true', 'yes')
+GEMINI_PROMPT_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_PROMPT_CACHE_TTL_SECONDS', '3600'))
+# Smallest prefix worth caching, in tokens (default: the model's minimum for cached content)
+GEMINI_PROMPT_CACHE_MIN_TOKENS = os.getenv('GEMINI_PROMPT_CACHE_MIN_TOKENS')
+
+# Gemini rejects cached content below these sizes (Flash models 1024 tokens, Pro models 4096)
+_MIN_CACHE_TOKENS_FLASH = 1024
+_MIN_CACHE_TOKENS_PRO = 4096
+
+# Extend the cache this long before it expires
+_REFRESH_MARGIN_SECONDS = 300
+
+# After a failed create, retry this much later
+_RETRY_AFTER_FAILURE_SECONDS = 600
+
+
+def min_cache_tokens(model: str) -> int:
+    """Minimum prefix size (estimated tokens) to create cached content for a model"""
+    if GEMINI_PROMPT_CACHE_MIN_TOKENS:
+        return int(GEMINI_PROMPT_CACHE_MIN_TOKENS)
+    return _MIN_CACHE_TOKENS_PRO if '-pro' in model else _MIN_CACHE_TOKENS_FLASH
+
+
+class PromptPrefixCache:
+    """
+    Lifecycle of one cachedContents entry for the static prompt prefix
+
+    Created on first use, extended (PATCH ttl) shortly before it expires, and
+    replaced when the prefix text or model changes.
+    """
+
+    def __init__(self, ttl_seconds: int = GEMINI_PROMPT_CACHE_TTL_SECONDS,
+                 refresh_margin: float = _REFRESH_MARGIN_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = min(refresh_margin, ttl_seconds / 2)
+        self._lock = threading.Lock()
+        self._name = None
+        self._key = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._busy = False
+        self._small_key = None
+
+    def get_handle(self, api_base: str, api_key: str, model: str, prefix: str):
+        """
+        Get the cachedContents name to reference for this prefix
+
+        The create, extend and delete calls run outside the lock, one at a time:
+        while one request talks to the API, the others keep using the current
+        handle (or send the prefix inline) instead of waiting.
+
+        Args:
+            api_base: Gemini API base URL
+            api_key: Gemini API key
+            model: Model the cache is created for
+            prefix: Static prompt prefix text
+
+        Returns:
+            Cache name (e.g. "cachedContents/abc123"), or None to send the prefix inline
+        """
+        key = (model, hashlib.sha1(prefix.encode('utf-8')).hexdigest())
+        now = time.monotonic()
+        with self._lock:
+            current = self._key == key and now < self._expires_at
+            if self._name and current and (self._busy or now < self._expires_at - self.refresh_margin):
+                return self._name
+            if self._busy or (now < self._retry_at and self._key == key):
+                return None
+            if self._small_key == key:
+                return None
+            tokens, minimum = estimate_tokens(prefix), min_cache_tokens(model)
+            if tokens < minimum:
+                # Gemini would refuse the create; say so once instead of failing every retry period
+                self._small_key = key
+                print(f"ℹ️ Prompt prefix (~{tokens} tokens) is below {model}'s minimum of {minimum} "
+                      f"for cached content - sending it inline", file=sys.stderr)
+                return None
+            self._busy = True
+            name = self._name if self._name and current else None
+            stale = self._name if self._name and not current else None
+
+        try:
+            if name and self._refresh(api_base, api_key, name):
+                with self._lock:
+                    if self._name == name:
+                        self._expires_at = now + self.ttl_seconds
+                        return name
+                return None
+            if name or stale:
+                self._delete(api_base, api_key, name or stale)
+            created = self._create(api_base, api_key, model, prefix)
+            with self._lock:
+                self._key = key
+                self._name = created
+                if created:
+                    self._expires_at = now + self.ttl_seconds
+                else:
+                    self._expires_at = 0.0
+                    self._retry_at = now + _RETRY_AFTER_FAILURE_SECONDS
+            return created
+        finally:
+            with self._lock:
+                self._busy = False
+
+    def invalidate(self):
+        """Forget the current handle (e.g. after Gemini reported it missing)"""
+        with self._lock:
+            self._name = None
+            self._expires_at = 0.0
+
+    def _create(self, api_base, api_key, model, prefix):
+        """Create the cache and return its name, None on failure"""
+        body = {
+            'model': f"models/{model}",
+            'displayName': 'saleschatbot-static-prefix',
+            'systemInstruction': {'parts': [{'text': prefix}]},
+            'ttl': f"{self.ttl_seconds}s"
+        }
+        try:
+            response = requests.post(f"{api_base}/cachedContents?key={api_key}", json=body, timeout=15)
+            if response.status_code == 200:
+                name = response.json()['name']
+                metrics.incr('gemini.prompt_cache.creates')
+                print(f"✅ Prompt prefix cached as {name}", file=sys.stderr)
+                return name
+            print(f"⚠️ Could not cache prompt prefix: {response.status_code} - {response.text[:200]}", file=sys.stderr)
+        except Exception as e:
+            print(f"⚠️ Could not cache prompt prefix: {e}", file=sys.stderr)
+        metrics.incr('gemini.prompt_cache.failures')
+        return None
+
+    def _refresh(self, api_base, api_key, name) -> bool:
+        try:
+            response = requests.patch(f"{api_base}/{name}?key={api_key}&updateMask=ttl",
+                                      json={'ttl': f"{self.ttl_seconds}s"}, timeout=10)
+            if response.status_code == 200:
+                metrics.incr('gemini.prompt_cache.refreshes')
+                return True
+            print(f"⚠️ Could not extend prompt cache: {response.status_code}", file=sys.stderr)
+        except Exception as e:
+            print(f"⚠️ Could not extend prompt cache: {e}", file=sys.stderr)
+        return False
+
+    def _delete(self, api_base, api_key, name):
+        """Delete the outdated cache (best effort - it expires on its own anyway)"""
+        try:
+            requests.delete(f"{api_base}/{name}?key={api_key}", timeout=5)
+        except Exception:
+            pass
+
+
+# One prompt cache per (API key, model): cachedContents belong to a project and a model
+_prompt_caches = {}
+_prompt_caches_lock = threading.Lock()
+
+
+def get_prompt_cache(api_key: str, model: str) -> PromptPrefixCache:
+    """Get (or create) the prompt cache for an API key and model"""
+    with _prompt_caches_lock:
+        cache = _prompt_caches.get((api_key, model))
+        if cache is None:
+            cache = _prompt_caches[(api_key, model)] = PromptPrefixCache()
+        return cache
+
+
+def get_prefix_handle(api_base: str, api_key: str, model: str, prefix: str):
+    """
+    Get the cachedContents name for the static prompt prefix
+
+    Returns:
+        Cache name, or None if prompt caching is disabled or unavailable
+    """
+    if not GEMINI_PROMPT_CACHE:
+        return None
+    return get_prompt_cache(api_key, model).get_handle(api_base, api_key, model, prefix)
+
+
+def invalidate_prefix_handle(api_key: str = None, model: str = None):
+    """
+    Drop cached handles so the next call recreates them
+
+    Args:
+        api_key: Only this key's handle (None = every key)
+        model: Only this model's handle (None = every model)
+    """
+    with _prompt_caches_lock:
+        caches = [cache for (key, cache_model), cache in _prompt_caches.items()
+                  if api_key in (None, key) and model in (None, cache_model)]
+    for cache in caches:
+        cache.invalidate()
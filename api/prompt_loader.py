@@ -2,6 +2,7 @@
 Load prompts from the prompts/ folder
 """
 import os
+import re
 import sys
 
 def load_prompt(filename):
@@ -21,3 +22,70 @@ SALES_STYLE = load_prompt('sales_style.txt')
 
 # Log prompt loading status
 print(f"Prompts loaded - System: {len(SYSTEM_PROMPT)} chars, Products: {len(PRODUCTS_LIST)} chars", file=sys.stderr)
+
+
+# Files that make up the static prompt prefix, in prompt order
+PREFIX_FILES = ('system_prompt.txt', 'sales_style.txt', 'products.txt')
+
+
+def _prefix_mtimes():
+    mtimes = []
+    for filename in PREFIX_FILES:
+        try:
+            mtimes.append(os.path.getmtime(os.path.join(os.path.dirname(__file__), '..', 'prompts', filename)))
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+_prefix = {
+    'mtimes': _prefix_mtimes(),
+    'base': f"{SYSTEM_PROMPT}\n\n{SALES_STYLE}",
+    'text': f"{SYSTEM_PROMPT}\n\n{SALES_STYLE}\n\n{PRODUCTS_LIST}"
+}
+
+
+def get_static_prefix(include_catalog=True):
+    """
+    Get the static part of every Gemini prompt (system prompt, sales style, catalog)
+
+    Re-reads the prompt files when they change on disk, so edits reach both the
+    inline prompt and the Gemini prompt cache without a restart.
+
+    Args:
+        include_catalog: Append the full product list (False when product
+            retrieval puts the relevant products in each call instead)
+    """
+    mtimes = _prefix_mtimes()
+    if mtimes != _prefix['mtimes']:
+        system_prompt, sales_style, products = (load_prompt(filename) for filename in PREFIX_FILES)
+        _prefix['base'] = f"{system_prompt}\n\n{sales_style}"
+        _prefix['text'] = f"{_prefix['base']}\n\n{products}"
+        _prefix['mtimes'] = mtimes
+        print("Prompt files changed - static prefix reloaded", file=sys.stderr)
+    return _prefix['text'] if include_catalog else _prefix['base']
+
+
+def estimate_tokens(text):
+    """
+    Estimate the Gemini token count of text without calling the API
+
+    Roughly 4 characters per token for English, but never fewer tokens than
+    words and punctuation marks (emoji and short words cost a token each).
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4, len(re.findall(r"\w+|[^\w\s]", text)))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens at a word boundary, marking the cut with an ellipsis"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, max_tokens * 4)]
+    while cut:
+        cut = cut.rsplit(' ', 1)[0] if ' ' in cut.strip() else cut[:len(cut) * 9 // 10]
+        result = cut.rstrip() + ' …'
+        if estimate_tokens(result) <= max_tokens:
+            return result
+    return '…'
@@ -0,0 +1,322 @@
+"""
+Response Cache Module
+Reuses Gemini answers for repeated, context-free questions (FAQs, product prices)
+keyed on the normalized message and the product it is about
+"""
+import glob
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from . import metrics, semantic_cache
+    from .product_data import PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS, detect_product
+except ImportError:
+    import metrics
+    import semantic_cache
+    from product_data import PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS, detect_product
+
+# Cache configuration (override via environment)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+
+# How often prompts/*.txt are re-hashed to detect edits
+_FINGERPRINT_CHECK_SECONDS = 30
+
+_PROMPTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'prompts')
+
+# Words that refer back to earlier turns - answers to these depend on history
+_CONTEXT_WORDS = {
+    'it', 'its', 'that', 'this', 'these', 'those', 'they', 'them', 'one', 'ones',
+    'yes', 'yeah', 'yep', 'no', 'nope', 'ok', 'okay', 'sure', 'more', 'else',
+    'also', 'too', 'again', 'other', 'another', 'same', 'instead', 'previous', 'last',
+    'he', 'she', 'him', 'her', 'why', 'compare', 'vs', 'versus', 'better', 'cheaper'
+}
+
+# Stand-alone topics that can be answered without history
+_FAQ_WORDS = {
+    'return', 'returns', 'refund', 'shipping', 'delivery', 'ship', 'warranty',
+    'guarantee', 'payment', 'pay', 'policy', 'hours', 'contact', 'support',
+    'products', 'catalog', 'categories', 'bundle', 'bundles', 'discount', 'sale'
+}
+
+# Filler that doesn't change the question
+_FILLER_WORDS = {'please', 'pls', 'plz', 'hi', 'hey', 'hello', 'um', 'uh', 'kindly', 'thanks'}
+
+# Whole-word rewrites so different spellings of one question share a key
+_SYNONYMS = {'cost': 'price', 'costs': 'price', 'priced': 'price'}
+_CONTRACTIONS = {
+    "what's": "what is", "where's": "where is", "who's": "who is", "how's": "how is",
+    "when's": "when is", "that's": "that is", "it's": "it is", "there's": "there is",
+    "here's": "here is", "he's": "he is", "she's": "she is"
+}
+
+
+def normalize_message(message: str) -> str:
+    """
+    Normalize a message for cache lookup
+
+    Lowercases, strips punctuation/emoji and filler words, collapses whitespace
+    and expands a few common spellings ("what's" -> "what is", "how much" ->
+    "price"). Rewrites apply to whole words only, so "costume" stays itself and
+    a possessive ("john's watch") just loses its "'s".
+
+    Args:
+        message: Raw user message
+
+    Returns:
+        Normalized message text
+    """
+    tokens = re.findall(r"[a-z0-9]+(?:'[a-z]+)?", message.lower().replace("’", "'"))
+    words = []
+    for token in tokens:
+        if token == 'much' and words and words[-1] == 'how':
+            words[-1] = 'price'
+            continue
+        if token in _CONTRACTIONS:
+            words.extend(_CONTRACTIONS[token].split())
+            continue
+        if token.endswith("'s"):
+            token = token[:-2]
+        for word in token.split("'"):
+            words.append(_SYNONYMS.get(word, word))
+    return ' '.join(word for word in words if word not in _FILLER_WORDS)
+
+
+def cache_scope(message: str):
+    """
+    Decide whether a message can be answered from the cache
+
+    Args:
+        message: Raw user message
+
+    Returns:
+        Tuple (normalized message, topic) for cacheable messages, None when
+        the answer depends on conversation history. The topic is the product
+        name, or the FAQ words for general questions.
+    """
+    normalized = normalize_message(message)
+    if not normalized:
+        return None
+    words = set(normalized.split())
+    if words & _CONTEXT_WORDS or len(words) > 12:
+        return None
+
+    product = detect_product(message)
+    if product is not None:
+        return normalized, product
+    faq_words = words & _FAQ_WORDS
+    if not faq_words:
+        return None
+    return normalized, ' '.join(sorted(faq_words))
+
+
+def content_fingerprint() -> str:
+    """Hash of the prompt files and the product catalog that answers are built from"""
+    digest = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(_PROMPTS_DIR, '*.txt'))):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    digest.update(repr(sorted(PRODUCT_PRICES.items())).encode('utf-8'))
+    digest.update(repr(sorted(PRODUCT_SPECS.items())).encode('utf-8'))
+    digest.update(repr(sorted(PRODUCT_KEYWORDS.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+_product_words_cache = {'count': None, 'words': {}}
+
+
+def _product_words(product: str) -> set:
+    """Words of a product's name and search keywords (rebuilt when the catalog's keywords change)"""
+    if _product_words_cache['count'] != len(PRODUCT_KEYWORDS):
+        words = {}
+        for name in PRODUCT_PRICES:
+            words[name] = set(re.findall(r"[a-z0-9]+", name.lower()))
+        for keyword, name in PRODUCT_KEYWORDS.items():
+            words.setdefault(name, set()).update(re.findall(r"[a-z0-9]+", keyword))
+        _product_words_cache['words'] = words
+        _product_words_cache['count'] = len(PRODUCT_KEYWORDS)
+    return _product_words_cache['words'].get(product, set())
+
+
+def semantic_text(normalized: str, topic) -> str:
+    """
+    The part of a message the semantic index compares: the product's own name
+    and keywords are dropped (the topic already pins the product), so questions
+    about different things of one product don't look alike
+
+    Args:
+        normalized: Normalized message
+        topic: Topic from cache_scope()
+
+    Returns:
+        Message text without product words (unchanged if nothing else is left)
+    """
+    product_words = _product_words(topic)
+    remaining = ' '.join(word for word in normalized.split() if word not in product_words)
+    return remaining or normalized
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of generated answers, cleared when the prompts or catalog change
+
+    Exact lookups on the normalized message come first; on a miss, the semantic
+    index (if NumPy is available) matches paraphrases about the same topic.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._semantic = semantic_cache.SemanticCache(ttl_seconds=ttl_seconds) if semantic_cache.is_available() else None
+
+    def _clear(self):
+        self._entries.clear()
+        if self._semantic is not None:
+            self._semantic.clear()
+
+    def _check_fingerprint(self):
+        """Clear the cache if prompts/*.txt or the catalog changed since the last check"""
+        now = time.monotonic()
+        if self._fingerprint is not None and now - self._checked_at < _FINGERPRINT_CHECK_SECONDS:
+            return
+        fingerprint = content_fingerprint()
+        with self._lock:
+            self._checked_at = now
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                self._clear()
+                metrics.incr('response_cache.invalidations')
+                print("⚠️ Prompts or catalog changed - response cache cleared", file=sys.stderr)
+            self._fingerprint = fingerprint
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._clear()
+            self._fingerprint = None
+
+    def get(self, key):
+        """
+        Look up a cached answer
+
+        Args:
+            key: Key from cache_scope()
+
+        Returns:
+            Cached reply text, or None on a miss
+        """
+        self._check_fingerprint()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['stored_at'] >= self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._semantic_get(key)
+        if entry is None:
+            metrics.incr('response_cache.misses')
+            return None
+        metrics.incr('response_cache.hits')
+        metrics.incr('response_cache.saved_ms', int(entry['latency_ms']))
+        metrics.observe('response_cache.latency_saved_ms', entry['latency_ms'])
+        return entry['reply']
+
+    def _semantic_get(self, key):
+        """Find a cached answer to a paraphrase of the message (None if there is none)"""
+        if self._semantic is None:
+            return None
+        normalized, topic = key
+        match = self._semantic.lookup(semantic_text(normalized, topic), topic)
+        if match is None:
+            return None
+        entry, similarity = match
+        metrics.incr('response_cache.semantic_hits')
+        metrics.observe('response_cache.semantic_similarity', similarity)
+        return entry
+
+    def put(self, key, reply: str, latency_ms: float = 0.0):
+        """
+        Store a generated answer
+
+        Args:
+            key: Key from cache_scope()
+            reply: Reply text
+            latency_ms: How long generating it took (reported as saved on hits)
+        """
+        entry = {'reply': reply, 'latency_ms': latency_ms, 'stored_at': time.monotonic()}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self._semantic is not None:
+            normalized, topic = key
+            self._semantic.add(semantic_text(normalized, topic), entry, topic)
+        metrics.incr('response_cache.stores')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Global cache
+_response_cache = ResponseCache()
+
+
+def _hit_rate():
+    hits = metrics.get_counter('response_cache.hits')
+    lookups = hits + metrics.get_counter('response_cache.misses')
+    return round(hits / lookups, 3) if lookups else 0.0
+
+
+metrics.register_gauge('response_cache.hit_rate', _hit_rate)
+metrics.register_gauge('response_cache.entries', lambda: len(_response_cache))
+
+
+def get_cached_response(message: str):
+    """
+    Get a cached answer for a context-free message
+
+    Args:
+        message: Raw user message
+
+    Returns:
+        Reply text, or None if the message isn't cacheable or not cached yet
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    key = cache_scope(message)
+    if key is None:
+        return None
+    return _response_cache.get(key)
+
+
+def cache_response(message: str, reply: str, latency_ms: float = 0.0):
+    """
+    Remember a Gemini answer for a context-free message (no-op for other messages)
+
+    Args:
+        message: Raw user message
+        reply: Generated reply text
+        latency_ms: Generation latency in milliseconds
+    """
+    if not RESPONSE_CACHE_ENABLED or not reply:
+        return
+    key = cache_scope(message)
+    if key is not None:
+        _response_cache.put(key, reply, latency_ms)
@@ -5,8 +5,108 @@ Fallback keyword-based responses for the bot
 # Import conversation handler
 try:
     from .conversation_handler import handle_user_input as handle_conversation
+    from .message_analysis import analyze_message, register_keywords
 except ImportError:
     from conversation_handler import handle_user_input as handle_conversation
+    from message_analysis import analyze_message, register_keywords
+
+# Trigger keywords, checked against the message's shared keyword scan
+CATALOG_WORDS = [
+    'all products', 'show all', 'full catalog', 'everything you have', 'complete list', 'view all'
+]
+CHEAPEST_WORDS = ['cheapest', 'cheap', 'affordable', 'budget', 'least expensive', 'lowest price']
+COMPARE_WORDS = ['compare', 'vs', 'versus', 'difference between']
+EXPLAIN_WORDS = ['what is', 'tell me about', 'explain']
+GREETING_WORDS = ['hi', 'hello', 'hey', 'start']
+BROWSE_WORDS = ['product', 'sell', 'have', 'what', 'show', 'all', 'catalog', 'list']
+TOPIC_WORDS = ['audio', 'bundle']   # checked one at a time with has()
+
+# Categories (cheapest, bundle and category browsing)
+HOME_WORDS = ['smart home', 'home']
+WEARABLE_WORDS = ['wearable', 'fitness', 'tracker']
+FITNESS_WORDS = ['fitness', 'wearable']
+POWER_WORDS = ['power', 'charging', 'charger']
+OFFICE_WORDS = ['productivity', 'work', 'office']
+WORK_WORDS = ['productivity', 'work']
+CAMERA_CATEGORY_WORDS = ['camera', 'entertainment', 'vr', 'drone', 'projector']
+ENTERTAINMENT_WORDS = ['camera', 'entertainment']
+HOME_AUTOMATION_WORDS = [
+    'automate', 'automation', 'control lights', 'voice control', 'home security', 'protect home'
+]
+AUDIO_PRODUCT_WORDS = ['earbud', 'speaker', 'headphone']
+NAMED_CAMERA_WORDS = ['security camera', 'doorbell cam', 'action camera', '4k camera']
+
+# Sides of a comparison
+WATCH_WORDS = ['smartwatch', 'watch']
+BAND_WORDS = ['fitness', 'tracker', 'band']
+EARBUDS_WORDS = ['earbuds', 'earbud']
+SOLAR_OR_WIRELESS_WORDS = ['solar', 'wireless']
+VR_WORDS = ['vr', 'headset']
+ACTION_CAMERA_WORDS = ['camera', 'action']
+DOORBELL_OR_SECURITY_WORDS = ['doorbell', 'security']
+
+# Individual products
+LED_STRIP_WORDS = ['led', 'strip light', 'mood light']
+LIGHT_BULB_WORDS = ['light bulb', 'smart bulb', 'alexa', 'google home']
+DOORBELL_CAM_WORDS = ['doorbell', 'door cam', 'doorbell cam']
+SECURITY_CAMERA_WORDS = ['security camera', 'security cam', 'surveillance']
+THERMOSTAT_WORDS = ['thermostat', 'temperature', 'heating', 'cooling']
+WIRELESS_EARBUDS_WORDS = ['earbud', 'wireless earbuds']
+HEADPHONE_WORDS = ['headphone', 'noise cancel', 'anc']
+SPEAKER_WORDS = ['speaker', 'bluetooth speaker']
+FITNESS_TRACKER_WORDS = ['fitness tracker', 'fitness band', 'health monitor']
+CHARGING_PAD_WORDS = ['wireless charging', 'charging pad', 'qi charger']
+SOLAR_CHARGER_WORDS = ['solar', 'solar charger', 'eco']
+POWER_BANK_WORDS = ['power bank', 'powerbank', 'battery pack']
+LAPTOP_STAND_WORDS = ['laptop stand', 'stand', 'ergonomic']
+KEYBOARD_WORDS = ['keyboard', 'wireless keyboard', 'foldable']
+DRONE_WORDS = ['drone', 'mini drone', 'quadcopter']
+PROJECTOR_WORDS = ['projector', 'portable projector', 'movie']
+VR_HEADSET_WORDS = ['vr', 'virtual reality', 'vr headset']
+CAMERA_WORDS = ['camera', 'action camera', '4k', 'video']
+HOME_HUB_WORDS = ['smart home', 'home hub', 'hub']
+
+# Questions and use cases
+PRICE_WORDS = ['price', 'cost', 'how much']
+BUY_WORDS = ['buy', 'order', 'purchase', 'want', 'get']
+SHIPPING_WORDS = ['shipping', 'delivery', 'ship']
+WARRANTY_WORDS = ['warranty', 'guarantee', 'return']
+FITNESS_INTENT_WORDS = [
+    'fitness', 'track health', 'workout', 'gym', 'exercise', 'run', 'running', 'steps',
+    'heart rate', 'calories', 'hydration', 'health', 'cardio', 'training', 'athlete'
+]
+SMART_HOME_INTENT_WORDS = [
+    'smart home', 'automate', 'automation', 'control lights', 'voice control', 'home security',
+    'protect home'
+]
+ENTERTAINMENT_INTENT_WORDS = [
+    'entertainment', 'gaming', 'game', 'play', 'movie', 'watch', 'stream', 'fun', 'party'
+]
+WORK_INTENT_WORDS = [
+    'work from home', 'remote work', 'productivity', 'office', 'desk setup', 'ergonomic', 'typing',
+    'computer'
+]
+TRAVEL_INTENT_WORDS = [
+    'travel', 'trip', 'vacation', 'portable', 'camping', 'adventure', 'backpack', 'on the go'
+]
+THANKS_WORDS = ['thank', 'thanks', 'thx', 'appreciate']
+SHORT_THANKS_WORDS = ['thank', 'thanks']
+GOODBYE_WORDS = ['bye', 'goodbye', 'see you', 'later', 'gotta go', 'gtg', 'talk later', 'cya']
+
+register_keywords(
+    CATALOG_WORDS, CHEAPEST_WORDS, COMPARE_WORDS, EXPLAIN_WORDS, GREETING_WORDS, BROWSE_WORDS, HOME_WORDS,
+    WEARABLE_WORDS, FITNESS_WORDS, POWER_WORDS, OFFICE_WORDS, WORK_WORDS, CAMERA_CATEGORY_WORDS,
+    ENTERTAINMENT_WORDS, HOME_AUTOMATION_WORDS, AUDIO_PRODUCT_WORDS, NAMED_CAMERA_WORDS, WATCH_WORDS,
+    BAND_WORDS, EARBUDS_WORDS, SOLAR_OR_WIRELESS_WORDS, VR_WORDS, ACTION_CAMERA_WORDS,
+    DOORBELL_OR_SECURITY_WORDS, LED_STRIP_WORDS, LIGHT_BULB_WORDS, DOORBELL_CAM_WORDS, SECURITY_CAMERA_WORDS,
+    THERMOSTAT_WORDS, WIRELESS_EARBUDS_WORDS, HEADPHONE_WORDS, SPEAKER_WORDS, FITNESS_TRACKER_WORDS,
+    CHARGING_PAD_WORDS, SOLAR_CHARGER_WORDS, POWER_BANK_WORDS, LAPTOP_STAND_WORDS, KEYBOARD_WORDS,
+    DRONE_WORDS, PROJECTOR_WORDS, VR_HEADSET_WORDS, CAMERA_WORDS, HOME_HUB_WORDS, PRICE_WORDS, BUY_WORDS,
+    SHIPPING_WORDS, WARRANTY_WORDS, FITNESS_INTENT_WORDS, SMART_HOME_INTENT_WORDS,
+    ENTERTAINMENT_INTENT_WORDS, WORK_INTENT_WORDS, TRAVEL_INTENT_WORDS, THANKS_WORDS, SHORT_THANKS_WORDS,
+    GOODBYE_WORDS, TOPIC_WORDS
+)
+
 
 def get_fallback_response(message, user_id=None):
     """
@@ -20,10 +120,11 @@ def get_fallback_response(message, user_id=None):
         message: User's message text
         user_id: User ID for conversation tracking and memory
     """
-    msg = message.lower()
+    analysis = analyze_message(message)
+    msg = analysis.lower
     
     # Handle "show all products" / "view all" requests
-    if any(phrase in msg for phrase in ['all products', 'show all', 'full catalog', 'everything you have', 'complete list', 'view all']):
+    if analysis.has_any(CATALOG_WORDS):
         return """🛍️ **COMPLETE PRODUCT CATALOG** (21 Products)
 
 💡 **SMART HOME** ($49-$450)
@@ -66,12 +167,12 @@ def get_fallback_response(message, user_id=None):
 Which product interests you? Or ask me for the cheapest in any category! 😊"""
     
     # Handle "cheapest" requests
-    if any(word in msg for word in ['cheapest', 'cheap', 'affordable', 'budget', 'least expensive', 'lowest price']):
+    if analysis.has_any(CHEAPEST_WORDS):
         # Import user memory to set the product context
         from .user_memory import set_last_product
         
         # Determine which category they're asking about
-        if 'audio' in msg:
+        if analysis.has('audio'):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Bluetooth Speaker Mini")
@@ -90,7 +191,7 @@ Amazing sound quality with 12-hour battery life. Perfect for any occasion! Compa
 
 Want to order? Contact @Store_help_bot! 🛍️"""
         
-        elif 'smart home' in msg or 'home' in msg:
+        elif analysis.has_any(HOME_WORDS):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Smart LED Strip Lights")
@@ -109,7 +210,7 @@ Want to order? Contact @Store_help_bot! 🛍️"""
 
 Want to order? Contact @Store_help_bot! 🛍️"""
         
-        elif 'wearable' in msg or 'fitness' in msg or 'tracker' in msg:
+        elif analysis.has_any(WEARABLE_WORDS):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Fitness Tracker Band")
@@ -128,7 +229,7 @@ Lightweight, waterproof, tracks calories & heart rate. For everyday health monit
 
 Want to order? Contact @Store_help_bot! 🛍️"""
         
-        elif 'power' in msg or 'charging' in msg or 'charger' in msg:
+        elif analysis.has_any(POWER_WORDS):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Wireless Charging Pad")
@@ -147,7 +248,7 @@ Sleek and fast Qi-certified charger for all devices. Goodbye cables!
 
 Want to order? Contact @Store_help_bot! 🛍️"""
         
-        elif 'productivity' in msg or 'work' in msg or 'office' in msg:
+        elif analysis.has_any(OFFICE_WORDS):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Laptop Stand Pro")
@@ -166,7 +267,7 @@ Ergonomic aluminum stand for better posture and airflow. Work comfortably all da
 
 Want to order? Contact @Store_help_bot! 🛍️"""
         
-        elif any(word in msg for word in ['camera', 'entertainment', 'vr', 'drone', 'projector']):
+        elif analysis.has_any(CAMERA_CATEGORY_WORDS):
             # Set the product in memory so buttons work correctly
             if user_id:
                 set_last_product(user_id, "Mini Drone X2")
@@ -217,9 +318,9 @@ Tracks steps, sleep, heart rate with 5-day battery!
 Which interests you? 🎯"""
     
     # Handle comparison requests
-    if any(word in msg for word in ['compare', 'vs', 'versus', 'difference between']):
+    if analysis.has_any(COMPARE_WORDS):
         # Specific product comparisons
-        if ('smartwatch' in msg or 'watch' in msg) and ('fitness' in msg or 'tracker' in msg or 'band' in msg):
+        if (analysis.has_any(WATCH_WORDS)) and (analysis.has_any(BAND_WORDS)):
             return """⚖️ **COMPARISON: Smartwatch X vs Fitness Tracker Band**
 
 ⌚ **Smartwatch X - $59**
@@ -246,7 +347,7 @@ Which interests you? 🎯"""
 
 Which one fits your needs? 🎯"""
         
-        elif ('earbuds' in msg or 'earbud' in msg) and ('headphone' in msg):
+        elif (analysis.has_any(EARBUDS_WORDS)) and (analysis.has('headphone')):
             return """⚖️ **COMPARISON: Wireless Earbuds Pro vs Noise-Cancelling Headphones**
 
 🎧 **Wireless Earbuds Pro - $79**
@@ -272,7 +373,7 @@ Which one fits your needs? 🎯"""
 
 Which suits your lifestyle? 🎯"""
         
-        elif ('speaker' in msg and 'earbuds' in msg) or ('speaker' in msg and 'headphone' in msg):
+        elif (analysis.has('speaker') and analysis.has('earbuds')) or (analysis.has('speaker') and analysis.has('headphone')):
             return """⚖️ **AUDIO PRODUCT COMPARISON**
 
 🔊 **Bluetooth Speaker Mini - $29**
@@ -303,7 +404,7 @@ Which suits your lifestyle? 🎯"""
 
 What's your main use case? 🎯"""
         
-        elif 'power bank' in msg and ('solar' in msg or 'wireless' in msg):
+        elif analysis.has('power bank') and (analysis.has_any(SOLAR_OR_WIRELESS_WORDS)):
             return """⚖️ **POWER SOLUTIONS COMPARISON**
 
 🔋 **Power Bank 20000mAh - $300**
@@ -335,7 +436,7 @@ What's your main use case? 🎯"""
 
 What's your primary need? 🎯"""
         
-        elif ('vr' in msg or 'headset' in msg) and ('projector' in msg):
+        elif (analysis.has_any(VR_WORDS)) and (analysis.has('projector')):
             return """⚖️ **COMPARISON: VR Headset Max vs Portable Projector Pro**
 
 🥽 **VR Headset Max - $480**
@@ -361,7 +462,7 @@ What's your primary need? 🎯"""
 
 What's your entertainment style? 🎯"""
         
-        elif ('drone' in msg) and ('camera' in msg or 'action' in msg):
+        elif (analysis.has('drone')) and (analysis.has_any(ACTION_CAMERA_WORDS)):
             return """⚖️ **COMPARISON: Mini Drone X2 vs 4K Action Camera**
 
 🚁 **Mini Drone X2 - $250**
@@ -388,7 +489,7 @@ What's your entertainment style? 🎯"""
 
 What type of content do you create? 🎯"""
         
-        elif ('laptop stand' in msg) and ('keyboard' in msg):
+        elif (analysis.has('laptop stand')) and (analysis.has('keyboard')):
             return """⚖️ **COMPARISON: Laptop Stand Pro vs Foldable Wireless Keyboard**
 
 💻 **Laptop Stand Pro - $75**
@@ -414,7 +515,7 @@ What type of content do you create? 🎯"""
 
 What's your work style? 🎯"""
         
-        elif ('doorbell' in msg or 'security' in msg) and ('camera' in msg):
+        elif (analysis.has_any(DOORBELL_OR_SECURITY_WORDS)) and (analysis.has('camera')):
             return """⚖️ **COMPARISON: Smart Doorbell Cam vs Smart Security Camera**
 
 🔔 **Smart Doorbell Cam - $190**
@@ -459,9 +560,9 @@ Or pick any two products to compare!
 Which products would you like me to compare? 🤔"""
     
     # Bundle request handling (keep existing code)
-    if 'bundle' in msg and not any(word in msg for word in ['what is', 'tell me about', 'explain']):
+    if analysis.has('bundle') and not analysis.has_any(EXPLAIN_WORDS):
         # Check which bundle they're asking about
-        if 'audio' in msg:
+        if analysis.has('audio'):
             return """🎁 **AUDIO BUNDLE** - Save $20!
 
 Get all 3 audio products for just **$268** (Regular $288)
@@ -478,7 +579,7 @@ Get all 3 audio products for just **$268** (Regular $288)
 
 Ready to order? Contact @Store_help_bot! 🛍️"""
         
-        elif 'smart home' in msg:
+        elif analysis.has('smart home'):
             return """🎁 **SMART HOME BUNDLES:**
 
 **💡 Lighting Starter - $148** (Save $25!)
@@ -494,7 +595,7 @@ Ready to order? Contact @Store_help_bot! 🛍️"""
 
 Which bundle interests you? Contact @Store_help_bot to order! 🏠"""
         
-        elif 'fitness' in msg or 'wearable' in msg:
+        elif analysis.has_any(FITNESS_WORDS):
             return """🎁 **FITNESS BUNDLE** - Save $15!
 
 Get both wearables for just **$79** (Regular $94)
@@ -535,16 +636,16 @@ Which bundle interests you? 🎯"""
     
     # Priority 1: Use natural conversation handler for product-specific discussions
     # This maintains conversation context and gives human-like responses with memory
-    conversation_response = handle_conversation(user_id, message)
+    conversation_response = handle_conversation(user_id, analysis)
     
     # If conversation handler gave a meaningful response (not the generic greeting), use it
     if conversation_response and not conversation_response.startswith("Hey there!"):
         return conversation_response
     
-    if any(word in msg for word in ['hi', 'hello', 'hey', 'start']):
+    if analysis.has_any(GREETING_WORDS):
         return "👋 Hello! I'm Alex from KMGMedia Design & Technologies! With 7 years in tech sales, I've helped thousands find their perfect gadgets. We have 21 amazing products ranging from $29 to $850 - Smart Home, Audio, Wearables, Cameras, and more! What brings you in today?"
     
-    if any(word in msg for word in ['product', 'sell', 'have', 'what', 'show', 'all', 'catalog', 'list']):
+    if analysis.has_any(BROWSE_WORDS):
         return """🛍️ **Our Complete Product Catalog** (20 Items):
 
 💡 **SMART HOME** ($49-$450)
@@ -582,7 +683,7 @@ Which bundle interests you? 🎯"""
 Which category interests you?"""
     
     # Category browsing (MUST be before individual product detection!)
-    if ('smart home' in msg or msg.strip() == 'smart home') and not any(word in msg for word in ['automate', 'automation', 'control lights', 'voice control', 'home security', 'protect home']):
+    if (analysis.has('smart home') or msg.strip() == 'smart home') and not analysis.has_any(HOME_AUTOMATION_WORDS):
         return """🏠 **SMART HOME PRODUCTS** (6 Items):
 
 💡 **Smart LED Strip Lights** - $49
@@ -618,7 +719,7 @@ All 6 smart home products!
 
 Which product or bundle interests you? 🎯"""
     
-    if 'audio' in msg and not any(word in msg for word in ['earbud', 'speaker', 'headphone']):
+    if analysis.has('audio') and not analysis.has_any(AUDIO_PRODUCT_WORDS):
         return """🎧 **AUDIO PRODUCTS** (3 Items):
 
 🔊 **Bluetooth Speaker Mini** - $29
@@ -638,7 +739,7 @@ Get all 3 audio products for just **$268** (Regular $288)
 
 Which audio product interests you? Or type "bundle" to get them all! 🎵"""
     
-    if 'wearable' in msg:
+    if analysis.has('wearable'):
         return """⌚ **WEARABLES** (2 Items):
 
 💪 **Fitness Tracker Band** - $35
@@ -655,7 +756,7 @@ Get both wearables for just **$79** (Regular $94)
 
 Which one fits your lifestyle? Or get the bundle! 💪"""
     
-    if 'power' in msg and 'charging' in msg:
+    if analysis.has('power') and analysis.has('charging'):
         return """🔋 **POWER & CHARGING** (3 Items):
 
 ⚡ **Wireless Charging Pad** - $45
@@ -675,7 +776,7 @@ Get all 3 power products for just **$409** (Regular $444)
 
 Which power solution do you need? 🔌"""
     
-    if 'productivity' in msg or ('work' in msg and 'work from home' not in msg):
+    if analysis.has('productivity') or (analysis.has('work') and not analysis.has('work from home')):
         return """💻 **PRODUCTIVITY** (2 Items):
 
 💻 **Laptop Stand Pro** - $75
@@ -692,7 +793,7 @@ Get both for just **$144** (Regular $164)
 
 Which one interests you? Or grab the bundle! 💼"""
     
-    if ('camera' in msg or 'entertainment' in msg) and not any(word in msg for word in ['security camera', 'doorbell cam', 'action camera', '4k camera']):
+    if (analysis.has_any(ENTERTAINMENT_WORDS)) and not analysis.has_any(NAMED_CAMERA_WORDS):
         return """📹 **CAMERAS & ENTERTAINMENT** (4 Items):
 
 🚁 **Mini Drone X2** - $250
@@ -717,72 +818,72 @@ Which one excites you most? 🎬"""
     
     # Smart Home Products (individual items)
 
-    if 'led' in msg or 'strip light' in msg or 'mood light' in msg:
+    if analysis.has_any(LED_STRIP_WORDS):
         return "💡 Smart LED Strip Lights - $49! Customizable colors via app control. Set the mood for any room or event. Perfect for gaming setups, bedrooms, or parties! Want one?"
     
-    if 'light bulb' in msg or 'smart bulb' in msg or 'alexa' in msg or 'google home' in msg:
+    if analysis.has_any(LIGHT_BULB_WORDS):
         return "💡 Smart Light Bulb 4-Pack - $99! Voice-controlled bulbs with 16M colors. Works with Alexa and Google Home. Transform your home lighting! Interested?"
     
-    if 'doorbell' in msg or 'door cam' in msg or 'doorbell cam' in msg:
+    if analysis.has_any(DOORBELL_CAM_WORDS):
         return "� Smart Doorbell Cam - $190! See and talk to visitors from anywhere. Real-time motion alerts included. Never miss a delivery! Want to learn more?"
     
-    if 'security camera' in msg or 'security cam' in msg or 'surveillance' in msg:
+    if analysis.has_any(SECURITY_CAMERA_WORDS):
         return "🎥 Smart Security Camera - $210! 1080p live feed, night vision, and motion alerts. Keep your home safe 24/7. Peace of mind guaranteed! Interested?"
     
-    if 'thermostat' in msg or 'temperature' in msg or 'heating' in msg or 'cooling' in msg:
+    if analysis.has_any(THERMOSTAT_WORDS):
         return "�️ Smart Thermostat - $220! Adjust temperature with your phone or voice assistant. Save energy in style and reduce bills! Want one?"
     
     # Audio Products
-    if 'earbud' in msg or 'wireless earbuds' in msg:
+    if analysis.has_any(WIRELESS_EARBUDS_WORDS):
         return "🎧 Wireless Earbuds Pro - $79! Noise cancelling, waterproof, and perfect for workouts and commuting! Great sound quality. Interested?"
     
-    if 'headphone' in msg or 'noise cancel' in msg or 'anc' in msg:
+    if analysis.has_any(HEADPHONE_WORDS):
         return "🎧 Noise-Cancelling Headphones - $180! Immersive sound and comfort for travelers and creators. Block out the world, focus on what matters! Want them?"
     
-    if 'speaker' in msg or 'bluetooth speaker' in msg:
+    if analysis.has_any(SPEAKER_WORDS):
         return "🔊 Bluetooth Speaker Mini - $29! Amazing sound quality with 12-hour battery life. Perfect for any occasion! Great value! Interested?"
     
     # Wearables
-    if 'watch' in msg or 'smartwatch' in msg:
+    if analysis.has_any(WATCH_WORDS):
         return "⌚ Smartwatch X - $59! Tracks steps, sleep, and heart rate. Perfect for fitness enthusiasts! Great deal! Want one?"
     
-    if 'fitness tracker' in msg or 'fitness band' in msg or 'health monitor' in msg:
+    if analysis.has_any(FITNESS_TRACKER_WORDS):
         return "💪 Fitness Tracker Band - $35! Lightweight, waterproof, tracks calories and heart rate. For everyday health monitoring. Affordable fitness! Interested?"
     
     # Power & Charging
-    if 'wireless charging' in msg or 'charging pad' in msg or 'qi charger' in msg:
+    if analysis.has_any(CHARGING_PAD_WORDS):
         return "⚡ Wireless Charging Pad - $45! Sleek and fast Qi-certified charger for all devices. Goodbye cables! Clean and convenient! Want one?"
     
-    if 'solar' in msg or 'solar charger' in msg or 'eco' in msg:
+    if analysis.has_any(SOLAR_CHARGER_WORDS):
         return "☀️ Portable Solar Charger - $99! Eco-friendly energy solution for camping and travel lovers. Never run out of power outdoors! Interested?"
     
-    if 'power bank' in msg or 'powerbank' in msg or 'battery pack' in msg:
+    if analysis.has_any(POWER_BANK_WORDS):
         return "🔋 Power Bank 20000mAh - $300! Fast-charging with dual USB ports - charge multiple devices at once! Never run out of power! Want one?"
     
     # Productivity
-    if 'laptop stand' in msg or 'stand' in msg or 'ergonomic' in msg:
+    if analysis.has_any(LAPTOP_STAND_WORDS):
         return "💻 Laptop Stand Pro - $75! Ergonomic aluminum stand for better posture and airflow. Work comfortably all day! Interested?"
     
-    if 'keyboard' in msg or 'wireless keyboard' in msg or 'foldable' in msg:
+    if analysis.has_any(KEYBOARD_WORDS):
         return "⌨️ Foldable Wireless Keyboard - $89! Portable Bluetooth keyboard that fits in your bag. Perfect for remote work and travel! Want one?"
     
     # Cameras & Entertainment
-    if 'drone' in msg or 'mini drone' in msg or 'quadcopter' in msg:
+    if analysis.has_any(DRONE_WORDS):
         return "🚁 Mini Drone X2 - $250! Compact drone with HD camera, gesture control, and obstacle avoidance. Perfect for aerial photography! Interested?"
     
-    if 'projector' in msg or 'portable projector' in msg or 'movie' in msg:
+    if analysis.has_any(PROJECTOR_WORDS):
         return "📽️ Portable Projector Pro - $320! Pocket-sized projector with HDMI and wireless casting. Movie nights, anywhere! Cinema in your pocket! Want it?"
     
-    if 'vr' in msg or 'virtual reality' in msg or 'vr headset' in msg:
+    if analysis.has_any(VR_HEADSET_WORDS):
         return "🥽 VR Headset Max - $480! Immersive gaming and exploration. Compatible with major devices. Step into another world! Interested?"
     
-    if 'camera' in msg or 'action camera' in msg or '4k' in msg or 'video' in msg:
+    if analysis.has_any(CAMERA_WORDS):
         return "📹 4K Action Camera - $850! Capture stunning 4K videos with professional image stabilization. Waterproof and rugged for extreme adventures! Want one?"
     
-    if 'smart home' in msg or 'home hub' in msg or 'hub' in msg:
+    if analysis.has_any(HOME_HUB_WORDS):
         return "🏠 Smart Home Hub - $450! Control all your smart devices from one central hub - lights, thermostats, security, and more! Make your home smarter! Interested?"
     
-    if 'price' in msg or 'cost' in msg or 'how much' in msg:
+    if analysis.has_any(PRICE_WORDS):
         return """💰 **Our Price Range:**
 
 **Budget-Friendly** ($29-$59)
@@ -796,17 +897,17 @@ Which one excites you most? 🎬"""
 
 Which price range interests you?"""
     
-    if any(word in msg for word in ['buy', 'order', 'purchase', 'want', 'get']):
+    if analysis.has_any(BUY_WORDS):
         return "🎉 Awesome! I'd love to help you with that! To complete your order:\n\n1️⃣ Tell me which product(s) you want\n2️⃣ Contact our team at @Store_help_bot\n3️⃣ We'll send payment & shipping details\n\n✅ Free shipping on orders over $100\n✅ 30-day money-back guarantee\n✅ 1-year warranty on all products\n\nWhich product are you interested in?"
     
-    if 'shipping' in msg or 'delivery' in msg or 'ship' in msg:
+    if analysis.has_any(SHIPPING_WORDS):
         return "📦 Shipping Information:\n\n✅ Free shipping on orders over $100\n✅ Standard delivery: 5-7 business days\n✅ Express delivery: 2-3 business days (+$15)\n✅ Track your order online\n\nWe ship worldwide! 🌍"
     
-    if 'warranty' in msg or 'guarantee' in msg or 'return' in msg:
+    if analysis.has_any(WARRANTY_WORDS):
         return "🛡️ Protection & Returns:\n\n✅ 30-day money-back guarantee\n✅ 1-year warranty on all products\n✅ Free returns on defective items\n✅ Easy exchange process\n\nYour satisfaction is our priority! 💯"
     
     # Fitness Intent Detection with Smart Bundles
-    if any(word in msg for word in ['fitness', 'track health', 'workout', 'gym', 'exercise', 'run', 'running', 'steps', 'heart rate', 'calories', 'hydration', 'health', 'cardio', 'training', 'athlete']):
+    if analysis.has_any(FITNESS_INTENT_WORDS):
         return """💪 **Fitness & Health Tracking Solutions!**
 
 **Individual Products:**
@@ -847,7 +948,7 @@ Immersive sound for focused training sessions.
 Which option works best for your fitness goals? 🏋️"""
     
     # Smart Home Intent Detection
-    if any(word in msg for word in ['smart home', 'automate', 'automation', 'control lights', 'voice control', 'home security', 'protect home']):
+    if analysis.has_any(SMART_HOME_INTENT_WORDS):
         return """🏠 **Smart Home Solutions!**
 
 **Individual Products:**
@@ -879,7 +980,7 @@ Which option works best for your fitness goals? 🏋️"""
 Ready to make your home smarter? 🎯"""
     
     # Entertainment/Gaming Intent
-    if any(word in msg for word in ['entertainment', 'gaming', 'game', 'play', 'movie', 'watch', 'stream', 'fun', 'party']):
+    if analysis.has_any(ENTERTAINMENT_INTENT_WORDS):
         return """🎮 **Entertainment & Gaming Setup!**
 
 **Individual Products:**
@@ -913,7 +1014,7 @@ Ready to make your home smarter? 🎯"""
 What's your entertainment style? 🎯"""
     
     # Work from Home / Productivity Intent
-    if any(word in msg for word in ['work from home', 'remote work', 'productivity', 'office', 'desk setup', 'ergonomic', 'typing', 'computer']):
+    if analysis.has_any(WORK_INTENT_WORDS):
         return """💼 **Work From Home & Productivity Setup!**
 
 **Individual Products:**
@@ -944,7 +1045,7 @@ What's your entertainment style? 🎯"""
 Ready to upgrade your workspace? 🚀"""
     
     # Travel Intent
-    if any(word in msg for word in ['travel', 'trip', 'vacation', 'portable', 'camping', 'adventure', 'backpack', 'on the go']):
+    if analysis.has_any(TRAVEL_INTENT_WORDS):
         return """✈️ **Travel & Adventure Essentials!**
 
 **Individual Products:**
@@ -981,11 +1082,11 @@ Ready to upgrade your workspace? 🚀"""
 Where's your next adventure? 🌍"""
     
     # Thank you
-    if 'thank' in msg or 'thanks' in msg or 'thx' in msg or 'appreciate' in msg:
+    if analysis.has_any(THANKS_WORDS):
         return "😊 You're very welcome! Happy to help! Let me know if you need anything else! 🛍️"
     
     # Goodbye/Farewell
-    if any(word in msg for word in ['bye', 'goodbye', 'see you', 'later', 'gotta go', 'gtg', 'talk later', 'cya']):
+    if analysis.has_any(GOODBYE_WORDS):
         return "Goodbye! 👋 Thanks for visiting! Feel free to come back anytime you need help. Have a great day! 😊"
     
     # Help request
@@ -1022,7 +1123,7 @@ Just ask me anything! What would you like to know? 🎯"""
 Type a category or use case!"""
     
     # Category browsing
-    if ('smart home' in msg or msg.strip() == 'smart home') and not any(word in msg for word in ['automate', 'automation', 'control lights', 'voice control', 'home security', 'protect home']):
+    if (analysis.has('smart home') or msg.strip() == 'smart home') and not analysis.has_any(HOME_AUTOMATION_WORDS):
         return """🏠 **SMART HOME PRODUCTS** (6 Items):
 
 💡 **Smart LED Strip Lights** - $49
@@ -1058,7 +1159,7 @@ All 6 smart home products!
 
 Which product or bundle interests you? 🎯"""
     
-    if 'audio' in msg and not any(word in msg for word in ['earbud', 'speaker', 'headphone']):
+    if analysis.has('audio') and not analysis.has_any(AUDIO_PRODUCT_WORDS):
         return """🎧 **AUDIO PRODUCTS** (3 Items):
 
 🔊 **Bluetooth Speaker Mini** - $29
@@ -1078,7 +1179,7 @@ Get all 3 audio products for just **$268** (Regular $288)
 
 Which audio product interests you? Or type "bundle" to get them all! 🎵"""
     
-    if 'wearable' in msg:
+    if analysis.has('wearable'):
         return """⌚ **WEARABLES** (2 Items):
 
 💪 **Fitness Tracker Band** - $35
@@ -1095,7 +1196,7 @@ Get both wearables for just **$79** (Regular $94)
 
 Which one fits your lifestyle? Or get the bundle! 💪"""
     
-    if 'power' in msg and 'charging' in msg:
+    if analysis.has('power') and analysis.has('charging'):
         return """🔋 **POWER & CHARGING** (3 Items):
 
 ⚡ **Wireless Charging Pad** - $45
@@ -1115,7 +1216,7 @@ Get all 3 power products for just **$409** (Regular $444)
 
 Which power solution do you need? 🔌"""
     
-    if 'productivity' in msg or 'work' in msg and not 'work from home' in msg:
+    if analysis.has_any(WORK_WORDS) and not analysis.has('work from home'):
         return """💻 **PRODUCTIVITY** (2 Items):
 
 💻 **Laptop Stand Pro** - $75
@@ -1132,7 +1233,7 @@ Get both for just **$144** (Regular $164)
 
 Which one interests you? Or grab the bundle! 💼"""
     
-    if 'camera' in msg or 'entertainment' in msg:
+    if analysis.has_any(ENTERTAINMENT_WORDS):
         return """📹 **CAMERAS & ENTERTAINMENT** (4 Items):
 
 🚁 **Mini Drone X2** - $250
@@ -1155,7 +1256,7 @@ Get all 4 for just **$1,780** (Regular $1,900)
 
 Which one excites you most? 🎬"""
     
-    if 'thank' in msg or 'thanks' in msg:
+    if analysis.has_any(SHORT_THANKS_WORDS):
         return "😊 You're welcome! Happy to help! Let me know if you need anything else!"
     
     return """I'm here to help you find the perfect tech product! 🛍️
@@ -0,0 +1,227 @@
+"""
+Semantic Cache Module
+Finds earlier answers to paraphrased questions ("price of the smartwatch?" vs
+"how much is smartwatch x") with a local hashed character n-gram vectorizer,
+accepting a match only when the two questions also share most content words
+"""
+import os
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Semantic cache configuration (override via environment)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '10000'))
+SEMANTIC_CACHE_DIM = int(os.getenv('SEMANTIC_CACHE_DIM', '512'))
+
+# Minimum share (Jaccard) of content words two questions must have in common, so
+# "battery life" never matches "battery size" however close their n-grams are
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv('SEMANTIC_CACHE_MIN_OVERLAP', '0.5'))
+
+# Words that carry no meaning for matching questions
+_STOP_WORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'of', 'do', 'does', 'did', 'what', 'whats',
+    'your', 'you', 'for', 'me', 'i', 'my', 'can', 'could', 'to', 'tell', 'about',
+    'on', 'in', 'and', 'or', 'be', 'there', 'any', 'know', 'want', 'would', 'like',
+    'have', 'has'
+}
+
+_INITIAL_CAPACITY = 256
+
+
+def content_words(text: str) -> frozenset:
+    """Words of a (normalized) message that carry meaning, plurals folded ("options" -> "option")"""
+    words = set()
+    for word in text.split():
+        if word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+
+def word_overlap(a: frozenset, b: frozenset) -> float:
+    """Jaccard overlap of two content word sets"""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def is_available() -> bool:
+    """True if NumPy is installed and the semantic cache is enabled"""
+    return np is not None and SEMANTIC_CACHE_ENABLED
+
+
+class HashedNgramVectorizer:
+    """
+    Embeds text as a unit vector of signed, hashed character n-gram counts
+
+    Stateless (no vocabulary to fit), so vectors stay comparable across restarts.
+    """
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM, ngram_sizes=(3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def transform(self, text: str):
+        """
+        Vectorize one (normalized) message
+
+        Args:
+            text: Message text, ideally from response_cache.normalize_message()
+
+        Returns:
+            float32 array of shape (dim,) with unit L2 norm (all zeros for empty text)
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            if word in _STOP_WORDS:
+                continue
+            padded = f" {word} "
+            for n in self.ngram_sizes:
+                for i in range(len(padded) - n + 1):
+                    h = zlib.crc32(padded[i:i + n].encode('utf-8'))
+                    vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """
+    Bounded matrix of past query vectors and their answers
+
+    Rows are only compared within the same scope (the product or FAQ topic a
+    question is about), so "price of the speaker" never matches the smartwatch
+    answer. A row above the similarity threshold must also share min_overlap of
+    its content words with the question. When full, the least recently used row
+    is overwritten.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds: float = None, dim: int = SEMANTIC_CACHE_DIM,
+                 min_overlap: float = SEMANTIC_CACHE_MIN_OVERLAP):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.ttl_seconds = ttl_seconds
+        self.vectorizer = HashedNgramVectorizer(dim)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        capacity = min(_INITIAL_CAPACITY, self.max_entries)
+        self._vectors = np.zeros((capacity, self.vectorizer.dim), dtype=np.float32)
+        self._scopes = np.full(capacity, -1, dtype=np.int32)
+        self._stored_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._answers = [None] * capacity
+        self._words = [frozenset()] * capacity
+        self._scope_ids = {}
+        self._size = 0
+
+    def clear(self):
+        """Drop every entry and release the matrix"""
+        with self._lock:
+            self._reset()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the vector matrix and bookkeeping arrays"""
+        return (self._vectors.nbytes + self._scopes.nbytes
+                + self._stored_at.nbytes + self._last_used.nbytes)
+
+    def _scope_id(self, scope, create: bool):
+        scope_id = self._scope_ids.get(scope)
+        if scope_id is None and create:
+            scope_id = self._scope_ids[scope] = len(self._scope_ids)
+        return scope_id
+
+    def _grow(self):
+        """Double the matrix, up to max_entries rows"""
+        capacity = min(len(self._scopes) * 2, self.max_entries)
+        extra = capacity - len(self._scopes)
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self.vectorizer.dim), dtype=np.float32)])
+        self._scopes = np.concatenate([self._scopes, np.full(extra, -1, dtype=np.int32)])
+        self._stored_at = np.concatenate([self._stored_at, np.zeros(extra)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra)])
+        self._answers.extend([None] * extra)
+        self._words.extend([frozenset()] * extra)
+
+    def _free_row(self) -> int:
+        """Index of the row to write next (grows the matrix or evicts the LRU row)"""
+        if self._size < len(self._scopes):
+            return self._size
+        if len(self._scopes) < self.max_entries:
+            self._grow()
+            return self._size
+        return int(np.argmin(self._last_used))
+
+    def lookup(self, text: str, scope=None):
+        """
+        Find the answer to the most similar earlier question
+
+        Args:
+            text: Normalized message
+            scope: Product/topic the message is about
+
+        Returns:
+            Tuple (answer, similarity) or None if nothing passes the threshold
+        """
+        vector = self.vectorizer.transform(text)
+        if not vector.any():
+            return None
+        now = time.monotonic()
+        with self._lock:
+            scope_id = self._scope_id(scope, create=False)
+            if scope_id is None or not self._size:
+                return None
+            scores = self._vectors[:self._size] @ vector
+            scores[self._scopes[:self._size] != scope_id] = -1.0
+            if self.ttl_seconds:
+                scores[now - self._stored_at[:self._size] >= self.ttl_seconds] = -1.0
+            words = content_words(text)
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for row in candidates[np.argsort(-scores[candidates])]:
+                if word_overlap(words, self._words[row]) >= self.min_overlap:
+                    self._last_used[row] = now
+                    return self._answers[row], float(scores[row])
+            return None
+
+    def add(self, text: str, answer: str, scope=None):
+        """
+        Remember the answer to a question
+
+        Args:
+            text: Normalized message
+            answer: Cached answer (returned as-is by lookup)
+            scope: Product/topic the message is about
+        """
+        vector = self.vectorizer.transform(text)
+        if not vector.any():
+            return
+        now = time.monotonic()
+        with self._lock:
+            row = self._free_row()
+            if row == self._size:
+                self._size += 1
+            self._vectors[row] = vector
+            self._scopes[row] = self._scope_id(scope, create=True)
+            self._stored_at[row] = now
+            self._last_used[row] = now
+            self._answers[row] = answer
+            self._words[row] = content_words(text)
+
+
+if np is None and SEMANTIC_CACHE_ENABLED:
+    print("⚠️ numpy not installed - semantic response cache disabled", file=sys.stderr)
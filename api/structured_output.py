@@ -0,0 +1,128 @@
+"""
+Structured Output Module
+JSON response-schema mode for Gemini: one call returns the reply text together
+with the catalog product it is about and the customer's intent
+"""
+import json
+import os
+import re
+
+try:
+    from . import metrics
+    from .product_data import detect_product, get_all_products
+except ImportError:
+    import metrics
+    from product_data import detect_product, get_all_products
+
+GEMINI_STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'false').lower() in ('1', 'true', 'yes')
+
+INTENTS = ('browse', 'product_info', 'price', 'compare', 'recommend', 'purchase', 'support', 'smalltalk', 'other')
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+# "field": "value" - the value may be cut off when the reply hit the output-token cap
+_FIELD = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)'
+
+
+def response_schema():
+    """
+    responseSchema for generateContent (OpenAPI subset)
+
+    Returns:
+        Schema with the reply text, the catalog product (or null) and the intent
+    """
+    return {
+        'type': 'OBJECT',
+        'properties': {
+            'reply': {'type': 'STRING', 'description': "Your message to the customer"},
+            'product': {'type': 'STRING', 'enum': get_all_products(), 'nullable': True,
+                        'description': "Catalog product the reply is mainly about, null if none"},
+            'intent': {'type': 'STRING', 'enum': list(INTENTS), 'description': "What the customer wants"}
+        },
+        'required': ['reply', 'product', 'intent'],
+        'propertyOrdering': ['reply', 'product', 'intent']
+    }
+
+
+def _catalog_product(value):
+    """Map the model's product value onto a catalog name (None if it names none)"""
+    if not value or not isinstance(value, str):
+        return None
+    for name in get_all_products():
+        if name.lower() == value.strip().lower():
+            return name
+    return detect_product(value)
+
+
+def _decode(raw):
+    """Decode the body of a JSON string (as-is if it has invalid escapes)"""
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
+
+
+def _result(fields, how):
+    reply = fields.get('reply')
+    if not isinstance(reply, str) or not reply.strip():
+        return None
+    intent = fields.get('intent')
+    metrics.incr(f'gemini.structured.{how}')
+    return {
+        'reply': reply.strip(),
+        'product': _catalog_product(fields.get('product')),
+        'intent': intent if intent in INTENTS else 'other'
+    }
+
+
+def parse_structured_reply(text):
+    """
+    Parse a structured Gemini reply, repairing malformed JSON where possible
+
+    Tries, in order: the JSON as sent (minus code fences), the outermost {...}
+    object, then field-by-field extraction (handles trailing commas and replies
+    cut off at the token cap). Text that isn't JSON at all is taken as the reply.
+
+    Args:
+        text: Raw text of the model's answer
+
+    Returns:
+        Dict with 'reply', 'product' (catalog name or None) and 'intent',
+        or None if no reply text can be recovered
+    """
+    text = _FENCE.sub('', (text or '').strip())
+    if not text:
+        metrics.incr('gemini.structured.failed')
+        return None
+
+    try:
+        fields = json.loads(text)
+        result = _result(fields, 'parsed') if isinstance(fields, dict) else None
+        if result:
+            return result
+    except ValueError:
+        pass
+
+    start, end = text.find('{'), text.rfind('}')
+    if 0 <= start < end:
+        try:
+            fields = json.loads(text[start:end + 1])
+            if isinstance(fields, dict):
+                result = _result(fields, 'repaired')
+                if result:
+                    return result
+        except ValueError:
+            pass
+
+    fields = {}
+    for name in ('reply', 'product', 'intent'):
+        match = re.search(_FIELD.format(name), text)
+        if match:
+            fields[name] = _decode(match.group(1))
+    if fields.get('reply'):
+        return _result(fields, 'repaired')
+
+    if start < 0:
+        return _result({'reply': text}, 'unstructured')
+    metrics.incr('gemini.structured.failed')
+    return None
@@ -4,14 +4,127 @@ Telegram Bot API interaction handlers
 import os
 import requests
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+try:
+    from . import media_cache, metrics
+    from .telegram_outbound import get_scheduler, INTERACTIVE, BULK
+except ImportError:
+    import media_cache
+    import metrics
+    from telegram_outbound import get_scheduler, INTERACTIVE, BULK
+
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '')
 
-def send_message(chat_id, text, reply_markup=None):
+# Bot API base URL (point at a local stub for load tests)
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org').rstrip('/')
+
+
+# Streamed replies: minimum seconds between interim edits, and the marker shown while typing
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+STREAM_CURSOR = ' ▌'
+
+# Per-thread inline reply capture state (see inline_reply_capture)
+_inline_reply_state = threading.local()
+
+
+# Send through the rate-limited outbound scheduler (false = post directly)
+TELEGRAM_OUTBOUND_SCHEDULER = os.getenv('TELEGRAM_OUTBOUND_SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+
+
+def api_url(method):
+    """Build the Bot API URL for a method"""
+    return f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}/{method}"
+
+
+def _post(method, payload, timeout=10, priority=INTERACTIVE):
+    """
+    Call a Bot API method and return the parsed JSON response
+    
+    Args:
+        method: Bot API method name
+        payload: JSON body
+        timeout: HTTP timeout in seconds
+        priority: INTERACTIVE (user-facing replies) or BULK (broadcasts)
+    """
+    if not TELEGRAM_OUTBOUND_SCHEDULER:
+        return requests.post(api_url(method), json=payload, timeout=timeout).json()
+    return get_scheduler().call(method, api_url(method), payload, timeout=timeout, priority=priority)
+
+
+@contextmanager
+def inline_reply_capture():
+    """
+    Capture the primary reply so the webhook can return it in its HTTP response
+    
+    Inside the block, send_message and edit_message hold back their call
+    instead of posting it. Only the latest held call is kept: whenever another
+    call has to go out (a newer reply, a photo or media group), the held one
+    is posted first so chat order is preserved. answer_callback_query always
+    goes out directly. If the block raises, the held call is posted before the
+    exception propagates.
+    
+    Yields:
+        Dict whose 'reply' key holds the captured (method, payload) on exit, or None
+    """
+    capture = {'reply': None}
+    _inline_reply_state.capture = capture
+    try:
+        yield capture
+    except Exception:
+        _inline_reply_state.capture = None
+        _post_held_reply(capture)
+        raise
+    finally:
+        _inline_reply_state.capture = None
+
+
+def is_capturing_inline_reply():
+    """Whether replies on this thread are being held for the webhook response"""
+    return getattr(_inline_reply_state, 'capture', None) is not None
+
+
+def _hold_inline_reply(method, payload):
+    """
+    Hold a reply for the webhook response if a capture is active
+    
+    Returns:
+        True if the call was held and must not be posted
+    """
+    capture = getattr(_inline_reply_state, 'capture', None)
+    if capture is None:
+        return False
+    _post_held_reply(capture)
+    capture['reply'] = (method, payload)
+    return True
+
+
+def flush_inline_reply():
+    """Post the held reply now (call before any outbound call that must come after it)"""
+    capture = getattr(_inline_reply_state, 'capture', None)
+    if capture is not None:
+        _post_held_reply(capture)
+
+
+def _post_held_reply(capture):
+    """Send a held reply through the normal outbound path"""
+    held = capture['reply']
+    if held is None:
+        return
+    capture['reply'] = None
+    method, payload = held
+    try:
+        _post(method, payload)
+    except Exception as e:
+        print(f"Error sending held {method}: {e}", file=sys.stderr)
+
+def send_message(chat_id, text, reply_markup=None, priority=INTERACTIVE, parse_mode='Markdown'):
     """
     Send a message to a Telegram chat.
     
@@ -19,39 +132,45 @@ def send_message(chat_id, text, reply_markup=None):
         chat_id: The chat ID to send to
         text: Message text
         reply_markup: Optional inline keyboard markup (dict)
+        priority: INTERACTIVE or BULK (bulk sends wait behind user-facing replies)
+        parse_mode: Telegram parse mode (None for plain text)
     """
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {
         'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'Markdown'
+        'text': text
     }
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
     
     if reply_markup:
         payload['reply_markup'] = reply_markup
     
+    if _hold_inline_reply('sendMessage', payload):
+        return {'ok': True, 'inline': True}
+    
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        return response.json()
+        return _post('sendMessage', payload, priority=priority)
     except Exception as e:
         print(f"Error sending message: {e}", file=sys.stderr)
         return None
 
 
-def send_photo(chat_id, photo_url, caption=None, reply_markup=None):
+def send_photo(chat_id, photo_url, caption=None, reply_markup=None, priority=INTERACTIVE):
     """
     Send a photo to a Telegram chat.
     
+    URLs that were uploaded before are sent by their cached file_id.
+    
     Args:
         chat_id: The chat ID to send to
         photo_url: URL or file_id of the photo
         caption: Optional caption text
         reply_markup: Optional inline keyboard markup (dict)
+        priority: INTERACTIVE or BULK
     """
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendPhoto"
     payload = {
         'chat_id': chat_id,
-        'photo': photo_url,
+        'photo': media_cache.resolve(photo_url),
         'parse_mode': 'Markdown'
     }
     
@@ -61,31 +180,43 @@ def send_photo(chat_id, photo_url, caption=None, reply_markup=None):
     if reply_markup:
         payload['reply_markup'] = reply_markup
     
+    flush_inline_reply()
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        return response.json()
+        response = _post('sendPhoto', payload, priority=priority)
+        
+        # Cached file_id rejected (e.g. bot token changed) - upload from the URL again
+        if not response.get('ok') and payload['photo'] != photo_url:
+            print(f"⚠️ Cached file_id rejected, resending URL: {response.get('description')}", file=sys.stderr)
+            media_cache.forget(photo_url)
+            payload['photo'] = photo_url
+            response = _post('sendPhoto', payload, priority=priority)
+        
+        media_cache.remember_from_response([photo_url], response)
+        return response
     except Exception as e:
         print(f"Error sending photo: {e}", file=sys.stderr)
         return None
 
 
-def send_media_group(chat_id, media_list, caption=None):
+def send_media_group(chat_id, media_list, caption=None, priority=INTERACTIVE):
     """
     Send multiple photos as a media group (album).
     
+    URLs that were uploaded before are sent by their cached file_id, so
+    Telegram does not have to fetch the images again.
+    
     Args:
         chat_id: The chat ID to send to
         media_list: List of photo URLs
         caption: Optional caption for the first photo
+        priority: INTERACTIVE or BULK
     """
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMediaGroup"
-    
     # Format media array
     media = []
     for i, photo_url in enumerate(media_list):
         media_item = {
             'type': 'photo',
-            'media': photo_url
+            'media': media_cache.resolve(photo_url)
         }
         # Add caption only to first photo
         if i == 0 and caption:
@@ -98,16 +229,28 @@ def send_media_group(chat_id, media_list, caption=None):
         'media': media
     }
     
+    flush_inline_reply()
     try:
-        response = requests.post(url, json=payload, timeout=15)
-        return response.json()
+        response = _post('sendMediaGroup', payload, timeout=15, priority=priority)
+        
+        # A cached file_id was rejected - drop the cached ones and upload from the URLs again
+        cached = [photo_url for photo_url, item in zip(media_list, media) if item['media'] != photo_url]
+        if not response.get('ok') and cached:
+            print(f"⚠️ Cached file_id rejected, resending URLs: {response.get('description')}", file=sys.stderr)
+            for photo_url in cached:
+                media_cache.forget(photo_url)
+            for photo_url, item in zip(media_list, media):
+                item['media'] = photo_url
+            response = _post('sendMediaGroup', payload, timeout=15, priority=priority)
+        
+        media_cache.remember_from_response(media_list, response)
+        return response
     except Exception as e:
         print(f"Error sending media group: {e}", file=sys.stderr)
         return None
 
 
-
-def edit_message(chat_id, message_id, text, reply_markup=None):
+def edit_message(chat_id, message_id, text, reply_markup=None, parse_mode='Markdown'):
     """
     Edit an existing message (used for button callbacks).
     
@@ -116,25 +259,134 @@ def edit_message(chat_id, message_id, text, reply_markup=None):
         message_id: The message ID to edit
         text: New message text
         reply_markup: Optional inline keyboard markup (dict)
+        parse_mode: Telegram parse mode (None for plain text)
     """
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/editMessageText"
     payload = {
         'chat_id': chat_id,
         'message_id': message_id,
-        'text': text,
-        'parse_mode': 'Markdown'
+        'text': text
     }
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
     
     if reply_markup:
         payload['reply_markup'] = reply_markup
     
+    if _hold_inline_reply('editMessageText', payload):
+        return {'ok': True, 'inline': True}
+    
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        return response.json()
+        return _post('editMessageText', payload)
     except Exception as e:
         print(f"Error editing message: {e}", file=sys.stderr)
         return None
 
+class ProgressiveMessage:
+    """
+    A reply that is sent early and then edited as more text streams in
+    
+    Interim versions are plain text (partial Markdown may not parse) and are
+    edited at most once per STREAM_EDIT_INTERVAL seconds; finish() puts the
+    final Markdown text and buttons in place.
+    """
+    
+    def __init__(self, chat_id, edit_interval=None):
+        """
+        Args:
+            chat_id: The chat ID to reply in
+            edit_interval: Minimum seconds between interim edits
+        """
+        self.chat_id = chat_id
+        self.edit_interval = STREAM_EDIT_INTERVAL if edit_interval is None else edit_interval
+        self.message_id = None
+        self.shown_text = None
+        self.last_edit = 0.0
+    
+    def update(self, text):
+        """Show the latest partial text (throttled)"""
+        now = time.monotonic()
+        if self.message_id is None:
+            result = send_message(self.chat_id, text + STREAM_CURSOR, parse_mode=None)
+            if result and result.get('ok') and isinstance(result.get('result'), dict):
+                self.message_id = result['result'].get('message_id')
+                self.shown_text = text
+                self.last_edit = now
+                metrics.incr('telegram.stream_messages')
+            return
+        
+        if text == self.shown_text or now - self.last_edit < self.edit_interval:
+            return
+        edit_message(self.chat_id, self.message_id, text + STREAM_CURSOR, parse_mode=None)
+        self.shown_text = text
+        self.last_edit = now
+        metrics.incr('telegram.stream_edits')
+    
+    def finish(self, text, reply_markup=None):
+        """Replace the interim message with the final text, or send it if nothing was shown yet"""
+        if self.message_id is None:
+            return send_message(self.chat_id, text, reply_markup=reply_markup)
+        result = edit_message(self.chat_id, self.message_id, text, reply_markup=reply_markup)
+        if not result or not result.get('ok'):
+            # Final Markdown didn't parse - keep the text, drop the formatting
+            result = edit_message(self.chat_id, self.message_id, text, reply_markup=reply_markup, parse_mode=None)
+        return result
+
+
+def answer_callback_query(callback_query_id, text=None):
+    """
+    Answer a callback query to remove the button loading state.
+    
+    Args:
+        callback_query_id: ID of the callback query
+        text: Optional notification text shown to the user
+    """
+    payload = {'callback_query_id': callback_query_id}
+    if text:
+        payload['text'] = text
+    
+    try:
+        return _post('answerCallbackQuery', payload)
+    except Exception as e:
+        print(f"Error answering callback query: {e}", file=sys.stderr)
+        return None
+
+
+def get_updates(offset=None, limit=100, timeout=30):
+    """
+    Long-poll the Bot API for new updates (getUpdates).
+    
+    Args:
+        offset: Identifier of the first update to return (last update_id + 1)
+        limit: Maximum number of updates to return (1-100)
+        timeout: Long-polling timeout in seconds
+    
+    Returns:
+        List of update dicts (empty on error or timeout)
+    """
+    payload = {'limit': limit, 'timeout': timeout}
+    if offset is not None:
+        payload['offset'] = offset
+    
+    try:
+        response = requests.post(api_url('getUpdates'), json=payload, timeout=timeout + 10)
+        result = response.json()
+        if not result.get('ok'):
+            print(f"getUpdates error: {result}", file=sys.stderr)
+            return []
+        return result.get('result', [])
+    except Exception as e:
+        print(f"Error getting updates: {e}", file=sys.stderr)
+        return []
+
+
+def delete_webhook():
+    """Remove the webhook so getUpdates can be used (Telegram rejects polling while a webhook is set)"""
+    try:
+        return _post('deleteWebhook', {})
+    except Exception as e:
+        print(f"Error deleting webhook: {e}", file=sys.stderr)
+        return None
+
 def process_update(update, get_bot_response):
     """Process a Telegram update and return response"""
     try:
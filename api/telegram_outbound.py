@@ -0,0 +1,324 @@
+"""
+Telegram Outbound Scheduler
+Rate-limit-aware sending of Bot API calls: per-chat and global token buckets,
+429 retry_after backoff and priority lanes over a pooled keep-alive session
+"""
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Priority lanes (lower value is sent first)
+INTERACTIVE = 0
+BULK = 1
+
+# Telegram's documented limits (override via environment)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))          # messages/second, whole bot
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))              # messages/second, per private chat
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE_PER_MIN', '20')) / 60  # messages/second, per group
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))               # back-to-back sends allowed per chat
+TELEGRAM_SENDERS = int(os.getenv('TELEGRAM_SENDERS', '8'))                     # concurrent HTTP requests
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))             # 429 retries per call
+
+# Methods that don't post into a chat and so skip the per-chat bucket
+_UNLIMITED_METHODS = {'answerCallbackQuery', 'getUpdates', 'deleteWebhook', 'setWebhook', 'getMe'}
+
+# Per-chat buckets kept for recently active chats
+_MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1.0, now: float = None) -> float:
+        """Seconds until `cost` tokens are available (0 if available now)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1.0, now: float = None):
+        """Consume tokens (call after wait_time() returned 0)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+
+class _Job:
+    """A queued Bot API call"""
+
+    __slots__ = ('method', 'url', 'payload', 'timeout', 'priority', 'seq', 'cost',
+                 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, method, url, payload, timeout, priority, seq, cost):
+        self.method = method
+        self.url = url
+        self.payload = payload
+        self.timeout = timeout
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundScheduler:
+    """
+    Dispatches Bot API calls from priority lanes within Telegram's rate limits
+
+    Calls for the same chat are sent one at a time and in order; different
+    chats are sent concurrently by a pool of sender threads sharing one
+    keep-alive HTTP session. Interactive calls always go ahead of bulk ones
+    that are ready at the same time.
+    """
+
+    def __init__(self, senders: int = TELEGRAM_SENDERS, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE, group_rate: float = TELEGRAM_GROUP_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST, max_retries: int = TELEGRAM_MAX_RETRIES):
+        """
+        Args:
+            senders: Number of sender threads (concurrent HTTP requests)
+            global_rate: Messages per second across all chats
+            chat_rate: Messages per second per private chat
+            group_rate: Messages per second per group/channel (negative chat_id)
+            chat_burst: Bucket capacity per chat
+            max_retries: How often a call is retried after a 429
+        """
+        self.senders = max(1, senders)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.senders)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._pending = {}           # chat key -> deque of jobs, oldest first
+        self._ready = []             # heap of (priority, seq, chat key) for idle chats with pending jobs
+        self._busy = set()           # chat keys with a call in flight
+        self._not_before = {}        # chat key -> monotonic time (429 backoff)
+        self._buckets = OrderedDict()
+        self._depth = 0
+        self._threads = []
+
+    def start(self):
+        """Start the sender threads (idempotent)"""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.senders):
+                thread = threading.Thread(target=self._run, name=f"telegram-sender-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"✅ Telegram outbound scheduler started with {self.senders} senders", file=sys.stderr)
+
+    def depth(self) -> int:
+        """Number of calls waiting to be sent"""
+        with self._cond:
+            return self._depth
+
+    def submit(self, method: str, url: str, payload: dict, timeout: float = 10,
+               priority: int = INTERACTIVE) -> Future:
+        """
+        Queue a Bot API call
+
+        Args:
+            method: Bot API method name
+            url: Full method URL
+            payload: JSON body
+            timeout: HTTP timeout in seconds
+            priority: INTERACTIVE or BULK
+
+        Returns:
+            Future resolving to the parsed JSON response
+        """
+        # An album counts as one message for the chat but one per photo globally
+        cost = len(payload.get('media', [])) or 1
+        job = _Job(method, url, payload, timeout, priority, next(self._seq), cost)
+        key = self._chat_key(method, payload, job.seq)
+        with self._cond:
+            jobs = self._pending.get(key)
+            if jobs is None:
+                jobs = self._pending[key] = deque()
+            jobs.append(job)
+            if len(jobs) == 1 and key not in self._busy:
+                heapq.heappush(self._ready, (job.priority, job.seq, key))
+            self._depth += 1
+            self._cond.notify()
+        return job.future
+
+    def call(self, method: str, url: str, payload: dict, timeout: float = 10,
+             priority: int = INTERACTIVE) -> dict:
+        """Queue a Bot API call and wait for its response"""
+        return self.submit(method, url, payload, timeout, priority).result()
+
+    def _chat_key(self, method: str, payload: dict, seq: int):
+        """Ordering/rate-limit key: the chat, or a unique key for chat-less calls"""
+        chat_id = payload.get('chat_id')
+        if chat_id is None or method in _UNLIMITED_METHODS:
+            return ('call', seq)
+        return chat_id
+
+    def _chat_bucket(self, key) -> TokenBucket:
+        """Get the token bucket for a chat (None for chat-less calls)"""
+        if isinstance(key, tuple):
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            is_group = str(key).startswith('-')
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[key] = TokenBucket(rate, self.chat_burst)
+            if len(self._buckets) > _MAX_CHAT_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _next_job(self):
+        """Pick the highest-priority job whose chat and the global bucket allow a send"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                skipped = []
+                job = None
+                wait = None
+                while self._ready:
+                    entry = heapq.heappop(self._ready)
+                    key = entry[2]
+                    head = self._pending[key][0]
+                    bucket = self._chat_bucket(key)
+                    chat_wait = max(
+                        self._not_before.get(key, 0) - now,
+                        bucket.wait_time(1, now) if bucket else 0.0
+                    )
+                    if chat_wait > 0:
+                        skipped.append(entry)
+                        wait = chat_wait if wait is None else min(wait, chat_wait)
+                        continue
+                    global_wait = self.global_bucket.wait_time(head.cost, now) if bucket else 0.0
+                    if global_wait > 0:
+                        skipped.append(entry)
+                        wait = global_wait if wait is None else min(wait, global_wait)
+                        break
+                    job = head
+                    if bucket:
+                        bucket.take(1, now)
+                        self.global_bucket.take(job.cost, now)
+                    self._busy.add(key)
+                    break
+
+                for entry in skipped:
+                    heapq.heappush(self._ready, entry)
+                if job is not None:
+                    self._depth -= 1
+                    return key, job
+                self._cond.wait(wait)
+
+    def _finish(self, key, job, retry_after: float = None):
+        """Release a chat after a send, requeueing the job at the front on 429"""
+        with self._cond:
+            jobs = self._pending[key]
+            self._busy.discard(key)
+            if retry_after is not None:
+                self._not_before[key] = time.monotonic() + retry_after
+                self._depth += 1
+            else:
+                jobs.popleft()
+                self._not_before.pop(key, None)
+
+            if jobs:
+                heapq.heappush(self._ready, (jobs[0].priority, jobs[0].seq, key))
+                self._cond.notify()
+            else:
+                del self._pending[key]
+
+    def _run(self):
+        """Sender loop"""
+        while True:
+            key, job = self._next_job()
+            self._send(key, job)
+
+    def _send(self, key, job: _Job):
+        """Perform one HTTP call and resolve (or requeue) the job"""
+        job.attempts += 1
+        if job.attempts == 1:
+            metrics.observe(f"telegram.{job.method}.queue_wait_ms", (time.monotonic() - job.enqueued_at) * 1000)
+
+        try:
+            with metrics.timer(f"telegram.{job.method}.send_ms"):
+                response = self.session.post(job.url, json=job.payload, timeout=job.timeout)
+            result = response.json()
+        except Exception as e:
+            metrics.incr('telegram.send_errors')
+            self._finish(key, job)
+            job.future.set_exception(e)
+            return
+
+        if response.status_code == 429 and job.attempts <= self.max_retries:
+            retry_after = float((result.get('parameters') or {}).get('retry_after', 1))
+            metrics.incr('telegram.rate_limited')
+            print(f"⚠️ Telegram 429 on {job.method} (chat {job.payload.get('chat_id')}), "
+                  f"retrying in {retry_after}s", file=sys.stderr)
+            self._finish(key, job, retry_after=retry_after)
+            return
+
+        self._finish(key, job)
+        job.future.set_result(result)
+
+
+# Global scheduler (created on first use)
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OutboundScheduler:
+    """
+    Get or create the started process-wide outbound scheduler
+
+    Returns:
+        OutboundScheduler instance
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OutboundScheduler()
+            _scheduler.start()
+            metrics.register_gauge('telegram.outbound_queue_depth', _scheduler.depth)
+    return _scheduler
@@ -0,0 +1,216 @@
+"""
+Update Deduplication Module
+Suppresses Telegram redeliveries of an update_id we have already accepted
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+try:
+    from . import metrics
+    from .database import get_session
+    from .models import ProcessedUpdate
+except ImportError:
+    import metrics
+    from database import get_session
+    from models import ProcessedUpdate
+
+# Deduplication window (override via environment)
+UPDATE_DEDUP_TTL_SECONDS = int(os.getenv('UPDATE_DEDUP_TTL_SECONDS', '3600'))
+UPDATE_DEDUP_MAX_ENTRIES = int(os.getenv('UPDATE_DEDUP_MAX_ENTRIES', '100000'))
+
+# Also record update_ids in the processed_updates table so dedup works across instances
+UPDATE_DEDUP_SHARED = os.getenv('UPDATE_DEDUP_SHARED', 'false').lower() in ('1', 'true', 'yes')
+
+# How often expired rows are purged from the shared table
+_PRUNE_INTERVAL_SECONDS = 300
+
+
+class RecentIdSet:
+    """
+    Bounded set of recently seen IDs with LRU eviction and a TTL
+    """
+
+    def __init__(self, max_entries: int = UPDATE_DEDUP_MAX_ENTRIES, ttl_seconds: float = UPDATE_DEDUP_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, item_id, now: float = None) -> bool:
+        """
+        Record an ID
+
+        Args:
+            item_id: ID to record
+            now: Current monotonic time (for tests)
+
+        Returns:
+            True if the ID is new, False if it was seen within the TTL
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen_at = self._entries.get(item_id)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                self._entries.move_to_end(item_id)
+                return False
+
+            self._entries[item_id] = now
+            self._entries.move_to_end(item_id)
+            self._evict(now)
+            return True
+
+    def discard(self, item_id):
+        """Remove an ID so its next occurrence is accepted again"""
+        with self._lock:
+            self._entries.pop(item_id, None)
+
+    def _evict(self, now: float):
+        """Drop expired entries from the old end, then enforce the size bound"""
+        while self._entries:
+            oldest_id, oldest_at = next(iter(self._entries.items()))
+            if now - oldest_at < self.ttl_seconds and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class UpdateDeduplicator:
+    """
+    update_id deduplication: in-process LRU+TTL set, optionally backed by a shared SQL table
+    """
+
+    def __init__(self, shared: bool = UPDATE_DEDUP_SHARED, ttl_seconds: float = UPDATE_DEDUP_TTL_SECONDS,
+                 max_entries: int = UPDATE_DEDUP_MAX_ENTRIES):
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.recent = RecentIdSet(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._last_prune = 0.0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """
+        Check an update_id and mark it as seen
+
+        Args:
+            update_id: Telegram update_id
+
+        Returns:
+            True if this update was already accepted and should be skipped
+        """
+        duplicate = not self.recent.add(update_id)
+
+        if not duplicate and self.shared:
+            duplicate = not self._claim_shared(update_id)
+
+        if duplicate:
+            metrics.incr('updates.duplicates_suppressed')
+            print(f"⚠️ Duplicate update suppressed: {update_id}", file=sys.stderr)
+        return duplicate
+
+    def forget(self, update_id: int):
+        """
+        Un-mark an update_id that was accepted but not handled (rejected with 503 or
+        failed with 500), so Telegram's redelivery is processed instead of suppressed
+
+        Args:
+            update_id: Telegram update_id
+        """
+        self.recent.discard(update_id)
+        if not self.shared:
+            return
+
+        session = get_session()
+        try:
+            session.query(ProcessedUpdate)\
+                .filter(ProcessedUpdate.update_id == update_id)\
+                .delete()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Dedup table error: {e}", file=sys.stderr)
+        finally:
+            session.close()
+
+    def _claim_shared(self, update_id: int) -> bool:
+        """
+        Insert the update_id into the shared table
+
+        Returns:
+            True if this instance claimed it, False if another instance already did
+        """
+        session = get_session()
+        try:
+            session.add(ProcessedUpdate(update_id=update_id))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+        except Exception as e:
+            # Shared store unavailable - fall back to the local window only
+            session.rollback()
+            print(f"Dedup table error: {e}", file=sys.stderr)
+            return True
+        finally:
+            session.close()
+            self._maybe_prune()
+
+    def _maybe_prune(self):
+        """Delete shared rows older than the TTL (at most every few minutes)"""
+        now = time.monotonic()
+        if now - self._last_prune < _PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = now
+
+        session = get_session()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+            session.query(ProcessedUpdate)\
+                .filter(ProcessedUpdate.received_at < cutoff)\
+                .delete()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Dedup prune error: {e}", file=sys.stderr)
+        finally:
+            session.close()
+
+
+# Global deduplicator
+_deduplicator = UpdateDeduplicator()
+
+
+def is_duplicate_update(update: dict) -> bool:
+    """
+    Check whether an incoming update was already accepted
+
+    Args:
+        update: Telegram update dict
+
+    Returns:
+        True if the update should be skipped (updates without an update_id are never duplicates)
+    """
+    update_id = update.get('update_id') if isinstance(update, dict) else None
+    if not isinstance(update_id, int):
+        return False
+    return _deduplicator.is_duplicate(update_id)
+
+
+def forget_update(update: dict):
+    """
+    Let a redelivery of an update through again (call when it was not handled)
+
+    Args:
+        update: Telegram update dict
+    """
+    update_id = update.get('update_id') if isinstance(update, dict) else None
+    if isinstance(update_id, int):
+        _deduplicator.forget(update_id)
@@ -0,0 +1,236 @@
+"""
+Update Ingestion Queue
+Chat-sharded worker lanes that process Telegram updates off the webhook request thread
+"""
+import os
+import sys
+import threading
+import time
+import queue
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Queue configuration (override via environment)
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '4'))
+UPDATE_LANES = int(os.getenv('UPDATE_LANES', str(UPDATE_WORKERS)))
+
+_STOP = object()
+
+
+def is_valid_update(update) -> bool:
+    """
+    Check that a payload looks like a Telegram update we can process
+
+    Args:
+        update: Parsed JSON body of the webhook request
+
+    Returns:
+        True if the update has an update_id and a usable message or callback query
+    """
+    if not isinstance(update, dict) or not isinstance(update.get('update_id'), int):
+        return False
+
+    if 'callback_query' in update:
+        callback_query = update['callback_query']
+        return (
+            isinstance(callback_query, dict)
+            and 'data' in callback_query
+            and 'id' in callback_query
+            and 'id' in callback_query.get('from', {})
+            and 'chat' in callback_query.get('message', {})
+        )
+
+    if 'message' in update:
+        message = update['message']
+        return (
+            isinstance(message, dict)
+            and 'id' in message.get('chat', {})
+            and 'id' in message.get('from', {})
+        )
+
+    return False
+
+
+def get_update_chat_id(update: dict):
+    """
+    Extract the chat ID an update belongs to
+
+    Args:
+        update: Telegram update dict
+
+    Returns:
+        Chat ID, or None if the update has no chat
+    """
+    if 'callback_query' in update:
+        return update['callback_query'].get('message', {}).get('chat', {}).get('id')
+    if 'message' in update:
+        return update['message'].get('chat', {}).get('id')
+    return None
+
+
+class UpdateQueue:
+    """
+    Chat-sharded update dispatcher
+
+    Each update is hashed by chat_id onto one of N lanes. A lane is a bounded
+    FIFO drained by a single worker thread, so updates from the same chat are
+    processed strictly in order while different chats run in parallel.
+    """
+
+    def __init__(self, handler, lanes: int = UPDATE_LANES, maxsize: int = UPDATE_QUEUE_SIZE):
+        """
+        Args:
+            handler: Callable invoked with each update dict
+            lanes: Number of lanes (one worker thread each)
+            maxsize: Total queued updates across all lanes before submit() rejects
+        """
+        self.handler = handler
+        self.lanes = max(1, lanes)
+        lane_size = max(1, maxsize // self.lanes)
+        self._queues = [queue.Queue(maxsize=lane_size) for _ in range(self.lanes)]
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self) -> int:
+        """Number of worker threads (one per lane)"""
+        return self.lanes
+
+    def start(self):
+        """Start one worker thread per lane (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i, lane_queue in enumerate(self._queues):
+                thread = threading.Thread(target=self._run, args=(lane_queue,), name=f"update-lane-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"✅ Update queue started with {self.lanes} lanes", file=sys.stderr)
+
+    def lane_for(self, update: dict) -> int:
+        """
+        Pick the lane for an update
+
+        Args:
+            update: Telegram update dict
+
+        Returns:
+            Lane index (updates without a chat are spread by update_id)
+        """
+        chat_id = get_update_chat_id(update)
+        key = chat_id if chat_id is not None else update.get('update_id', 0)
+        return hash(key) % self.lanes
+
+    def submit(self, update: dict) -> bool:
+        """
+        Enqueue an update on its chat's lane
+
+        Args:
+            update: Telegram update dict
+
+        Returns:
+            True if queued, False if the lane is full
+        """
+        lane = self.lane_for(update)
+        try:
+            self._queues[lane].put_nowait((time.monotonic(), update))
+        except queue.Full:
+            metrics.incr('updates.rejected')
+            return False
+        metrics.incr('updates.enqueued')
+        return True
+
+    def depth(self) -> int:
+        """Number of updates waiting to be picked up across all lanes"""
+        return sum(lane_queue.qsize() for lane_queue in self._queues)
+
+    def lane_depths(self) -> list:
+        """Backlog of each lane"""
+        return [lane_queue.qsize() for lane_queue in self._queues]
+
+    def busy_workers(self) -> int:
+        """Number of lanes currently processing an update"""
+        with self._lock:
+            return self._busy
+
+    def utilization(self) -> float:
+        """Fraction of lane workers currently busy (0.0-1.0)"""
+        return round(self.busy_workers() / self.lanes, 3)
+
+    def join(self):
+        """Block until every queued update has been processed"""
+        for lane_queue in self._queues:
+            lane_queue.join()
+
+    def stop(self, timeout: float = 5.0):
+        """Drain remaining updates and stop all workers"""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads = []
+        if threads:
+            for lane_queue in self._queues:
+                lane_queue.put((None, _STOP))
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self, lane_queue: queue.Queue):
+        """Lane worker loop"""
+        while True:
+            received_at, update = lane_queue.get()
+            try:
+                if update is _STOP:
+                    return
+                self._process(received_at, update)
+            finally:
+                lane_queue.task_done()
+
+    def _process(self, received_at: float, update: dict):
+        """Run the handler for one update and record lag metrics"""
+        with self._lock:
+            self._busy += 1
+        metrics.observe('updates.queue_wait_ms', (time.monotonic() - received_at) * 1000)
+        try:
+            self.handler(update)
+            metrics.incr('updates.processed')
+        except Exception as e:
+            metrics.incr('updates.failed')
+            print(f"❌ Update worker error (update {update.get('update_id')}): {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+        finally:
+            with self._lock:
+                self._busy -= 1
+            metrics.observe('updates.end_to_end_ms', (time.monotonic() - received_at) * 1000)
+
+
+# Global queue (created on first use)
+_update_queue = None
+_update_queue_lock = threading.Lock()
+
+
+def get_update_queue(handler) -> UpdateQueue:
+    """
+    Get or create the started process-wide update queue
+
+    Args:
+        handler: Callable used to process each update
+
+    Returns:
+        UpdateQueue instance
+    """
+    global _update_queue
+    with _update_queue_lock:
+        if _update_queue is None:
+            _update_queue = UpdateQueue(handler)
+            _update_queue.start()
+            metrics.register_gauge('updates.queue_depth', _update_queue.depth)
+            metrics.register_gauge('updates.workers_busy', _update_queue.busy_workers)
+            metrics.register_gauge('updates.worker_utilization', _update_queue.utilization)
+            metrics.register_gauge('updates.lane_depths', _update_queue.lane_depths)
+            metrics.register_gauge('updates.max_lane_depth', lambda: max(_update_queue.lane_depths()))
+    return _update_queue
@@ -5,7 +5,6 @@ With database persistence and analytics tracking
 """
 import os
 import sys
-import requests
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 
@@ -15,36 +14,61 @@ load_dotenv()
 # Import our modular components
 try:
     # Try relative imports first (when run as module)
-    from .gemini_handler import get_response
-    from .telegram_handler import send_message, send_photo, send_media_group, edit_message, TELEGRAM_TOKEN
+    from .gemini_handler import get_response, get_response_stream
+    from .telegram_handler import send_message, send_photo, send_media_group, edit_message, answer_callback_query, inline_reply_capture, is_capturing_inline_reply, ProgressiveMessage, TELEGRAM_TOKEN
     from .landing_page import get_landing_page
     from .inline_keyboard import handle_button_callback, product_buttons
-    from .database import init_db, get_or_create_user
+    from .database import init_db, get_or_create_user, unit_of_work
     from .database_memory import get_user_memory, get_user_context_manager
     from .analytics import (
         log_user_message, log_button_click, log_product_view, log_purchase, log_error
     )
     from .admin_routes import admin_bp
+    from .update_queue import get_update_queue, is_valid_update
+    from .update_dedup import forget_update, is_duplicate_update
+    from .message_analysis import analyze_message, register_keywords
+    from . import metrics, structured_output
     print("✅ Successfully imported modular components (relative)", file=sys.stderr)
 except (ImportError, ValueError) as e:
     print(f"⚠️ Relative import failed: {e}, trying direct import", file=sys.stderr)
     try:
         # Fallback: import directly when run as script
-        from gemini_handler import get_response
-        from telegram_handler import send_message, send_photo, send_media_group, edit_message, TELEGRAM_TOKEN
+        from gemini_handler import get_response, get_response_stream
+        from telegram_handler import send_message, send_photo, send_media_group, edit_message, answer_callback_query, inline_reply_capture, is_capturing_inline_reply, ProgressiveMessage, TELEGRAM_TOKEN
         from landing_page import get_landing_page
         from inline_keyboard import handle_button_callback, product_buttons
-        from database import init_db, get_or_create_user
+        from database import init_db, get_or_create_user, unit_of_work
         from database_memory import get_user_memory, get_user_context_manager
         from analytics import (
             log_user_message, log_button_click, log_product_view, log_purchase, log_error
         )
         from admin_routes import admin_bp
+        from update_queue import get_update_queue, is_valid_update
+        from update_dedup import forget_update, is_duplicate_update
+        from message_analysis import analyze_message, register_keywords
+        import metrics
+        import structured_output
         print("✅ Successfully imported modular components (direct)", file=sys.stderr)
     except ImportError as e2:
         print(f"❌ Both import methods failed: {e2}", file=sys.stderr)
         raise
 
+# Update ingestion mode: 'inline' processes updates before responding,
+# 'queue' acknowledges immediately and hands them to a background worker pool
+UPDATE_INGESTION_MODE = os.getenv('UPDATE_INGESTION_MODE', 'inline').lower()
+
+# Inline mode only: answer with the primary reply (sendMessage/editMessageText) in
+# the webhook response body instead of a separate outbound Bot API call
+WEBHOOK_INLINE_REPLY = os.getenv('WEBHOOK_INLINE_REPLY', 'false').lower() in ('1', 'true', 'yes')
+
+# Stream Gemini replies (streamGenerateContent) into a message that is edited as text arrives
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', 'false').lower() in ('1', 'true', 'yes')
+
+# Trigger keywords, checked against the message's shared keyword scan
+CHEAP_WORDS = ['cheap', 'cheapest', 'affordable', 'budget']
+
+register_keywords(CHEAP_WORDS)
+
 # Create Flask app with static folder configuration
 app = Flask(__name__, static_folder=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static')), static_url_path='/static')
 
@@ -70,6 +94,8 @@ except Exception as e:
 # Log for debugging
 print(f"Webhook initialized - Modular architecture with Database & Analytics", file=sys.stderr)
 print(f"Telegram Token loaded: {'Yes' if TELEGRAM_TOKEN else 'No'}", file=sys.stderr)
+print(f"Update ingestion mode: {UPDATE_INGESTION_MODE}"
+      f"{' (inline replies)' if WEBHOOK_INLINE_REPLY and UPDATE_INGESTION_MODE != 'queue' else ''}", file=sys.stderr)
 
 @app.route('/health', methods=['GET'])
 def ping():
@@ -102,84 +128,87 @@ def dashboard():
         print(f"Error serving dashboard: {e}", file=sys.stderr)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/', methods=['POST'])
-@app.route('/webhook', methods=['POST'])
-@app.route('/api/webhook', methods=['POST'])  # Handle Vercel path when route is /api/webhook
-def webhook():
-    """Handle incoming Telegram updates (messages and callback queries)"""
-    try:
-        print("=" * 50, file=sys.stderr)
-        print("WEBHOOK CALLED!", file=sys.stderr)
-        print("=" * 50, file=sys.stderr)
+
+def handle_update(update):
+    """
+    Process a single Telegram update (message or callback query)
+    
+    Shared by the synchronous webhook path, the background update queue and
+    the long-polling runner. All database writes made while handling the
+    update are committed together in one transaction at the end.
+    Exceptions propagate to the caller.
+    
+    Args:
+        update: Telegram update dict
+    """
+    with unit_of_work():
+        _process_update(update)
+
+
+def _process_update(update):
+    """Route an update to the button or message handling logic"""
+    # Handle callback queries (button clicks)
+    if 'callback_query' in update:
+        callback_query = update['callback_query']
+        callback_data = callback_query['data']
+        user_id = callback_query['from']['id']
+        message_id = callback_query['message']['message_id']
+        chat_id = callback_query['message']['chat']['id']
         
-        update = request.get_json()
-        print(f"Update received: {update}", file=sys.stderr)
+        print(f"Callback query: {callback_data} from user {user_id}", file=sys.stderr)
         
-        if not TELEGRAM_TOKEN:
-            print("ERROR: NO TELEGRAM_TOKEN found!", file=sys.stderr)
-            return jsonify({'error': 'No token configured'}), 500
+        # Ensure user exists in database
+        user = get_or_create_user(user_id)
         
-        # Handle callback queries (button clicks)
-        if 'callback_query' in update:
-            callback_query = update['callback_query']
-            callback_data = callback_query['data']
-            user_id = callback_query['from']['id']
-            message_id = callback_query['message']['message_id']
-            chat_id = callback_query['message']['chat']['id']
-            
-            print(f"Callback query: {callback_data} from user {user_id}", file=sys.stderr)
-            
-            # Ensure user exists in database
-            user = get_or_create_user(user_id)
-            
-            # Log button click analytics
-            button_type = callback_data.split('_')[0] if '_' in callback_data else 'unknown'
-            log_button_click(user_id, button_type, button_data={'callback_data': callback_data})
-            
-            # Handle the button click
-            response = handle_button_callback(callback_data, user_id)
-            
-            # Edit the message with new text and buttons
-            edit_result = edit_message(
-                chat_id=chat_id,
-                message_id=message_id,
-                text=response['text'],
-                reply_markup=response.get('reply_markup')
-            )
-            
-            # Answer callback query to remove loading state
-            answer_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/answerCallbackQuery"
-            requests.post(answer_url, json={'callback_query_id': callback_query['id']})
-            
-            print(f"✅ Button click handled successfully", file=sys.stderr)
-            return jsonify({'ok': True})
+        # Log button click analytics
+        button_type = callback_data.split('_')[0] if '_' in callback_data else 'unknown'
+        log_button_click(user_id, button_type, button_data={'callback_data': callback_data})
         
-        # Handle regular messages
-        if 'message' in update:
-            message = update['message']
-            chat_id = message['chat']['id']
-            user_id = message['from']['id']
-            username = message['from'].get('username')
-            first_name = message['from'].get('first_name')
-            
-            print(f"Chat ID: {chat_id}, User ID: {user_id}", file=sys.stderr)
+        # Handle the button click
+        response = handle_button_callback(callback_data, user_id)
+        
+        # Edit the message with new text and buttons
+        edit_result = edit_message(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=response['text'],
+            reply_markup=response.get('reply_markup')
+        )
+        
+        # Answer callback query to remove loading state
+        answer_callback_query(callback_query['id'])
+        
+        print(f"✅ Button click handled successfully", file=sys.stderr)
+        return
+    
+    # Handle regular messages
+    if 'message' in update:
+        message = update['message']
+        chat_id = message['chat']['id']
+        user_id = message['from']['id']
+        username = message['from'].get('username')
+        first_name = message['from'].get('first_name')
+        
+        print(f"Chat ID: {chat_id}, User ID: {user_id}", file=sys.stderr)
+        
+        # Ensure user exists in database and load memory
+        user = get_or_create_user(user_id, username, first_name)
+        user_memory = get_user_memory(user_id)
+        context_mgr = get_user_context_manager(user_id)
+        
+        if 'text' in message:
+            user_message = message['text']
+            print(f"User message: {user_message}", file=sys.stderr)
+            # Scanned once here; the router, handlers and detectors below get the same analysis
+            analysis = analyze_message(user_message)
             
-            # Ensure user exists in database and load memory
-            user = get_or_create_user(user_id, username, first_name)
-            user_memory = get_user_memory(user_id)
-            context_mgr = get_user_context_manager(user_id)
+            # Log user message
+            log_user_message(user_id, emotion=None)
             
-            if 'text' in message:
-                user_message = message['text']
-                print(f"User message: {user_message}", file=sys.stderr)
-                
-                # Log user message
-                log_user_message(user_id, emotion=None)
-                
-                # Handle /start command with product keyboard
-                if user_message.startswith('/start'):
-                    from .inline_keyboard import get_product_list_keyboard
-                    welcome_text = """👋 Hey! I'm Alex, your personal tech consultant here at KMGMedia Design & Technologies.
+            # Handle /start command with product keyboard
+            if user_message.startswith('/start'):
+                from .inline_keyboard import get_product_list_keyboard
+                welcome_text = """👋 Hey! I'm Alex, your personal tech consultant here at KMGMedia Design & Technologies.
 
 With 7 years helping folks find their perfect gadgets, I'm here to make sure you get exactly what you need - not just what's on sale! 😊
 
@@ -190,54 +219,101 @@ I can help you find the perfect gadget! Choose a product below or just tell me w
 • "I want a fitness tracker"
 
 What brings you in today? Let's find something awesome for you! 🎯"""
-                    
-                    # Add to user memory
-                    user_memory.add_user_message(user_message)
-                    user_memory.add_ai_message(welcome_text)
-                    
-                    send_message(chat_id, welcome_text, reply_markup=get_product_list_keyboard())
-                    return jsonify({'ok': True})
-
-                # Quick cart view/checkout entrypoint
-                if user_message.lower().startswith('/cart') or user_message.lower() == 'cart':
-                    from .cart_manager import get_cart_summary
-                    from .inline_keyboard import cart_view_buttons
-                    summary = get_cart_summary(user_id)
-                    send_message(chat_id, summary, reply_markup=cart_view_buttons())
-                    return jsonify({'ok': True})
                 
-                # Get response from Google Gemini handler (with automatic fallback)
-                # Pass user_id for conversation memory
-                try:
-                    response_text = get_response(user_message, user_id)
-                    print(f"Bot response: {response_text}", file=sys.stderr)
-                    
-                    # Add to persistent memory
-                    user_memory.add_user_message(user_message)
-                    user_memory.add_ai_message(response_text)
-                    
-                    # Check if response mentions a specific product - if so, add buttons
+                # Add to user memory
+                user_memory.add_user_message(user_message)
+                user_memory.add_ai_message(welcome_text)
+                
+                send_message(chat_id, welcome_text, reply_markup=get_product_list_keyboard())
+                return
+
+            # Quick cart view/checkout entrypoint
+            if user_message.lower().startswith('/cart') or user_message.lower() == 'cart':
+                from .cart_manager import get_cart_summary
+                from .inline_keyboard import cart_view_buttons
+                summary = get_cart_summary(user_id)
+                send_message(chat_id, summary, reply_markup=cart_view_buttons())
+                return
+            
+            # Get response from Google Gemini handler (with automatic fallback)
+            # Pass user_id for conversation memory
+            try:
+                # Plain-text replies can be streamed: shown early, then edited as Gemini writes.
+                # Product replies go out as a photo album caption, so they wait for the full text.
+                # Structured replies are JSON until complete, so they are never streamed.
+                progressive = None
+                generation = {}  # filled with the generation profile, tokens used and structured product/intent
+                structured = structured_output.GEMINI_STRUCTURED_OUTPUT
+                if GEMINI_STREAMING and not structured and not is_capturing_inline_reply():
                     from .conversation_handler import detect_product
-                    from .user_memory import get_last_product
-                    from .product_data import get_product_images, get_product_spec, get_product_price
+                    asks_cheapest = analysis.has_any(CHEAP_WORDS)
+                    if not detect_product(analysis) and not asks_cheapest:
+                        progressive = ProgressiveMessage(chat_id)
+                
+                if progressive:
+                    response_text = get_response_stream(user_message, user_id, on_text=progressive.update,
+                                                        meta=generation)
+                else:
+                    response_text = get_response(user_message, user_id, meta=generation)
+                print(f"Bot response: {response_text}", file=sys.stderr)
+                
+                # Add to persistent memory
+                user_memory.add_user_message(user_message)
+                user_memory.add_ai_message(response_text, tokens_used=generation.get('tokens_used'))
+                
+                # Check if response mentions a specific product - if so, add buttons
+                from .conversation_handler import detect_product
+                from .user_memory import get_last_product
+                from .product_data import get_product_images, get_product_spec, get_product_price
+                
+                # A structured reply already names the product it talks about
+                if 'product' in generation:
+                    detected_product = generation['product']
+                else:
+                    detected_product = detect_product(analysis)
+                
+                if detected_product:
+                    # Log product view
+                    log_product_view(user_id, detected_product)
+                    context_mgr.set_context(product=detected_product, intent='view')
                     
-                    detected_product = detect_product(user_message)
+                    # Check if product has images
+                    product_images = get_product_images(detected_product)
                     
-                    if detected_product:
-                        # Log product view
-                        log_product_view(user_id, detected_product)
-                        context_mgr.set_context(product=detected_product, intent='view')
+                    if product_images:
+                        # Send product images with details
+                        product_price = get_product_price(detected_product)
+                        product_spec = get_product_spec(detected_product)
+                        
+                        # Create detailed caption for the media group
+                        caption = f"*{detected_product}*\n\n"
+                        caption += f"💰 *Price:* ${product_price}\n\n"
+                        caption += f"📋 *Details:* {product_spec}\n\n"
+                        caption += f"{response_text}"
+                        
+                        # Send all images as a carousel (media group) with caption on first image
+                        send_media_group(chat_id, product_images, caption=caption)
                         
-                        # Check if product has images
-                        product_images = get_product_images(detected_product)
+                        # Send buttons in a separate message immediately after
+                        button_text = "👇 Choose an option below:"
+                        send_message(chat_id, button_text, reply_markup=product_buttons(detected_product))
+                    else:
+                        # No images, send text with product buttons
+                        send_message(chat_id, response_text, reply_markup=product_buttons(detected_product))
+                else:
+                    # Check if user has a product in memory (e.g., from cheapest request)
+                    last_product = get_last_product(user_id)
+                    if last_product and analysis.has_any(CHEAP_WORDS):
+                        # User asked for cheapest - check if product has images
+                        product_images = get_product_images(last_product)
                         
                         if product_images:
                             # Send product images with details
-                            product_price = get_product_price(detected_product)
-                            product_spec = get_product_spec(detected_product)
+                            product_price = get_product_price(last_product)
+                            product_spec = get_product_spec(last_product)
                             
                             # Create detailed caption for the media group
-                            caption = f"*{detected_product}*\n\n"
+                            caption = f"*{last_product}*\n\n"
                             caption += f"💰 *Price:* ${product_price}\n\n"
                             caption += f"📋 *Details:* {product_spec}\n\n"
                             caption += f"{response_text}"
@@ -247,54 +323,84 @@ What brings you in today? Let's find something awesome for you! 🎯"""
                             
                             # Send buttons in a separate message immediately after
                             button_text = "👇 Choose an option below:"
-                            send_message(chat_id, button_text, reply_markup=product_buttons(detected_product))
+                            send_message(chat_id, button_text, reply_markup=product_buttons(last_product))
                         else:
-                            # No images, send text with product buttons
-                            send_message(chat_id, response_text, reply_markup=product_buttons(detected_product))
+                            # No images, send with buttons for the cheapest product
+                            send_message(chat_id, response_text, reply_markup=product_buttons(last_product))
                     else:
-                        # Check if user has a product in memory (e.g., from cheapest request)
-                        last_product = get_last_product(user_id)
-                        if last_product and any(word in user_message.lower() for word in ['cheap', 'cheapest', 'affordable', 'budget']):
-                            # User asked for cheapest - check if product has images
-                            product_images = get_product_images(last_product)
-                            
-                            if product_images:
-                                # Send product images with details
-                                product_price = get_product_price(last_product)
-                                product_spec = get_product_spec(last_product)
-                                
-                                # Create detailed caption for the media group
-                                caption = f"*{last_product}*\n\n"
-                                caption += f"💰 *Price:* ${product_price}\n\n"
-                                caption += f"📋 *Details:* {product_spec}\n\n"
-                                caption += f"{response_text}"
-                                
-                                # Send all images as a carousel (media group) with caption on first image
-                                send_media_group(chat_id, product_images, caption=caption)
-                                
-                                # Send buttons in a separate message immediately after
-                                button_text = "👇 Choose an option below:"
-                                send_message(chat_id, button_text, reply_markup=product_buttons(last_product))
-                            else:
-                                # No images, send with buttons for the cheapest product
-                                send_message(chat_id, response_text, reply_markup=product_buttons(last_product))
+                        # Send without buttons
+                        if progressive:
+                            progressive.finish(response_text)
                         else:
-                            # Send without buttons
                             send_message(chat_id, response_text)
+                
+                # Save conversation to database
+                context_mgr.save_interaction(user_message, response_text)
                     
-                    # Save conversation to database
-                    context_mgr.save_interaction(user_message, response_text)
-                        
-                except Exception as resp_err:
-                    print(f"ERROR getting response: {resp_err}", file=sys.stderr)
-                    log_error(user_id, 'response_error', str(resp_err))
-                    response_text = "Sorry, I'm having trouble right now. Please try again!"
+            except Exception as resp_err:
+                print(f"ERROR getting response: {resp_err}", file=sys.stderr)
+                log_error(user_id, 'response_error', str(resp_err))
+                response_text = "Sorry, I'm having trouble right now. Please try again!"
+                if progressive:
+                    progressive.finish(response_text)
+                else:
                     send_message(chat_id, response_text)
-                
-                print(f"✅ Message sent successfully", file=sys.stderr)
+            
+            print(f"✅ Message sent successfully", file=sys.stderr)
+
+
+@app.route('/', methods=['POST'])
+@app.route('/webhook', methods=['POST'])
+@app.route('/api/webhook', methods=['POST'])  # Handle Vercel path when route is /api/webhook
+def webhook():
+    """Handle incoming Telegram updates (messages and callback queries)"""
+    update = None
+    claimed = False
+    try:
+        print("=" * 50, file=sys.stderr)
+        print("WEBHOOK CALLED!", file=sys.stderr)
+        print("=" * 50, file=sys.stderr)
         
-        return jsonify({'ok': True})
+        update = request.get_json()
+        print(f"Update received: {update}", file=sys.stderr)
+        
+        if not TELEGRAM_TOKEN:
+            print("ERROR: NO TELEGRAM_TOKEN found!", file=sys.stderr)
+            return jsonify({'error': 'No token configured'}), 500
+        
+        # Telegram redelivers slow or failed updates - skip ones we already accepted
+        if is_duplicate_update(update):
+            return jsonify({'ok': True, 'duplicate': True})
+        # From here on the update_id is marked as seen; every non-2xx answer below
+        # must forget it again, or Telegram's redelivery would be suppressed
+        claimed = True
+        
+        # Queue mode: validate, enqueue and acknowledge right away
+        if UPDATE_INGESTION_MODE == 'queue':
+            if not is_valid_update(update):
+                print(f"⚠️ Ignoring malformed update", file=sys.stderr)
+                metrics.incr('updates.invalid')
+                return jsonify({'ok': True, 'ignored': True})
+            
+            if not get_update_queue(handle_update).submit(update):
+                # Queue full - ask Telegram to redeliver later
+                print(f"⚠️ Update queue full, rejecting update {update['update_id']}", file=sys.stderr)
+                forget_update(update)
+                return jsonify({'error': 'Update queue full'}), 503
+            
+            return jsonify({'ok': True, 'queued': True})
+        
+        # Inline reply mode: return the primary reply as a method call in the response body
+        if WEBHOOK_INLINE_REPLY:
+            with inline_reply_capture() as capture:
+                handle_update(update)
+            if capture['reply']:
+                method, payload = capture['reply']
+                metrics.incr('telegram.inline_replies')
+                return jsonify({'method': method, **payload})
+            return jsonify({'ok': True})
         
+        handle_update(update)
         return jsonify({'ok': True})
     
     except Exception as e:
@@ -304,6 +410,8 @@ What brings you in today? Let's find something awesome for you! 🎯"""
         print("=" * 50, file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
+        if claimed:
+            forget_update(update)
         return jsonify({'error': str(e)}), 500
 @app.route('/api/checkout', methods=['POST'])
 def checkout():
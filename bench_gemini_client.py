@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark for the Gemini HTTP client
+Compares one thread and one fresh connection per call (plain requests.post) with
+the shared async client, at increasing concurrency against the local Gemini stub
+
+Usage:
+    python bench_gemini_client.py
+    python bench_gemini_client.py --concurrency 8 32 128 --calls 256 --latency 0.5
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from api.gemini_client import AsyncGeminiClient, is_available
+from gemini_api_stub import GeminiAPIStub
+
+_BODY = {'contents': [{'role': 'user', 'parts': [{'text': 'User: recommend me a gift\n\nAlex:'}]}]}
+
+
+def summarize(latencies: list, elapsed: float, threads: int, connections: int) -> dict:
+    """Latencies are measured from the start of the run, so they include queueing for a slot"""
+    latencies.sort()
+    return {
+        'calls_per_s': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'threads': threads,
+        'connections': connections,
+    }
+
+
+def bench_threads(url: str, stub: GeminiAPIStub, calls: int, concurrency: int) -> dict:
+    """One blocked worker thread and one new connection per in-flight call"""
+    def call(_):
+        requests.post(url, json=_BODY, timeout=30).json()
+        return time.perf_counter() - started
+
+    connections = stub.connections
+    threads_before = threading.active_count()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, range(calls)))
+        threads = threading.active_count() - threads_before
+    return summarize(latencies, time.perf_counter() - started, threads, stub.connections - connections)
+
+
+def bench_async(url: str, stub: GeminiAPIStub, calls: int, concurrency: int) -> dict:
+    """All calls as coroutines on the client's event loop, over its keep-alive pool"""
+    client = AsyncGeminiClient(max_concurrency=concurrency)
+    client.start()
+
+    async def call():
+        (await client.post(url, _BODY, timeout=30)).json()
+        return time.perf_counter() - started
+
+    connections = stub.connections
+    started = time.perf_counter()
+    futures = [client.submit(call()) for _ in range(calls)]
+    latencies = [future.result() for future in futures]
+    result = summarize(latencies, time.perf_counter() - started, 1, stub.connections - connections)
+    client.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gemini client concurrency benchmark')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--calls', type=int, default=256, help='Calls per run')
+    parser.add_argument('--latency', type=float, default=0.2, help='Stub response latency (seconds)')
+    args = parser.parse_args()
+
+    if not is_available():
+        raise SystemExit("httpx is not installed (pip install httpx)")
+
+    stub = GeminiAPIStub(latency=args.latency)
+    url = f"{stub.start()}/models/gemini-2.5-flash:generateContent?key=bench"
+
+    print(f"{'client':>8} {'concurrency':>12} {'calls/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{'threads':>8} {'connections':>12}")
+    try:
+        for concurrency in args.concurrency:
+            for name, bench in (('threads', bench_threads), ('async', bench_async)):
+                result = bench(url, stub, args.calls, concurrency)
+                print(f"{name:>8} {concurrency:>12} {result['calls_per_s']:>9.1f} {result['p50_ms']:>9.1f} "
+                      f"{result['p95_ms']:>9.1f} {result['threads']:>8} {result['connections']:>12}")
+    finally:
+        stub.stop()
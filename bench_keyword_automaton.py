@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark for keyword detection
+Time per message of the Aho-Corasick automaton versus one substring search per
+keyword (the old detect_product loop), as the keyword set grows from the real
+catalog's keywords to tens of thousands of synthetic ones. Also times the real
+entry points on fresh messages: detect_product() with the synthetic keywords
+added to the catalog, and analyze_message(...).has_any() over the whole set.
+
+Usage:
+    python bench_keyword_automaton.py
+    python bench_keyword_automaton.py --sizes 100 1000 10000 50000 --messages 500
+"""
+import argparse
+import random
+import statistics
+import time
+
+from api import message_analysis
+from api.keyword_automaton import KeywordAutomaton
+from api.message_analysis import analyze_message, register_keywords
+from api.product_data import PRODUCT_KEYWORDS, PRODUCT_PRICES, detect_product
+
+_MESSAGES = [
+    "hi! do you have wireless earbuds that are good for running?",
+    "I'm looking for a smartwatch with long battery life, what would you suggest",
+    "compare the vr headset and the portable projector please",
+    "how much is the smart doorbell cam and does it come with cloud storage",
+    "my order was cancelled and I don't know why, this is the third time",
+    "what's the cheapest thing for a smart home? I'm on a budget",
+    "thanks, that's all for now - bye",
+]
+
+
+def synthetic_keywords(size: int, seed: int = 11) -> list:
+    """The real product keywords plus made-up one- to three-word product phrases"""
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 'tra', 'zen', 'vo', 'qui', 'dex', 'ra', 'po', 'sun', 'ex', 'ul', 'tor', 'be']
+    keywords = set(PRODUCT_KEYWORDS)
+    while len(keywords) < size:
+        words = [''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        keywords.add(' '.join(words))
+    return sorted(keywords)[:size]
+
+
+def time_per_message(detect, messages: list, rounds: int) -> float:
+    """Median microseconds per message over rounds passes (each pass analyzes every message afresh)"""
+    samples = []
+    for _ in range(rounds):
+        message_analysis._analyze.cache_clear()
+        started = time.perf_counter()
+        for message in messages:
+            detect(message)
+        samples.append((time.perf_counter() - started) / len(messages) * 1e6)
+    return statistics.median(samples)
+
+
+def bench(size: int, messages: list, rounds: int) -> dict:
+    keywords = synthetic_keywords(size)
+
+    started = time.perf_counter()
+    automaton = KeywordAutomaton(keywords)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    def naive(message):
+        # What detect_product did per call: sort by length, then one substring search per keyword
+        return [keyword for keyword in sorted(keywords, key=len, reverse=True) if keyword in message]
+
+    # The same keywords in the catalog and the shared vocabulary (rebuilt once, outside the timing)
+    product = next(iter(PRODUCT_PRICES))
+    for keyword in keywords:
+        PRODUCT_KEYWORDS.setdefault(keyword, product)
+    register_keywords(keywords)
+    detect_product(messages[0])
+
+    return {
+        'build_ms': build_ms,
+        'states': automaton.states,
+        'automaton_us': time_per_message(automaton.scan, messages, rounds),
+        'naive_us': time_per_message(naive, messages, rounds),
+        'detect_us': time_per_message(detect_product, messages, rounds),
+        'has_any_us': time_per_message(lambda message: analyze_message(message).has_any(keywords), messages, rounds),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keyword automaton vs per-keyword substring search')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--messages', type=int, default=70, help='Messages per timing pass')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    # Distinct texts, so every call in a pass builds a new analysis
+    messages = [f"{_MESSAGES[i % len(_MESSAGES)].lower()} (#{i})" for i in range(args.messages)]
+    print("Time per message in microseconds")
+    print(f"{'keywords':>9} {'build (ms)':>11} {'states':>9} {'scan':>8} {'substring':>10} "
+          f"{'detect_product':>15} {'has_any':>8}")
+    for size in args.sizes:
+        result = bench(size, messages, args.rounds)
+        print(f"{size:>9} {result['build_ms']:>11.1f} {result['states']:>9} {result['automaton_us']:>8.1f} "
+              f"{result['naive_us']:>10.1f} {result['detect_us']:>15.1f} {result['has_any_us']:>8.1f}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Benchmark for product retrieval
+Prompt size with the whole catalog inline versus the top-k retrieved products,
+and index build and query time, as the catalog grows (synthetic variants of
+the real products)
+
+Usage:
+    python bench_product_retrieval.py
+    python bench_product_retrieval.py --sizes 21 1000 10000 --top-k 5 --queries 500
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from api.product_data import PRODUCT_PRICES, PRODUCT_SPECS, PRODUCT_KEYWORDS
+from api.product_retrieval import ProductIndex
+from api.prompt_loader import estimate_tokens
+
+_VARIANTS = ['Lite', 'Plus', 'Max', 'Ultra', 'Go', 'Air', 'Studio', 'Sport', 'Kids', 'Travel', 'Home', 'Eco']
+_COLOURS = ['Black', 'White', 'Blue', 'Red', 'Green', 'Silver', 'Rose', 'Graphite']
+
+_QUERIES = [
+    "do you have wireless earbuds for running",
+    "I need a smartwatch with long battery life",
+    "something to light up my living room",
+    "gift under $50 for my dad",
+    "what's the cheapest speaker",
+    "camera for my front door",
+    "compare the vr headset and the projector",
+    "portable charger for camping",
+    "keyboard for my tablet",
+    "hello, what do you sell?",
+]
+
+
+def synthetic_catalog(size: int, seed: int = 7):
+    """The real catalog plus variant/colour SKUs of its products until it has size products"""
+    rng = random.Random(seed)
+    prices, specs, keywords = dict(PRODUCT_PRICES), dict(PRODUCT_SPECS), dict(PRODUCT_KEYWORDS)
+    bases = list(PRODUCT_PRICES)
+    for number in itertools.count(1):
+        if len(prices) >= size:
+            break
+        base = rng.choice(bases)
+        name = f"{base} {rng.choice(_VARIANTS)} {rng.choice(_COLOURS)} #{number}"
+        prices[name] = max(5, round(PRODUCT_PRICES[base] * rng.uniform(0.6, 1.6)))
+        specs[name] = PRODUCT_SPECS.get(base, '')
+        keywords[f"{base.lower()} {number}"] = name
+    return dict(itertools.islice(prices.items(), size)), specs, keywords
+
+
+def bench(size: int, top_k: int, queries: int) -> dict:
+    prices, specs, keywords = synthetic_catalog(size)
+
+    started = time.perf_counter()
+    index = ProductIndex(prices, specs, keywords)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    full_tokens = estimate_tokens(index.format(index.names))
+    latencies, block_tokens = [], []
+    for query in itertools.islice(itertools.cycle(_QUERIES), queries):
+        started = time.perf_counter()
+        names = index.search(query, top_k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        block_tokens.append(estimate_tokens(index.format(names or index.names[:top_k])))
+    latencies.sort()
+    return {
+        'build_ms': build_ms,
+        'full_tokens': full_tokens,
+        'topk_tokens': statistics.mean(block_tokens),
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Product retrieval prompt size and latency benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[21, 1000, 10000, 100000])
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200, help='Queries per catalog size')
+    args = parser.parse_args()
+
+    print(f"{'products':>9} {'build (ms)':>11} {'full list (tok)':>16} {'top-k (tok)':>12} "
+          f"{'query p50 (ms)':>15} {'query p95 (ms)':>15}")
+    for size in args.sizes:
+        result = bench(size, args.top_k, args.queries)
+        print(f"{size:>9} {result['build_ms']:>11.1f} {result['full_tokens']:>16} {result['topk_tokens']:>12.0f} "
+              f"{result['p50_ms']:>15.3f} {result['p95_ms']:>15.3f}")
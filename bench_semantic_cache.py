@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Benchmark for the semantic response cache
+Measures lookup latency and memory of SemanticCache as the number of cached questions grows
+
+Usage:
+    python bench_semantic_cache.py
+    python bench_semantic_cache.py --sizes 1000 10000 100000 1000000 --dim 256
+"""
+import argparse
+import random
+import time
+
+from api.semantic_cache import SemanticCache, is_available
+
+_WORDS = ['price', 'smartwatch', 'speaker', 'earbuds', 'battery', 'waterproof', 'shipping', 'return',
+          'warranty', 'camera', 'projector', 'tracker', 'charge', 'color', 'size', 'discount', 'bundle',
+          'gps', 'bluetooth', 'range', 'lumens', 'resolution', 'delivery', 'refund', 'stock', 'gift']
+
+
+def random_question(rng: random.Random) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(3, 7)))
+
+
+def fill(cache: SemanticCache, size: int, topics: int, rng: random.Random):
+    """
+    Fill the cache with random questions
+
+    The first 1,000 go through add(); the rest reuse those vectors and are
+    written straight into the matrix, since vectorizing 1M strings would
+    dominate the run.
+    """
+    for i in range(min(size, 1000)):
+        cache.add(random_question(rng), f"answer {i}", i % topics)
+    seeded = len(cache)
+    while len(cache) < size:
+        rows = len(cache)
+        batch = min(size - rows, 100_000)
+        while rows + batch > len(cache._scopes):
+            cache._grow()
+        source = [j % seeded for j in range(rows, rows + batch)]
+        cache._vectors[rows:rows + batch] = cache._vectors[source]
+        cache._scopes[rows:rows + batch] = [j % topics for j in range(rows, rows + batch)]
+        cache._answers[rows:rows + batch] = [f"answer {j}" for j in range(rows, rows + batch)]
+        cache._words[rows:rows + batch] = [cache._words[j] for j in source]
+        cache._size += batch
+
+
+def bench(size: int, dim: int, topics: int, lookups: int) -> dict:
+    rng = random.Random(size)
+    cache = SemanticCache(max_entries=size, dim=dim)
+    fill(cache, size, topics, rng)
+
+    queries = [random_question(rng) for _ in range(lookups)]
+    started = time.perf_counter()
+    for i, query in enumerate(queries):
+        cache.lookup(query, i % topics)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'entries': len(cache),
+        'lookup_ms': elapsed / lookups * 1000,
+        'memory_mb': cache.nbytes / 1024 / 1024,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Semantic cache lookup benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--dim', type=int, default=256, help='Vector dimensions')
+    parser.add_argument('--topics', type=int, default=20, help='Distinct products/FAQ topics')
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    if not is_available():
+        raise SystemExit("numpy is not installed (pip install numpy)")
+
+    print(f"{'entries':>10} {'lookup (ms)':>12} {'memory (MB)':>12}")
+    for size in args.sizes:
+        result = bench(size, args.dim, args.topics, args.lookups)
+        print(f"{result['entries']:>10,} {result['lookup_ms']:>12.3f} {result['memory_mb']:>12.1f}")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Local Telegram Bot API stub for load tests and end-to-end checks
+Serves synthetic getUpdates batches and answers send/edit calls without touching Telegram
+
+Usage:
+    python bot_api_stub.py --port 8081 --updates 1000 --chats 50
+    TELEGRAM_API_BASE=http://127.0.0.1:8081 TELEGRAM_TOKEN=stub python poll.py --max-updates 1000
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_MESSAGES = [
+    "hi",
+    "Tell me about the smartwatch",
+    "How much does it cost?",
+    "What's the cheapest audio product?",
+    "Show me bundles",
+    "Compare earbuds and headphones",
+    "What's your return policy?",
+    "I want a fitness tracker",
+    "thanks!",
+]
+
+
+class BotAPIStub:
+    """
+    In-process fake of the Bot API endpoints the bot uses
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, max_poll_wait: float = 1.0,
+                 first_update_id: int = 1):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 = pick a free port)
+            latency: Artificial delay added to every call, in seconds
+            max_poll_wait: Cap on how long an empty getUpdates call blocks
+            first_update_id: update_id of the first synthetic update
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.max_poll_wait = max_poll_wait
+        self.calls = Counter()
+        self.sent = []
+        self.blocked_chats = set()
+        self.invalid_file_ids = set()
+        self.rate_limit_every = 0
+        self.retry_after = 1
+        self._updates = []
+        self._update_ids = itertools.count(first_update_id)
+        self._message_ids = itertools.count(1000)
+        self._lock = threading.Lock()
+        self._new_updates = threading.Condition(self._lock)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """Value to use for TELEGRAM_API_BASE"""
+        return f"http://{self.host}:{self.port}"
+
+    def add_text_updates(self, count: int, chats: int = 10, messages: list = None):
+        """
+        Queue synthetic text message updates for getUpdates
+
+        Args:
+            count: Number of updates to generate
+            chats: Number of distinct chats to spread them over
+            messages: Message texts to cycle through
+        """
+        messages = messages or SAMPLE_MESSAGES
+        with self._new_updates:
+            for i in range(count):
+                chat_id = 500000 + (i % chats)
+                update_id = next(self._update_ids)
+                self._updates.append({
+                    'update_id': update_id,
+                    'message': {
+                        'message_id': update_id,
+                        'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': chat_id, 'first_name': f"Load{chat_id}"},
+                        'text': messages[i % len(messages)]
+                    }
+                })
+            self._new_updates.notify_all()
+
+    def pending_updates(self) -> int:
+        """Number of updates not yet confirmed through a getUpdates offset"""
+        with self._lock:
+            return len(self._updates)
+
+    def start(self) -> str:
+        """Start serving in a background thread and return the base URL"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                try:
+                    payload = json.loads(body) if body else {}
+                except ValueError:
+                    payload = {}
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                status, response = stub.handle(method, payload)
+                self._reply(status, response)
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._reply(200, {'calls': dict(stub.calls), 'pending_updates': stub.pending_updates()})
+                else:
+                    self._reply(404, {'ok': False, 'description': 'Not Found'})
+
+            def _reply(self, status, response):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """Stop the server"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle(self, method: str, payload: dict):
+        """
+        Answer one Bot API call
+
+        Returns:
+            Tuple of (HTTP status, response body dict)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.calls[method] += 1
+            call_number = self.calls[method]
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(payload)}
+
+        if method in ('deleteWebhook', 'answerCallbackQuery'):
+            return 200, {'ok': True, 'result': True}
+
+        chat_id = payload.get('chat_id')
+        if chat_id in self.blocked_chats:
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+
+        if self.rate_limit_every and call_number % self.rate_limit_every == 0:
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }
+
+        sent_media = [item.get('media') for item in payload.get('media', [])] + [payload.get('photo')]
+        if self.invalid_file_ids.intersection(sent_media):
+            return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: wrong file identifier/HTTP URL specified'}
+
+        with self._lock:
+            self.sent.append((method, payload))
+
+        if method == 'sendMediaGroup':
+            return 200, {'ok': True, 'result': [
+                self._message(chat_id, photo=item.get('media'))
+                for item in payload.get('media', [])
+            ]}
+        if method == 'sendPhoto':
+            return 200, {'ok': True, 'result': self._message(chat_id, photo=payload.get('photo'))}
+        if method == 'editMessageText':
+            return 200, {'ok': True, 'result': self._message(chat_id, text=payload.get('text'),
+                                                              message_id=payload.get('message_id'))}
+        if method == 'sendMessage':
+            return 200, {'ok': True, 'result': self._message(chat_id, text=payload.get('text'))}
+
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    def _get_updates(self, payload: dict) -> list:
+        """getUpdates with offset confirmation and a short long-poll wait"""
+        offset = payload.get('offset')
+        limit = min(int(payload.get('limit', 100)), 100)
+        wait = min(float(payload.get('timeout', 0)), self.max_poll_wait)
+
+        with self._new_updates:
+            if offset is not None:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and wait > 0:
+                self._new_updates.wait(wait)
+            return list(self._updates[:limit])
+
+    def _message(self, chat_id, text=None, photo=None, message_id=None) -> dict:
+        """Build a fake Message object"""
+        message = {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id}
+        }
+        if text is not None:
+            message['text'] = text
+        if photo is not None:
+            # Like Telegram, re-sending by file_id returns the same file_id
+            if str(photo).startswith('stub-'):
+                file_id = photo
+            else:
+                file_id = 'stub-' + hashlib.sha1(str(photo).encode('utf-8')).hexdigest()[:16]
+            message['photo'] = [
+                {'file_id': f"{file_id}-s", 'width': 90, 'height': 90},
+                {'file_id': file_id, 'width': 1280, 'height': 1280}
+            ]
+        return message
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Telegram Bot API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--updates', type=int, default=0, help='Synthetic text updates to serve via getUpdates')
+    parser.add_argument('--chats', type=int, default=10, help='Distinct chats the updates are spread over')
+    parser.add_argument('--latency', type=float, default=0.0, help='Artificial delay per call (seconds)')
+    args = parser.parse_args()
+
+    stub = BotAPIStub(host=args.host, port=args.port, latency=args.latency)
+    if args.updates:
+        stub.add_text_updates(args.updates, chats=args.chats)
+    base_url = stub.start()
+
+    print(f"Bot API stub listening on {base_url}")
+    print(f"Use: TELEGRAM_API_BASE={base_url}")
+    print(f"Stats: {base_url}/stats")
+    print("\nPress Ctrl+C to stop\n")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
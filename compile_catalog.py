@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Build step for the compiled prompt catalog
+Writes prompts/products_compiled.txt from api/product_data (prices and specs)
+and reports the catalog's tokens per call before and after
+
+Usage:
+    python compile_catalog.py            # compile and report
+    python compile_catalog.py --check    # exit 1 if the compiled file is stale
+"""
+import argparse
+import sys
+
+from api.catalog_encoding import COMPILED_CATALOG_PATH, compile_catalog, is_current, token_report
+
+
+def print_report(report: dict):
+    print(f"Catalog: {report['products']} products (sha256 {report['hash'][:12]})")
+    print(f"  products.txt:     {report['text_tokens']:>6} tokens per call")
+    print(f"  compiled table:   {report['compiled_tokens']:>6} tokens per call")
+    print(f"  saved:            {report['saved_tokens']:>6} tokens ({report['saved_percent']}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the product catalog into a compact prompt table')
+    parser.add_argument('--output', default=COMPILED_CATALOG_PATH)
+    parser.add_argument('--check', action='store_true', help='Only check that the compiled file is current')
+    args = parser.parse_args()
+
+    if args.check:
+        print_report(token_report())
+        if not is_current(args.output):
+            print(f"❌ {args.output} is stale - run python compile_catalog.py", file=sys.stderr)
+            sys.exit(1)
+        print("✅ Compiled catalog is current")
+    else:
+        print_report(compile_catalog(args.output))
+        print(f"✅ Wrote {args.output}")
@@ -0,0 +1,10 @@
+"""
+Pytest configuration
+Points the tests at a throwaway SQLite database before any api module opens
+the engine, so a test run never writes saleschatbot.db (or a real database)
+"""
+import os
+import tempfile
+
+_database_dir = tempfile.TemporaryDirectory(prefix='saleschatbot-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'test.db')}"
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+Local Gemini API stub for latency tests and end-to-end checks
+Answers generateContent and streamGenerateContent (SSE) with canned text and
+implements the cachedContents lifecycle (create, extend, delete, expiry)
+
+Usage:
+    python gemini_api_stub.py --port 8082 --latency 0.5
+    GEMINI_API_BASE=http://127.0.0.1:8082/v1beta GOOGLE_API_KEY=stub python run.py
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+DEFAULT_REPLY = ("Great question! 😊 The Smartwatch X is our best seller - heart rate, GPS, "
+                 "and a 7-day battery. Want me to show you the price?")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # benchmarks open many connections at once
+
+
+class GeminiAPIStub:
+    """
+    In-process fake of the Gemini model endpoints the bot uses
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, reply: str = DEFAULT_REPLY,
+                 latency: float = 0.0, chunk_delay: float = 0.0, chunks: int = 4):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 = pick a free port)
+            reply: Text every request is answered with
+            latency: Delay before the first byte, in seconds
+            chunk_delay: Delay between streamed chunks, in seconds
+            chunks: Number of chunks a streamed reply is split into
+        """
+        self.host = host
+        self.port = port
+        self.reply = reply
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.fail_stream_after = None
+        self.status_code = 200
+        self.calls = Counter()
+        self.requests = []
+        self.cached_contents = {}
+        self.keys = Counter()
+        self.models = Counter()
+        self.rate_limited_keys = set()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        """Value to use for GEMINI_API_BASE"""
+        return f"http://{self.host}:{self.port}/v1beta"
+
+    def start(self) -> str:
+        """Start serving in a background thread and return the base URL"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def _read(self, verb):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                path, _, query = self.path.partition('?')
+                self.api_key = parse_qs(query).get('key', [''])[0]
+                if ':' in path:
+                    method = path.rsplit(':', 1)[-1]
+                elif '/cachedContents' in path:
+                    method = f"cachedContents.{verb}"
+                else:
+                    method = path.rsplit('/', 1)[-1]
+                with stub._lock:
+                    stub.calls[method] += 1
+                    stub.requests.append((method, path, body))
+                    if ':' in path:
+                        stub.keys[self.api_key] += 1
+                        stub.models[path.rsplit('/', 1)[-1].split(':', 1)[0]] += 1
+                return method, path, body
+
+            def do_POST(self):
+                method, path, body = self._read('create')
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if self.api_key in stub.rate_limited_keys and ':' in path:
+                    self._json(429, {'error': {'code': 429, 'message': 'Resource has been exhausted',
+                                               'details': [{'retryDelay': '30s'}]}})
+                    return
+
+                cached_tokens = 0
+                if body.get('cachedContent'):
+                    cached_tokens = stub.cached_token_count(body['cachedContent'])
+                    if cached_tokens is None:
+                        self._json(404, {'error': {'code': 404, 'message': 'CachedContent not found'}})
+                        return
+
+                if stub.status_code != 200:
+                    self._json(stub.status_code, {'error': {'code': stub.status_code, 'message': 'stub error'}})
+                elif method == 'cachedContents.create':
+                    self._json(200, stub.create_cached_content(body))
+                elif method == 'streamGenerateContent':
+                    self._stream(cached_tokens)
+                elif method == 'generateContent':
+                    self._json(200, stub.response_body(stub.reply, cached_tokens))
+                else:
+                    self._json(404, {'error': {'code': 404, 'message': f"Unknown method {method}"}})
+
+            def do_PATCH(self):
+                method, path, body = self._read('patch')
+                name = path.split('/v1beta/', 1)[-1]
+                with stub._lock:
+                    entry = stub.cached_contents.get(name)
+                    if entry is not None:
+                        entry['expires_at'] = time.monotonic() + float(body.get('ttl', '3600s').rstrip('s'))
+                if entry is None:
+                    self._json(404, {'error': {'code': 404, 'message': 'CachedContent not found'}})
+                else:
+                    self._json(200, {'name': name})
+
+            def do_DELETE(self):
+                method, path, body = self._read('delete')
+                with stub._lock:
+                    stub.cached_contents.pop(path.split('/v1beta/', 1)[-1], None)
+                self._json(200, {})
+
+            def _json(self, status, response):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, cached_tokens=0):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for i, piece in enumerate(stub.split_reply()):
+                    if stub.fail_stream_after is not None and i >= stub.fail_stream_after:
+                        self.wfile.write(b"data: {broken\r\n\r\n")
+                        break
+                    event = f"data: {json.dumps(stub.response_body(piece, cached_tokens))}\r\n\r\n"
+                    self.wfile.write(event.encode('utf-8'))
+                    self.wfile.flush()
+                    if stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        """Stop the server"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def split_reply(self) -> list:
+        """Split the reply into roughly equal streamed chunks"""
+        size = max(1, -(-len(self.reply) // self.chunks))
+        return [self.reply[i:i + size] for i in range(0, len(self.reply), size)]
+
+    def create_cached_content(self, body: dict) -> dict:
+        """Register a cachedContents entry and return its resource"""
+        text = ''.join(part.get('text', '') for part in body.get('systemInstruction', {}).get('parts', []))
+        ttl = float(body.get('ttl', '3600s').rstrip('s'))
+        with self._lock:
+            name = f"cachedContents/stub-{self.calls['cachedContents.create']}"
+            self.cached_contents[name] = {'body': body, 'tokens': max(1, len(text) // 4),
+                                          'expires_at': time.monotonic() + ttl}
+        return {'name': name, 'model': body.get('model'), 'usageMetadata': {'totalTokenCount': max(1, len(text) // 4)}}
+
+    def cached_token_count(self, name: str):
+        """Token count of a live cachedContents entry, None if it is unknown or expired"""
+        with self._lock:
+            entry = self.cached_contents.get(name)
+            if entry is None or entry['expires_at'] <= time.monotonic():
+                return None
+            return entry['tokens']
+
+    def expire_cached_contents(self):
+        """Drop every cachedContents entry, as if their TTLs had run out"""
+        with self._lock:
+            self.cached_contents.clear()
+
+    @staticmethod
+    def response_body(text: str, cached_tokens: int = 0) -> dict:
+        """Build a GenerateContentResponse carrying text"""
+        usage = {
+            'promptTokenCount': 900,
+            'candidatesTokenCount': max(1, len(text) // 4),
+            'totalTokenCount': 900 + max(1, len(text) // 4)
+        }
+        if cached_tokens:
+            usage['cachedContentTokenCount'] = cached_tokens
+        return {
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': text}]},
+                'finishReason': 'STOP'
+            }],
+            'usageMetadata': usage
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Gemini API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay before the first byte (seconds)')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Delay between streamed chunks (seconds)')
+    args = parser.parse_args()
+
+    stub = GeminiAPIStub(host=args.host, port=args.port, latency=args.latency, chunk_delay=args.chunk_delay)
+    base_url = stub.start()
+
+    print(f"Gemini API stub listening on {base_url}")
+    print(f"Use: GEMINI_API_BASE={base_url}")
+    print("\nPress Ctrl+C to stop\n")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
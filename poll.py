@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Long-polling runner (getUpdates) for workers without a public HTTPS endpoint
+Pulls batches of updates, groups them by chat and processes each chat's updates
+in order with one user lookup and one commit per chat, reusing the webhook's
+handler logic. A failed update holds the offset, so Telegram sends it again
+
+Usage:
+    python poll.py                        # run forever
+    python poll.py --once                 # process one batch and exit
+    python poll.py --max-updates 1000     # stop after N updates (throughput runs)
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the api package importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api import metrics
+from api.database import ensure_users, savepoint, unit_of_work
+from api.telegram_handler import get_updates, delete_webhook, TELEGRAM_API_BASE
+from api.update_dedup import forget_update, is_duplicate_update
+from api.update_queue import get_update_chat_id, is_valid_update
+from api.webhook import handle_update
+
+# A failed update is redelivered (by holding the offset) until it has failed this many times
+POLL_MAX_ATTEMPTS = int(os.getenv('POLL_MAX_ATTEMPTS', '3'))
+
+
+def group_by_chat(updates: list) -> dict:
+    """
+    Group updates by chat, keeping arrival order within each chat
+
+    Args:
+        updates: Updates returned by getUpdates
+
+    Returns:
+        Dictionary mapping chat_id to its list of updates
+    """
+    groups = {}
+    for update in updates:
+        groups.setdefault(get_update_chat_id(update), []).append(update)
+    return groups
+
+
+def _sender_profile(update: dict) -> dict:
+    """Extract the user profile fields of an update's sender"""
+    source = update.get('callback_query') or update.get('message') or {}
+    sender = source.get('from', {})
+    return {
+        'user_id': sender.get('id'),
+        'username': sender.get('username'),
+        'first_name': sender.get('first_name')
+    }
+
+
+def process_chat_updates(updates: list) -> tuple:
+    """
+    Process one chat's updates in order in one unit of work
+
+    The senders are looked up with one query up front and all the updates'
+    writes are committed together at the end. Each update runs in its own
+    savepoint, so a failed update rolls back only its own writes.
+
+    Args:
+        updates: Updates for a single chat, oldest first
+
+    Returns:
+        (number of updates handled successfully, update_ids of the failed ones)
+    """
+    done, failed = [], []
+    try:
+        with unit_of_work() as batch:
+            try:
+                ensure_users([_sender_profile(u) for u in updates])
+            except Exception as e:
+                print(f"⚠️ Batched user lookup failed, falling back per update: {e}", file=sys.stderr)
+
+            for update in updates:
+                if is_duplicate_update(update):
+                    continue
+                try:
+                    with metrics.timer('poll.update_ms'):
+                        with savepoint(update.get('update_id')):
+                            handle_update(update)
+                    done.append(update)
+                except Exception as e:
+                    failed.append(update)
+                    print(f"❌ Error handling update {update.get('update_id')}: {e}", file=sys.stderr)
+    except Exception:
+        # The chat's commit failed as a whole: none of its updates were stored
+        failed, done = failed + done, []
+    else:
+        failed += [u for u in done if u.get('update_id') in batch['failed']]
+        done = [u for u in done if u.get('update_id') not in batch['failed']]
+
+    for update in failed:
+        forget_update(update)
+    metrics.incr('updates.processed', len(done))
+    metrics.incr('updates.failed', len(failed))
+    return len(done), [u.get('update_id') for u in failed]
+
+
+def process_batch(updates: list, executor: ThreadPoolExecutor) -> tuple:
+    """
+    Process a getUpdates batch: chats in parallel, each chat in order
+
+    Args:
+        updates: Updates returned by getUpdates
+        executor: Pool used to run chat groups concurrently
+
+    Returns:
+        (number of updates handled successfully, update_ids of the failed ones)
+    """
+    valid = []
+    for update in updates:
+        if is_valid_update(update):
+            valid.append(update)
+        else:
+            metrics.incr('updates.invalid')
+
+    groups = group_by_chat(valid)
+    metrics.observe('poll.chats_per_batch', len(groups))
+    handled, failed = 0, []
+    for chat_handled, chat_failed in executor.map(process_chat_updates, groups.values()):
+        handled += chat_handled
+        failed += chat_failed
+    return handled, failed
+
+
+def next_offset(updates: list, failed: list, attempts: Counter, max_attempts: int = POLL_MAX_ATTEMPTS) -> int:
+    """
+    Offset for the next getUpdates call: held at the first failed update so it is redelivered
+
+    The updates after it come back too and are skipped as duplicates. An update
+    that has failed max_attempts times is given up on, so it can't stall the chat.
+
+    Args:
+        updates: The batch just processed
+        failed: update_ids that failed
+        attempts: Failures so far per update_id (updated in place)
+        max_attempts: Tries before an update is dropped
+
+    Returns:
+        The update_id to confirm up to
+    """
+    retry = []
+    for update_id in failed:
+        attempts[update_id] += 1
+        if attempts[update_id] < max_attempts:
+            retry.append(update_id)
+        else:
+            metrics.incr('updates.dropped')
+            print(f"❌ Giving up on update {update_id} after {max_attempts} attempts", file=sys.stderr)
+    for update_id in set(attempts) - set(retry):
+        del attempts[update_id]
+    if retry:
+        return min(retry)
+    return max(u.get('update_id', 0) for u in updates) + 1
+
+
+def run(limit: int = 100, timeout: int = 30, workers: int = 8, once: bool = False, max_updates: int = None):
+    """
+    Poll getUpdates until stopped
+
+    Args:
+        limit: Maximum updates per getUpdates call (1-100)
+        timeout: Long-polling timeout in seconds
+        workers: Chat groups processed concurrently
+        once: Stop after the first non-empty batch
+        max_updates: Stop after this many updates have been received
+    """
+    offset = None
+    attempts = Counter()
+    received = 0
+    handled = 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poll-chat') as executor:
+        while True:
+            with metrics.timer('poll.get_updates_ms'):
+                updates = get_updates(offset=offset, limit=limit, timeout=timeout)
+            if not updates:
+                if once:
+                    break
+                continue
+
+            received += len(updates)
+            metrics.incr('poll.updates_received', len(updates))
+
+            with metrics.timer('poll.batch_ms'):
+                batch_handled, failed = process_batch(updates, executor)
+            handled += batch_handled
+
+            # Confirm the batch on the next call, except from the first failed update on
+            offset = next_offset(updates, failed, attempts)
+
+            elapsed = time.perf_counter() - started
+            print(f"📊 {received} updates received, {handled} handled, "
+                  f"{received / elapsed:.1f} updates/s", file=sys.stderr)
+
+            if once or (max_updates and received >= max_updates):
+                break
+
+    # Confirm the last batch so a restart doesn't see it again
+    if offset is not None:
+        get_updates(offset=offset, limit=1, timeout=0)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'received': received,
+        'handled': handled,
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_s': round(received / elapsed, 1) if elapsed else 0.0
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the bot with getUpdates long polling')
+    parser.add_argument('--limit', type=int, default=100, help='Updates per getUpdates call (max 100)')
+    parser.add_argument('--timeout', type=int, default=30, help='Long-polling timeout in seconds')
+    parser.add_argument('--workers', type=int, default=8, help='Chats processed concurrently')
+    parser.add_argument('--once', action='store_true', help='Process a single batch and exit')
+    parser.add_argument('--max-updates', type=int, default=None, help='Stop after N updates')
+    parser.add_argument('--delete-webhook', action='store_true',
+                        help='Remove the webhook first (Telegram rejects getUpdates while one is set)')
+    args = parser.parse_args()
+
+    print(f"Polling {TELEGRAM_API_BASE} for updates...")
+    if args.delete_webhook:
+        delete_webhook()
+    print("\nPress Ctrl+C to stop\n")
+
+    try:
+        summary = run(
+            limit=max(1, min(args.limit, 100)),
+            timeout=args.timeout,
+            workers=args.workers,
+            once=args.once,
+            max_updates=args.max_updates
+        )
+        print(f"\n✅ Done: {summary}")
+    except KeyboardInterrupt:
+        print("\nStopped")
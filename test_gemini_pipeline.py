@@ -0,0 +1,901 @@
+"""
+Test script for the Gemini response pipeline (streaming, response and prompt caching) against local API stubs
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import (catalog_encoding, circuit_breaker, gemini_handler, gemini_pool, intent_router, message_analysis,
+                 metrics, product_retrieval, prompt_cache, response_cache, structured_output, telegram_handler)
+from api.conversation_history import build_history
+from api.database import get_or_create_user, get_session, init_db
+from api.database_memory import clear_user_memory, get_user_memory
+from api.generation_profiles import choose_profile
+from api.models import ChatMessageHistory
+from api.emotion_detector import detect_emotion
+from api.keyword_automaton import WHOLE_WORD, WORD_START, KeywordAutomaton
+from api.product_data import PRODUCT_KEYWORDS, PRODUCT_PRICES, PRODUCT_SPECS, detect_product
+from api.responses import get_fallback_response
+from api.prompt_loader import estimate_tokens
+from api.semantic_cache import SemanticCache
+from bot_api_stub import BotAPIStub
+from gemini_api_stub import GeminiAPIStub
+
+
+class stubbed_apis:
+    """
+    Point the Gemini and Bot API clients at local stubs for the duration of a test
+
+    The intent router is off unless route_intents=True, so catalog questions reach the stub.
+    """
+
+    def __init__(self, route_intents=False, **gemini_options):
+        self.route_intents = route_intents
+        self.gemini = GeminiAPIStub(port=0, **gemini_options)
+        self.bot = BotAPIStub(port=0)
+
+    def __enter__(self):
+        self._original = (gemini_handler.GEMINI_API_BASE, gemini_handler.GOOGLE_API_KEY,
+                          gemini_handler.GOOGLE_API_KEYS, gemini_handler._key_pool,
+                          telegram_handler.TELEGRAM_API_BASE, intent_router.INTENT_ROUTER_ENABLED)
+        intent_router.INTENT_ROUTER_ENABLED = self.route_intents
+        gemini_handler.GEMINI_API_BASE = self.gemini.start()
+        gemini_handler.GOOGLE_API_KEY = 'stub'
+        gemini_handler.GOOGLE_API_KEYS = []
+        gemini_handler._key_pool = gemini_pool.GeminiKeyPool('gemini')
+        telegram_handler.TELEGRAM_API_BASE = self.bot.start()
+        response_cache._response_cache.invalidate()
+        prompt_cache.invalidate_prefix_handle()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        (gemini_handler.GEMINI_API_BASE, gemini_handler.GOOGLE_API_KEY,
+         gemini_handler.GOOGLE_API_KEYS, gemini_handler._key_pool,
+         telegram_handler.TELEGRAM_API_BASE, intent_router.INTENT_ROUTER_ENABLED) = self._original
+        gemini_pool._pools['gemini'] = gemini_handler._key_pool
+        self.gemini.stop()
+        self.bot.stop()
+        return False
+
+
+def test_streaming_progressive_edits():
+    """Test that a streamed reply is shown early and edited into the final text"""
+    print("\n" + "="*60)
+    print("TEST 1: Streaming with Progressive Edits")
+    print("="*60)
+
+    metrics.reset()
+    with stubbed_apis(chunk_delay=0.05, chunks=4) as stubs:
+        progressive = telegram_handler.ProgressiveMessage(4242, edit_interval=0)
+        text = gemini_handler.get_response_stream("tell me about the smartwatch", on_text=progressive.update)
+        progressive.finish(text)
+
+        methods = [method for method, _ in stubs.bot.sent]
+        final = stubs.bot.sent[-1][1]
+
+    snapshot = metrics.snapshot()
+    ttfb = snapshot['timings']['gemini.ttfb_ms']['p50_ms']
+    total = snapshot['timings']['gemini.total_ms']['p50_ms']
+    print(f"📊 Bot API calls: {methods}")
+    print(f"📊 TTFB: {ttfb} ms, total: {total} ms")
+
+    assert text == stubs.gemini.reply
+    assert methods[0] == 'sendMessage'
+    assert 'parse_mode' not in stubs.bot.sent[0][1]            # interim text is plain
+    assert methods.count('editMessageText') >= 2
+    assert final['text'] == text and final['parse_mode'] == 'Markdown'
+    assert ttfb < total
+
+
+def test_streaming_falls_back_when_broken():
+    """Test that a broken stream returns the keyword fallback response"""
+    print("\n" + "="*60)
+    print("TEST 2: Streaming Fallback")
+    print("="*60)
+
+    metrics.reset()
+    with stubbed_apis() as stubs:
+        stubs.gemini.fail_stream_after = 1
+        text = gemini_handler.get_response_stream("what is your return policy")
+
+    print(f"📊 Fallback reply: {text[:60]}...")
+    assert text and text != stubs.gemini.reply
+    assert metrics.get_counter('gemini.stream_fallbacks') == 1
+
+
+def test_response_cache():
+    """Test normalized cache hits, context-dependent bypass and catalog invalidation"""
+    print("\n" + "="*60)
+    print("TEST 3: Normalized Response Cache")
+    print("="*60)
+
+    assert response_cache.normalize_message("What's the price of Smartwatch X??") == \
+        response_cache.normalize_message("  what's the PRICE of smartwatch x, please!")
+    assert response_cache.normalize_message("How much does the costume cost?") == "price does the costume price"
+    assert response_cache.normalize_message("is John's watch waterproof") != \
+        response_cache.normalize_message("is John is watch waterproof")
+    assert response_cache.cache_scope("how much is it?") is None
+    assert response_cache.cache_scope("What's your return policy?") is not None
+
+    metrics.reset()
+    with stubbed_apis(latency=0.05) as stubs:
+        first = gemini_handler.get_response("How much is the Smartwatch X?")
+        again = gemini_handler.get_response("how much is the smartwatch x")
+        assert first == again
+        assert stubs.gemini.calls['generateContent'] == 1
+
+        # Follow-ups depend on history and always go to Gemini
+        gemini_handler.get_response("how much is it?")
+        gemini_handler.get_response("how much is it?")
+        assert stubs.gemini.calls['generateContent'] == 3
+
+        # A catalog change invalidates cached answers
+        original_price = response_cache.PRODUCT_PRICES['Smartwatch X']
+        response_cache.PRODUCT_PRICES['Smartwatch X'] = original_price + 1
+        response_cache._response_cache._checked_at = 0
+        try:
+            gemini_handler.get_response("How much is the Smartwatch X?")
+        finally:
+            response_cache.PRODUCT_PRICES['Smartwatch X'] = original_price
+        assert stubs.gemini.calls['generateContent'] == 4
+
+    snapshot = metrics.snapshot()
+    print(f"📊 Hit rate: {snapshot['gauges']['response_cache.hit_rate']}, "
+          f"saved: {snapshot['counters']['response_cache.saved_ms']} ms")
+    assert metrics.get_counter('response_cache.hits') == 1
+    assert metrics.get_counter('response_cache.invalidations') == 1
+
+
+def test_semantic_cache_matches_paraphrases():
+    """Test paraphrase hits within a topic, topic isolation and bounded eviction"""
+    print("\n" + "="*60)
+    print("TEST 4: Semantic Response Cache")
+    print("="*60)
+
+    metrics.reset()
+    with stubbed_apis() as stubs:
+        gemini_handler.get_response("price of the smartwatch?")
+        gemini_handler.get_response("How much is Smartwatch X")
+        assert stubs.gemini.calls['generateContent'] == 1
+        assert metrics.get_counter('response_cache.semantic_hits') == 1
+
+        # Same wording, different product: never shares an answer
+        gemini_handler.get_response("price of the bluetooth speaker mini?")
+        assert stubs.gemini.calls['generateContent'] == 2
+
+        # Same product, different attribute: the product name doesn't make them alike
+        gemini_handler.get_response("wireless earbuds pro battery size")
+        gemini_handler.get_response("wireless earbuds pro battery life")
+        gemini_handler.get_response("does smartwatch x have nfc")
+        gemini_handler.get_response("does smartwatch x have gps")
+        assert stubs.gemini.calls['generateContent'] == 6
+        assert metrics.get_counter('response_cache.semantic_hits') == 1
+
+    cache = SemanticCache(max_entries=3, threshold=0.85, dim=256)
+    for i, question in enumerate(["return policy", "shipping time", "warranty length", "payment options"]):
+        cache.add(question, f"answer {i}", scope='faq')
+    print(f"📊 {len(cache)} entries, {cache.nbytes} bytes")
+    assert len(cache) == 3
+    assert cache.lookup("return policy", scope='faq') is None         # least recently used, evicted
+    answer, similarity = cache.lookup("payment option", scope='faq')
+    assert answer == "answer 3" and similarity >= 0.85
+    assert cache.lookup("payment options", scope='other') is None
+
+    # Close n-grams are not enough when the content words differ
+    cache = SemanticCache(threshold=0.5, dim=256)
+    cache.add("battery life", "lasts 8 hours", scope='Wireless Earbuds Pro')
+    assert cache.lookup("battery size", scope='Wireless Earbuds Pro') is None
+    assert cache.lookup("battery lifes", scope='Wireless Earbuds Pro')[0] == "lasts 8 hours"
+
+
+def test_prompt_prefix_caching():
+    """Test the cachedContents lifecycle: create, reuse, extend, replace and inline fallback"""
+    print("\n" + "="*60)
+    print("TEST 5: Prompt Prefix Caching")
+    print("="*60)
+
+    metrics.reset()
+    with stubbed_apis() as stubs:
+        gemini_handler.get_response("hi there, tell me something fun", user_id=None)
+        gemini_handler.get_response("recommend me a gift for my dad")
+        assert stubs.gemini.calls['cachedContents.create'] == 1
+
+        generate = [body for method, _, body in stubs.gemini.requests if method == 'generateContent']
+        assert all(body['cachedContent'] == 'cachedContents/stub-1' for body in generate)
+        sent_text = generate[-1]['contents'][0]['parts'][0]['text']
+        assert gemini_handler.get_static_prefix() not in sent_text
+        assert sent_text.endswith("User: recommend me a gift for my dad\n\nAlex:")
+
+        # Close to expiry: the TTL is extended, the handle is kept
+        prompt_cache.get_prompt_cache('stub', gemini_handler.GEMINI_MODEL)._expires_at = time.monotonic() + 1
+        gemini_handler.get_response("what should I buy for a camping trip")
+        assert stubs.gemini.calls['cachedContents.patch'] == 1
+        assert stubs.gemini.calls['cachedContents.create'] == 1
+
+        # Server-side expiry: the rejected handle is dropped and the prompt sent inline
+        stubs.gemini.expire_cached_contents()
+        reply = gemini_handler.get_response("recommend me a gift for my sister")
+        last = stubs.gemini.requests[-1][2]
+        assert reply == stubs.gemini.reply
+        assert 'cachedContent' not in last
+        assert last['contents'][0]['parts'][0]['text'].startswith(gemini_handler.get_static_prefix())
+        gemini_handler.get_response("recommend me a gift for my brother")
+        assert stubs.gemini.calls['cachedContents.create'] == 2
+
+        # An error that does not name the cachedContent is not retried inline
+        stubs.gemini.status_code = 400
+        try:
+            sent = stubs.gemini.calls['generateContent']
+            gemini_handler.get_response("recommend me a gift for my aunt")
+            assert stubs.gemini.calls['generateContent'] == sent + 1
+            assert stubs.gemini.requests[-1][2]['cachedContent'] == 'cachedContents/stub-2'
+        finally:
+            stubs.gemini.status_code = 200
+
+        # Prefix changed: a new cache replaces (and deletes) the old one
+        original_prefix = gemini_handler.get_static_prefix
+        gemini_handler.get_static_prefix = lambda: original_prefix() + "\n\nNew: free gift wrapping!"
+        try:
+            gemini_handler.get_response("recommend me a gift for my mom")
+        finally:
+            gemini_handler.get_static_prefix = original_prefix
+        assert stubs.gemini.calls['cachedContents.create'] == 3
+        assert stubs.gemini.calls['cachedContents.delete'] == 1
+        assert stubs.gemini.requests[-1][2]['cachedContent'] == 'cachedContents/stub-3'
+
+        # A prefix below the model's minimum cache size is sent inline without a create call
+        cache = prompt_cache.PromptPrefixCache()
+        assert cache.get_handle(stubs.gemini.base_url, 'stub', 'gemini-2.5-flash', "short prefix") is None
+        assert cache.get_handle(stubs.gemini.base_url, 'stub', 'gemini-2.5-flash', "short prefix") is None
+        assert stubs.gemini.calls['cachedContents.create'] == 3
+        assert prompt_cache.min_cache_tokens('gemini-2.5-pro') > prompt_cache.min_cache_tokens('gemini-2.5-flash')
+
+    # A slow create does not hold up other requests: they send the prefix inline meanwhile
+    started, release = threading.Event(), threading.Event()
+
+    class SlowCreate:
+        @staticmethod
+        def post(url, json, timeout):
+            started.set()
+            release.wait(5)
+            return type('Response', (), {'status_code': 200, 'json': lambda self: {'name': 'cachedContents/slow'}})()
+
+    original_requests, prompt_cache.requests = prompt_cache.requests, SlowCreate
+    try:
+        cache = prompt_cache.PromptPrefixCache()
+        prefix = gemini_handler.get_static_prefix()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            creating = pool.submit(cache.get_handle, 'http://unused', 'stub', 'gemini-2.5-flash', prefix)
+            assert started.wait(5)
+            waited = time.perf_counter()
+            assert cache.get_handle('http://unused', 'stub', 'gemini-2.5-flash', prefix) is None
+            assert time.perf_counter() - waited < 0.5
+            release.set()
+            assert creating.result(5) == 'cachedContents/slow'
+        assert cache.get_handle('http://unused', 'stub', 'gemini-2.5-flash', prefix) == 'cachedContents/slow'
+    finally:
+        prompt_cache.requests = original_requests
+        release.set()
+
+    print(f"📊 Gemini calls: {dict(stubs.gemini.calls)}")
+    print(f"📊 Cached prompt tokens: {metrics.get_counter('gemini.cached_tokens')}")
+    assert metrics.get_counter('gemini.cached_tokens') > 0
+    assert metrics.get_counter('gemini.prompt_cache.refreshes') == 1
+
+
+def test_history_fits_token_budget():
+    """Test newest-first history within a token budget, with the database as fallback"""
+    print("\n" + "="*60)
+    print("TEST 6: Token-Budgeted Conversation History")
+    print("="*60)
+
+    init_db()
+    user_id = 8_000_000_000 + int(time.time() * 1000) % 1_000_000_000
+    get_or_create_user(user_id, first_name="History")
+    memory = get_user_memory(user_id)
+    memory.add_user_message("tell me about the smartwatch x")
+    memory.add_ai_message("The Smartwatch X has " + "a long list of specs, " * 200)
+    memory.add_user_message("and the wireless earbuds pro?")
+    memory.add_ai_message("Great sound and 30h battery!")
+    assert len(memory.get_messages(limit=3)) == 3
+
+    # Evict the in-memory buffer: history is reloaded from the database
+    clear_user_memory(user_id)
+    metrics.reset()
+    history = build_history(user_id, budget=120)
+    print(history)
+
+    assert estimate_tokens(history) <= 120 + estimate_tokens("**Recent Conversation:**")
+    assert history.rstrip().endswith("Alex: Great sound and 30h battery!")
+    assert "User: and the wireless earbuds pro?" in history
+    assert "…" in history                                    # the long spec reply was cut
+    assert metrics.snapshot()['timings']['gemini.history_tokens']['count'] == 1
+
+    # Everything older than the budget allows is summarized
+    tight = build_history(user_id, budget=40)
+    assert tight.splitlines()[1].startswith("(Earlier:") and "Smartwatch X" in tight
+
+    with stubbed_apis() as stubs:
+        gemini_handler.get_response("which one is better for running?", user_id=user_id)
+        sent = stubs.gemini.requests[-1][2]['contents'][0]['parts'][0]['text']
+    assert "User: and the wireless earbuds pro?" in sent
+    print(f"📊 Prompt tokens sent: {metrics.snapshot()['timings']['gemini.prompt_tokens_sent']}")
+
+    # A slow history load for a new user does not hold up users already in memory
+    from api.database_memory import PersistentConversationMemory
+    loading, release = threading.Event(), threading.Event()
+    original_load = PersistentConversationMemory.load_from_db
+
+    def slow_load(self, limit=None):
+        loading.set()
+        release.wait(5)
+        return original_load(self, limit)
+
+    cached = get_user_memory(user_id)
+    PersistentConversationMemory.load_from_db = slow_load
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            newcomer = pool.submit(get_user_memory, user_id + 1)
+            assert loading.wait(5)
+            started = time.perf_counter()
+            assert get_user_memory(user_id) is cached
+            assert time.perf_counter() - started < 0.5
+            release.set()
+            assert newcomer.result(5) is get_user_memory(user_id + 1)
+    finally:
+        PersistentConversationMemory.load_from_db = original_load
+        release.set()
+        clear_user_memory(user_id + 1)
+
+
+def test_slo_hedges_to_fallback():
+    """Test that a slow Gemini call is answered by the fallback and cached when it lands"""
+    print("\n" + "="*60)
+    print("TEST 7: Latency SLO Hedging")
+    print("="*60)
+
+    metrics.reset()
+    original_slo, original_timeout = gemini_handler.GEMINI_SLO_SECONDS, gemini_handler.GEMINI_TIMEOUT_SECONDS
+    gemini_handler.GEMINI_SLO_SECONDS = 0.2
+    try:
+        with stubbed_apis(latency=0.6) as stubs:
+            started = time.perf_counter()
+            meta = {}
+            first = gemini_handler.get_response("what is your warranty policy?", meta=meta)
+            elapsed = time.perf_counter() - started
+            assert first != stubs.gemini.reply and elapsed < 0.5
+            assert metrics.get_counter('gemini.slo_hedges') == 1
+
+            # The late Gemini answer is kept for the next asker
+            deadline = time.time() + 5
+            while not metrics.get_counter('gemini.late_results') and time.time() < deadline:
+                time.sleep(0.05)
+            assert meta['tokens_used'] is None        # the late call didn't write into the fallback's meta
+            second = gemini_handler.get_response("What is your warranty policy")
+            assert second == stubs.gemini.reply
+            assert stubs.gemini.calls['generateContent'] == 1
+
+            # Fast replies are served from Gemini within the SLO
+            stubs.gemini.latency = 0
+            assert gemini_handler.get_response("recommend me a gift", meta=meta) == stubs.gemini.reply
+            assert meta['tokens_used']
+
+            # Without an SLO, a call that hits the request timeout gets the fallback too
+            gemini_handler.GEMINI_SLO_SECONDS, gemini_handler.GEMINI_TIMEOUT_SECONDS = 0, 0.2
+            stubs.gemini.latency = 0.6
+            timed_out = gemini_handler.get_response("what colors does the drone come in?")
+            assert timed_out and timed_out != stubs.gemini.reply
+            assert metrics.get_counter('gemini.timeouts') == 1
+            assert metrics.get_counter('gemini.slo_hedges') == 1
+    finally:
+        gemini_handler.GEMINI_SLO_SECONDS, gemini_handler.GEMINI_TIMEOUT_SECONDS = original_slo, original_timeout
+
+    reply_ms = metrics.snapshot()['timings']['gemini.reply_ms']
+    print(f"📊 Hedged in {elapsed * 1000:.0f} ms, reply latency: {reply_ms}")
+    assert metrics.get_counter('gemini.slo_met') == 1
+    assert reply_ms['count'] == 3
+
+
+def test_circuit_breaker_and_load_shedding():
+    """Test breaker open/half-open/closed transitions, shedding and the health report"""
+    print("\n" + "="*60)
+    print("TEST 8: Circuit Breaker and Load Shedding")
+    print("="*60)
+
+    from api import webhook
+
+    original = (gemini_handler._gemini_breaker, gemini_handler._gemini_limiter)
+    breaker = circuit_breaker.CircuitBreaker('gemini', window=4, min_calls=2, open_seconds=0.3)
+    limiter = circuit_breaker.AdaptiveLimiter('gemini', max_limit=4)
+    gemini_handler._gemini_breaker, gemini_handler._gemini_limiter = breaker, limiter
+    metrics.reset()
+    try:
+        with stubbed_apis() as stubs:
+            # Bad requests, 429s and exhausted quota are not Gemini failing: the breaker stays closed
+            stubs.gemini.status_code = 400
+            gemini_handler.get_response("recommend me a gift", user_id=None)
+            gemini_handler.get_response("recommend me a gift", user_id=None)
+            stubs.gemini.status_code = 200
+            stubs.gemini.rate_limited_keys.add('stub')
+            for _ in range(3):    # a 429, then no key with quota left
+                assert gemini_handler.get_response("recommend me a gift", user_id=None)
+            assert breaker.state == circuit_breaker.CLOSED and breaker.status()['window_calls'] == 0
+            assert limiter.status()['in_flight'] == 0
+
+        with stubbed_apis() as stubs:
+            # Errors open the breaker; further updates skip Gemini entirely
+            stubs.gemini.status_code = 500
+            gemini_handler.get_response("recommend me a gift", user_id=None)
+            gemini_handler.get_response("recommend me a gift", user_id=None)
+            assert breaker.state == circuit_breaker.OPEN
+            reply = gemini_handler.get_response("recommend me a gift", user_id=None)
+            assert reply and stubs.gemini.calls['generateContent'] == 2
+            assert metrics.get_counter('gemini.breaker_rejected') == 1
+
+            health = webhook.app.test_client().get('/admin/health').get_json()
+            print(f"📊 Health: {health['status']} {health['dependencies']['gemini']['breaker']['state']}")
+            assert health['status'] == 'degraded'
+            assert health['dependencies']['gemini']['breaker']['state'] == 'open'
+
+            # After the cool-down one probe goes through and closes the breaker
+            stubs.gemini.status_code = 200
+            time.sleep(0.35)
+            assert gemini_handler.get_response("recommend me a gift") == stubs.gemini.reply
+            assert breaker.state == circuit_breaker.CLOSED
+
+            # In-flight calls at the limit: new calls are shed to the fallback
+            slots = [limiter.try_acquire() for _ in range(limiter.limit)]
+            calls_before = stubs.gemini.calls['generateContent']
+            reply = gemini_handler.get_response("recommend me some headphones")
+            for _ in slots:
+                limiter.release()
+            assert reply != stubs.gemini.reply
+            assert stubs.gemini.calls['generateContent'] == calls_before
+            assert metrics.get_counter('gemini.shed') == 1
+
+        health = webhook.app.test_client().get('/admin/health').get_json()
+        transitions = [t['to'] for t in health['dependencies']['gemini']['breaker']['transitions']]
+        print(f"📊 Transitions: {transitions}, load: {health['dependencies']['gemini']['load']}")
+        assert transitions == ['open', 'half_open', 'closed']
+        assert health['status'] == 'healthy'
+        assert health['dependencies']['gemini']['load']['shed'] == 1
+    finally:
+        gemini_handler._gemini_breaker, gemini_handler._gemini_limiter = original
+        circuit_breaker._breakers['gemini'], circuit_breaker._limiters['gemini'] = original
+
+    # With the default settings, thinking-length replies (several seconds) are not "slow"
+    default_breaker, default_limiter = original
+    assert default_breaker.slow_call_ms > 10_000 and default_limiter.target_ms > 10_000
+    breaker = circuit_breaker.CircuitBreaker('gemini-thinking', window=4, min_calls=2,
+                                             slow_call_ms=default_breaker.slow_call_ms)
+    limiter = circuit_breaker.AdaptiveLimiter('gemini-thinking', max_limit=4, target_ms=default_limiter.target_ms)
+    for _ in range(6):
+        assert limiter.try_acquire()
+        latency_ms = 8_000
+        limiter.release(latency_ms)
+        breaker.record(True, latency_ms)
+    assert breaker.state == circuit_breaker.CLOSED and limiter.limit == 4
+
+
+def test_intent_router_answers_catalog_questions():
+    """Test that deterministic intents are answered locally and open-ended ones reach Gemini"""
+    print("\n" + "="*60)
+    print("TEST 9: Local Intent Router")
+    print("="*60)
+
+    assert intent_router.classify_intent("How much is the Smartwatch X?") == ('price', 'Smartwatch X')
+    assert intent_router.classify_intent("smartwatch x specs") == ('specs', 'Smartwatch X')
+    assert intent_router.classify_intent("show all products")[0] == 'catalog'
+    assert intent_router.classify_intent("what's your cheapest audio product")[0] == 'cheapest'
+    assert intent_router.classify_intent("any audio bundle deals?")[0] == 'bundle'
+    assert intent_router.classify_intent("what's in my cart")[0] == 'cart'
+    assert intent_router.classify_intent("is the smartwatch x worth the price?")[0] is None
+    assert intent_router.classify_intent("which is better for running, smartwatch x or a band?")[0] is None
+
+    metrics.reset()
+    with stubbed_apis(route_intents=True) as stubs:
+        price = gemini_handler.get_response("How much is the Smartwatch X?")
+        specs = gemini_handler.get_response_stream("Smartwatch X specs")
+        gemini_handler.get_response("show all products")
+        assert stubs.gemini.calls['generateContent'] == 0
+        assert stubs.gemini.calls['streamGenerateContent'] == 0
+        assert "$59" in price and "Smartwatch X" in specs
+
+        reply = gemini_handler.get_response("which is better for running, smartwatch x or a band?")
+        assert reply == stubs.gemini.reply
+
+    snapshot = metrics.snapshot()
+    print(f"📊 Handled locally: {snapshot['gauges']['router.handled_share']:.0%}, "
+          f"p50 {snapshot['timings']['router.reply_ms']['p50_ms']} ms")
+    assert metrics.get_counter('router.handled') == 3
+    assert metrics.get_counter('router.intent.price') == 1
+    assert snapshot['gauges']['router.handled_share'] == 0.75
+
+
+
+def test_key_pool_spreads_quota():
+    """Test key rotation by quota headroom, 429 failover, utilisation reporting and the lite tier"""
+    print("\n" + "="*60)
+    print("TEST 10: Gemini Key and Model Pool")
+    print("="*60)
+
+    from api import webhook
+
+    keys = ['key-one-1111', 'key-two-2222']
+    metrics.reset()
+    with stubbed_apis() as stubs:
+        gemini_handler.GOOGLE_API_KEYS = keys
+        for i in range(4):
+            gemini_handler.get_response(f"recommend me a gift for my friend number {i}")
+        print(f"📊 Calls per key: {dict(stubs.gemini.keys)}")
+        assert stubs.gemini.keys == {keys[0]: 2, keys[1]: 2}
+
+        # A 429 rests that key for its retryDelay and the call moves to the other key
+        stubs.gemini.rate_limited_keys.add(keys[0])
+        for i in range(3):
+            assert gemini_handler.get_response(f"recommend me a gift for my cousin number {i}") == stubs.gemini.reply
+        assert stubs.gemini.keys[keys[0]] == 3
+        assert stubs.gemini.keys[keys[1]] == 5
+        assert metrics.get_counter('gemini.pool.rate_limited') == 1
+
+        client = webhook.app.test_client()
+        assert 'gemini_keys' not in client.get('/admin/health').get_json()    # the public check shows no keys
+        admin_key = os.getenv('ADMIN_API_KEY', 'change-me-in-production')
+        assert client.get('/admin/metrics').status_code == 401
+        usage = client.get('/admin/metrics', headers={'X-Admin-Key': admin_key}).get_json()['gemini_keys']['gemini']
+        print(f"📊 Key utilisation: {usage}")
+        first = usage[f"{gemini_handler.GEMINI_MODEL}/…1111"]
+        second = usage[f"{gemini_handler.GEMINI_MODEL}/…2222"]
+        assert first['cooling_down_seconds'] > 25 and second['requests'] == 5
+        assert second['tokens'] > 5 * 900
+
+        # Short small-talk turns go to the lite model when one is configured
+        stubs.gemini.rate_limited_keys.clear()
+        original_lite = gemini_pool.GEMINI_LITE_MODEL
+        gemini_pool.GEMINI_LITE_MODEL = 'gemini-2.5-flash-lite'
+        try:
+            gemini_handler.get_response("hi there!")
+            gemini_handler.get_response("which one is better for running, the band or the watch?")
+        finally:
+            gemini_pool.GEMINI_LITE_MODEL = original_lite
+        print(f"📊 Calls per model: {dict(stubs.gemini.models)}")
+        assert stubs.gemini.models['gemini-2.5-flash-lite'] == 1
+
+
+
+def test_async_client_shares_connections():
+    """Test that concurrent calls share the event loop and keep-alive pool, and can be cancelled"""
+    print("\n" + "="*60)
+    print("TEST 11: Async Pooled Gemini Client")
+    print("="*60)
+
+    if gemini_handler._async_client is None:
+        print("⚠️ httpx not installed - skipping")
+        return
+
+    metrics.reset()
+    with stubbed_apis(latency=0.3) as stubs:
+        gemini_handler.get_response("recommend me a gift for my aunt")  # creates the prefix cache
+        connections = stubs.gemini.connections
+
+        # Eight concurrent calls overlap on the one event loop thread
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as callers:
+            replies = list(callers.map(gemini_handler.get_response,
+                                       [f"recommend me a gift for my neighbour number {i}" for i in range(8)]))
+        elapsed = time.perf_counter() - started
+        print(f"📊 8 concurrent calls in {elapsed:.2f}s, {stubs.gemini.connections - connections} new connections")
+        assert replies == [stubs.gemini.reply] * 8
+        assert elapsed < 1.2
+        assert not any(thread.name.startswith('gemini_') for thread in threading.enumerate())
+
+        # Sequential calls reuse pooled connections
+        connections = stubs.gemini.connections
+        for i in range(3):
+            gemini_handler.get_response(f"recommend me a gift for my teacher number {i}")
+        assert stubs.gemini.connections == connections
+
+        # Cancelling a call frees its in-flight slot straight away
+        stubs.gemini.latency = 2
+        assert gemini_handler._admit()
+        future = gemini_handler._submit_generate("recommend me a gift for my boss")
+        time.sleep(0.2)
+        assert future.cancel()
+        deadline = time.time() + 2
+        while gemini_handler._gemini_limiter.in_flight and time.time() < deadline:
+            time.sleep(0.02)
+        assert gemini_handler._gemini_limiter.in_flight == 0
+        assert metrics.get_counter('gemini.client.cancelled') == 1
+
+
+
+def test_generation_profiles_by_intent():
+    """Test per-intent token caps and thinking budgets, and tokens_used reaching the message history"""
+    print("\n" + "="*60)
+    print("TEST 12: Generation Profiles by Intent")
+    print("="*60)
+
+    assert choose_profile("thanks!") == 'smalltalk'
+    assert choose_profile("how much is it") == 'lookup'
+    assert choose_profile("which one would make a better gift?") == 'recommendation'
+    assert choose_profile("I run marathons every weekend") == 'default'
+
+    init_db()
+    user_id = 8_000_000_000 + int(time.time() * 1000 + 7) % 1_000_000_000
+    get_or_create_user(user_id, first_name="Profiles")
+    metrics.reset()
+    with stubbed_apis() as stubs:
+        meta = {}
+        reply = gemini_handler.get_response("thanks!", user_id=user_id, meta=meta)
+        config = stubs.gemini.requests[-1][2]['generationConfig']
+        assert config['maxOutputTokens'] == 160 and config['thinkingConfig'] == {'thinkingBudget': 0}
+        assert meta == {'profile': 'smalltalk', 'tokens_used': 900 + len(reply) // 4}
+        smalltalk_tokens = meta['tokens_used']
+        get_user_memory(user_id).add_ai_message(reply, tokens_used=smalltalk_tokens)
+
+        gemini_handler.get_response_stream("which one would make a better gift?", meta=meta)
+        config = stubs.gemini.requests[-1][2]['generationConfig']
+        assert config['maxOutputTokens'] == 1024 and config['thinkingConfig'] == {'thinkingBudget': 512}
+        assert meta['profile'] == 'recommendation' and meta['tokens_used'] > 900
+
+    session = get_session()
+    try:
+        saved = session.query(ChatMessageHistory).filter(ChatMessageHistory.user_id == user_id).one()
+        assert saved.role == 'assistant' and saved.tokens_used == smalltalk_tokens
+    finally:
+        session.close()
+    output = metrics.snapshot()['timings']['gemini.output_tokens.smalltalk']
+    print(f"📊 Smalltalk output tokens: {output}, saved tokens_used={saved.tokens_used}")
+    assert output['count'] == 1
+
+
+
+def test_structured_output_drives_product_media():
+    """Test JSON-schema replies, the malformed-JSON fallback parser and product media from the model's output"""
+    print("\n" + "="*60)
+    print("TEST 13: Structured Output Mode")
+    print("="*60)
+
+    from api import webhook
+
+    parse = structured_output.parse_structured_reply
+    assert parse('{"reply": "Hi!", "product": "smartwatch x", "intent": "price"}') == \
+        {'reply': 'Hi!', 'product': 'Smartwatch X', 'intent': 'price'}
+    assert parse('```json\n{"reply": "Try the \\"Band\\"", "product": "Fitness Tracker Band",}\n```')['reply'] == \
+        'Try the "Band"'
+    assert parse('{"reply": "The Smartwatch X is gre')['reply'] == "The Smartwatch X is gre"
+    assert parse('Just plain text') == {'reply': 'Just plain text', 'product': None, 'intent': 'other'}
+    assert parse('{"product": "Smartwatch X"}') is None
+
+    original = (structured_output.GEMINI_STRUCTURED_OUTPUT, webhook.TELEGRAM_TOKEN)
+    structured_output.GEMINI_STRUCTURED_OUTPUT, webhook.TELEGRAM_TOKEN = True, 'stub'
+    metrics.reset()
+    try:
+        answer = "For morning jogs I'd go with the Fitness Tracker Band - light and waterproof! 🏃"
+        reply = ('{"reply": "%s", "product": "Fitness Tracker Band", "intent": "recommend"}' % answer)
+        with stubbed_apis(reply=reply) as stubs:
+            meta = {}
+            assert gemini_handler.get_response("what would you suggest for my morning jog?", meta=meta) == answer
+            assert meta['product'] == 'Fitness Tracker Band' and meta['intent'] == 'recommend'
+            config = stubs.gemini.requests[-1][2]['generationConfig']
+            assert config['responseMimeType'] == 'application/json'
+            assert 'Fitness Tracker Band' in config['responseSchema']['properties']['product']['enum']
+
+            # The webhook attaches the product's media and buttons without detecting it in the user's text
+            update = {'update_id': int(time.time() * 1000), 'message': {
+                'message_id': 1, 'chat': {'id': 4242}, 'from': {'id': 4242, 'first_name': 'Jog'},
+                'text': "any ideas for my morning jog?"}}
+            webhook.app.test_client().post('/webhook', json=update)
+            print(f"📊 Outbound calls: {dict(stubs.bot.calls)}")
+            assert stubs.bot.calls['sendMediaGroup'] == 1
+            assert stubs.bot.calls['sendMessage'] == 1
+    finally:
+        structured_output.GEMINI_STRUCTURED_OUTPUT, webhook.TELEGRAM_TOKEN = original
+    assert metrics.get_counter('gemini.structured.parsed') == 2
+
+
+def test_product_retrieval_filters_catalog():
+    """Test top-k product retrieval from the message and history, and the catalog-free prompt it builds"""
+    print("\n" + "="*60)
+    print("TEST 14: Relevance-Filtered Product Context")
+    print("="*60)
+
+    index = product_retrieval.get_product_index()
+    assert index.search("do you have earbuds for running?", 3)[0] == 'Wireless Earbuds Pro'
+    assert index.search("vr", 3) == ['VR Headset Max']
+    assert all(PRODUCT_PRICES[name] <= 50 for name in index.search("a gift under $50", 5))
+    assert index.search("hello there", 3) == []
+
+    # A product added to the catalog is found without a restart
+    PRODUCT_PRICES['Retro Turntable'] = 149
+    PRODUCT_SPECS['Retro Turntable'] = "Belt-driven vinyl turntable with built-in speakers."
+    try:
+        assert product_retrieval.get_product_index().search("vinyl record player", 3)[0] == 'Retro Turntable'
+    finally:
+        del PRODUCT_PRICES['Retro Turntable'], PRODUCT_SPECS['Retro Turntable']
+
+    init_db()
+    user_id = 8_000_000_000 + int(time.time() * 1000) % 1_000_000_000 + 14
+    get_or_create_user(user_id, first_name="Retrieval")
+    get_user_memory(user_id).add_user_message("I'm looking for a drone for aerial photos")
+
+    original = product_retrieval.PRODUCT_RETRIEVAL
+    product_retrieval.PRODUCT_RETRIEVAL = True
+    metrics.reset()
+    try:
+        with stubbed_apis() as stubs:
+            gemini_handler.get_response("and a solar charger to keep it flying?", user_id=user_id)
+            sent = stubs.gemini.requests[-1][2]['contents'][0]['parts'][0]['text']
+            full = gemini_handler.get_static_prefix()
+    finally:
+        product_retrieval.PRODUCT_RETRIEVAL = original
+    print(sent[sent.index("**Relevant Products:**"):])
+
+    products = sent.split("**Relevant Products:**\n")[1].split("\n(Showing")[0].splitlines()
+    assert len(products) <= product_retrieval.PRODUCT_RETRIEVAL_TOP_K
+    assert "**Portable Solar Charger**" in products[0]
+    assert any("**Mini Drone X2**" in line for line in products)        # from the earlier turn
+    assert "**VR Headset Max**" not in sent and "Available Products:" not in sent
+    assert estimate_tokens(sent) < estimate_tokens(full)
+    assert metrics.snapshot()['timings']['retrieval.products']['count'] == 1
+
+
+def test_compiled_catalog_encoding():
+    """Test the compact catalog table, its hash-keyed cache and the token report"""
+    print("\n" + "="*60)
+    print("TEST 15: Compiled Catalog Encoding")
+    print("="*60)
+
+    assert catalog_encoding.compact_spec("Tracks steps, sleep, and heart rate with a bright OLED display "
+                                         "and 5-day battery.") == "Tracks steps, sleep, heart rate; bright OLED display, 5d battery"
+    digest = catalog_encoding.catalog_hash(PRODUCT_PRICES, PRODUCT_SPECS)
+    assert catalog_encoding.catalog_hash(dict(PRODUCT_PRICES, **{'Smartwatch X': 49}), PRODUCT_SPECS) != digest
+
+    report = catalog_encoding.token_report()
+    print(f"📊 Catalog tokens per call: {report}")
+    assert report['compiled_tokens'] < report['text_tokens'] and report['hash'] == digest
+
+    original = (catalog_encoding.COMPILED_CATALOG_PATH, catalog_encoding.PROMPT_CATALOG_FORMAT)
+    with tempfile.TemporaryDirectory() as folder:
+        catalog_encoding.COMPILED_CATALOG_PATH = os.path.join(folder, 'products_compiled.txt')
+        catalog_encoding.PROMPT_CATALOG_FORMAT = 'compiled'
+        catalog_encoding._compiled.clear()
+        try:
+            # No build output yet: compiled in memory, then served from the cache
+            table = catalog_encoding.get_compiled_catalog()
+            assert len(table.splitlines()) == len(PRODUCT_PRICES) + 1
+            assert "Smartwatch X|$59|" in table
+
+            catalog_encoding.compile_catalog()
+            assert catalog_encoding.is_current()
+            with open(catalog_encoding.COMPILED_CATALOG_PATH, 'a', encoding='utf-8') as f:
+                f.write("Hand Edit|$1|only in the file\n")
+            catalog_encoding._compiled.clear()
+            assert "Hand Edit" in catalog_encoding.get_compiled_catalog()    # hash matches: the file is used
+
+            # A price change makes the file stale
+            PRODUCT_PRICES['Smartwatch X'] += 10
+            try:
+                assert not catalog_encoding.is_current()
+                assert "Smartwatch X|$69|" in catalog_encoding.get_compiled_catalog()
+            finally:
+                PRODUCT_PRICES['Smartwatch X'] -= 10
+
+            # The table replaces products.txt in the cached prompt prefix
+            with stubbed_apis() as stubs:
+                gemini_handler.get_response("what's good for a beach holiday?")
+                cached = [body for method, _, body in stubs.gemini.requests if method == 'cachedContents.create']
+                prefix = cached[-1]['systemInstruction']['parts'][0]['text']
+            assert "Products (name|price|specs):" in prefix and "Available Products:" not in prefix
+        finally:
+            catalog_encoding.COMPILED_CATALOG_PATH, catalog_encoding.PROMPT_CATALOG_FORMAT = original
+            catalog_encoding._compiled.clear()
+
+
+def test_message_analysis_single_pass():
+    """Test that one scan finds every keyword (overlapping and nested) and is shared by all detectors"""
+    print("\n" + "="*60)
+    print("TEST 16: Single-Pass Message Analysis")
+    print("="*60)
+
+    message_analysis.register_keywords(['smart home', 'home hub', 'hub', 'hi'])
+    analysis = message_analysis.analyze_message("Is the Smart Home Hub worth it? This or the thermostat")
+    print(analysis)
+    assert {'smart home', 'home hub', 'hub', 'hi', 'thermostat'} <= analysis.hits    # 'hi' inside "this"
+    assert analysis.has('smart home') and not analysis.has('bundle')
+    assert analysis.has('worth it') and 'worth it' not in message_analysis._vocabulary   # answered by a substring search
+    assert analysis.found(['hub', 'drone', 'or the']) == {'hub', 'or the'}
+    assert 'home hub worth' in analysis.ngrams and analysis.tokens[:2] == ('is', 'the')
+
+    # Longest product keyword wins, as before
+    assert detect_product("the fitness band pro or the fitness band?") == 'Fitness Band Pro'
+    assert detect_product("cheapest fitness band") is None
+
+    # Every detector handling one update reuses the same analysis
+    message_analysis._analyze.cache_clear()
+    text = "I'm not sure about the smartwatch x price, it's urgent"
+    assert detect_emotion(text) == 'urgency'
+    assert intent_router.classify_intent(text) == ('price', 'Smartwatch X')
+    choose_profile(text)
+    get_fallback_response(text)
+    assert message_analysis.analyze_message(text) is message_analysis.analyze_message(text)
+    info = message_analysis._analyze.cache_info()
+    print(f"📊 Analysis cache: {info}")
+    assert info.misses == 1 and info.hits >= 4
+
+
+def test_keyword_automaton_boundaries():
+    """Test word-boundary modes, longest-match priority and the rebuild when the catalog gains keywords"""
+    print("\n" + "="*60)
+    print("TEST 17: Keyword Automaton")
+    print("="*60)
+
+    automaton = KeywordAutomaton(['smart home', 'smart home hub', 'home hub', 'hub', 'led', 'earbud', 'now'])
+    print(f"📊 {len(automaton)} keywords, {automaton.states} states")
+    found = automaton.scan("smart home hubs cancelled now")
+    assert set(found) == {'smart home', 'smart home hub', 'home hub', 'hub', 'led', 'now'}
+    assert found['led'] == 1 and found['hub'] == 1 | 2 and found['now'] == 1 | 2 | 4
+    assert automaton.longest("the smart home hub and earbuds", WORD_START) == [(4, 'smart home hub'), (23, 'earbud')]
+    assert automaton.longest("the smart home hub and earbuds", WHOLE_WORD) == [(4, 'smart home hub')]
+
+    # Products match at the start of a word, emotions only as whole words
+    assert detect_product("I cancelled my order") is None
+    assert detect_product("got any earbuds?") == 'Wireless Earbuds Pro'
+    assert detect_emotion("do you know the price") is None      # not "now"
+    assert detect_emotion("I made a choice") is None            # not "mad"
+    assert detect_emotion("I am mad") == 'frustration'
+
+    # The catalog gaining a keyword rebuilds the automaton once
+    metrics.reset()
+    PRODUCT_KEYWORDS['zephyr lamp'] = 'Smart Home Hub'
+    try:
+        assert detect_product("do you sell the zephyr lamp") == 'Smart Home Hub'
+        rebuilt = message_analysis.get_automaton()
+        assert 'zephyr lamp' in rebuilt.keywords and message_analysis.get_automaton() is rebuilt
+        assert metrics.get_counter('message_analysis.unregistered') == 0
+    finally:
+        del PRODUCT_KEYWORDS['zephyr lamp']
+
+    # A list registered after a message was scanned is still answered for that message
+    analysis = message_analysis.analyze_message("any quasar dock in stock?")
+    late = ['quasar dock', 'nebula mount']
+    message_analysis.register_keywords(late)
+    assert analysis.has_any(late) and analysis.found(late) == {'quasar dock'}
+    assert metrics.get_counter('message_analysis.unregistered') > 0
+    fresh = message_analysis.analyze_message("a nebula mount, please")
+    assert fresh.found(late) == {'nebula mount'}
+
+    # The webhook's own triggers are declared and registered like the rest
+    from api import webhook
+    metrics.reset()
+    assert message_analysis.analyze_message("anything on a budget?").has_any(webhook.CHEAP_WORDS)
+    assert metrics.get_counter('message_analysis.unregistered') == 0
+
+
+if __name__ == "__main__":
+    print("\n🧪 TESTING GEMINI RESPONSE PIPELINE")
+    print("="*60)
+
+    test_streaming_progressive_edits()
+    test_streaming_falls_back_when_broken()
+    test_response_cache()
+    test_semantic_cache_matches_paraphrases()
+    test_prompt_prefix_caching()
+    test_history_fits_token_budget()
+    test_slo_hedges_to_fallback()
+    test_circuit_breaker_and_load_shedding()
+    test_intent_router_answers_catalog_questions()
+    test_key_pool_spreads_quota()
+    test_async_client_shares_connections()
+    test_generation_profiles_by_intent()
+    test_structured_output_drives_product_media()
+    test_product_retrieval_filters_catalog()
+    test_compiled_catalog_encoding()
+    test_message_analysis_single_pass()
+    test_keyword_automaton_boundaries()
+
+    print("\n" + "="*60)
+    print("✅ ALL TESTS COMPLETED!")
+    print("="*60 + "\n")